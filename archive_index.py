@@ -0,0 +1,112 @@
+from array import array
+
+from archive_listing import FLAG_DIR
+
+ROOT = 0
+
+
+class ArchiveIndex:
+    """Folder tree of an ArchiveListing, kept in flat arrays rather than one object per entry.
+
+    Every file and folder is a node numbered from 1 (0 is the root). A node
+    stores an interned name id, its parent node, the number of its listing
+    entry (-1 for folders that only exist implicitly in member paths) and a
+    folder flag; node_of maps listing entries back to their nodes. Each
+    folder keeps an array of its child nodes in listing order; sorting them
+    is left to whoever displays the folder.
+
+    The listing may still be growing on another thread: update() takes the
+    number of entries known to be complete and indexes only those.
+    """
+
+    def __init__(self, listing, limit=None):
+        self.listing = listing
+        self.names = ['']
+        self._name_ids = {'': 0}
+        self.name_id = array('l', [0])
+        self.parent = array('l', [-1])
+        self.entry = array('l', [-1])
+        self.is_dir = bytearray(b'\x01')
+        self.node_of = array('l')
+        self.children = {ROOT: array('l')}
+        self._folders = {'': ROOT}
+        self.indexed = 0
+        self.update(limit)
+
+    def __len__(self):
+        """Number of nodes, not counting the root"""
+        return len(self.parent) - 1
+
+    def update(self, limit=None):
+        """Index the listing entries appended since the last call, up to entry number limit"""
+        listing = self.listing
+        names = listing.names
+        flags = listing.flags
+        folders = self._folders
+        node_of = self.node_of
+        end = len(names) if limit is None else limit
+        for index in range(self.indexed, end):
+            path = names[index].replace('\\', '/').rstrip('/')
+            if not path:
+                node_of.append(-1)
+                continue
+            if flags[index] & FLAG_DIR:
+                node = self._folder(path)
+                self.entry[node] = index
+            else:
+                parent_path, _, name = path.rpartition('/')
+                parent = folders.get(parent_path)
+                if parent is None:
+                    parent = self._folder(parent_path)
+                node = self._add_node(parent, name, False, index)
+            node_of.append(node)
+        self.indexed = max(self.indexed, end)
+
+    def _intern(self, name):
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            name_id = len(self.names)
+            self.names.append(name)
+            self._name_ids[name] = name_id
+        return name_id
+
+    def _add_node(self, parent, name, is_dir, entry_index):
+        node = len(self.parent)
+        self.name_id.append(self._intern(name))
+        self.parent.append(parent)
+        self.entry.append(entry_index)
+        self.is_dir.append(is_dir)
+        self.children[parent].append(node)
+        if is_dir:
+            self.children[node] = array('l')
+        return node
+
+    def _folder(self, path):
+        """Return the node of the folder at path, creating it and any missing parents"""
+        folders = self._folders
+        missing = []
+        while path not in folders:
+            missing.append(path)
+            path = path.rpartition('/')[0]
+        node = folders[path]
+        for path in reversed(missing):
+            node = self._add_node(node, path.rpartition('/')[2], True, -1)
+            folders[path] = node
+        return node
+
+    def name(self, node):
+        return self.names[self.name_id[node]]
+
+    def path(self, node):
+        """Return the archive path of node, with a trailing '/' for folders"""
+        parts = []
+        current = node
+        while current != ROOT:
+            parts.append(self.names[self.name_id[current]])
+            current = self.parent[current]
+        path = '/'.join(reversed(parts))
+        return path + '/' if self.is_dir[node] else path
+
+    def has_children(self, node):
+        children = self.children.get(node)
+        return bool(children)
@@ -0,0 +1,78 @@
+from array import array
+
+FLAG_DIR = 1
+FLAG_ENCRYPTED = 2
+
+_NUMERIC_COLUMNS = ('size', 'compressed_size', 'mtime', 'flags', 'offset')
+
+
+class ArchiveListing:
+    """Archive entries stored column-wise: a table of member names plus one typed array per field.
+
+    An entry costs 33 bytes besides its name, where a dict per entry costs
+    several hundred, and the whole listing crosses threads as one reference.
+    Entry i is names[i], size[i], compressed_size[i], mtime[i] (seconds since
+    the epoch, 0 when unknown), flags[i] (FLAG_DIR, FLAG_ENCRYPTED) and
+    offset[i], where its header starts in the archive (in the uncompressed
+    stream for tarballs), or -1 when unknown.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.size = array('q')
+        self.compressed_size = array('q')
+        self.mtime = array('d')
+        self.flags = bytearray()
+        self.offset = array('q')
+
+    def __len__(self):
+        return len(self.names)
+
+    def append(self, name, size, compressed_size, is_dir, mtime=0.0, encrypted=False, offset=-1):
+        self.names.append(name)
+        self.size.append(size or 0)
+        self.compressed_size.append(compressed_size or 0)
+        self.mtime.append(mtime or 0.0)
+        self.offset.append(offset)
+        self.flags.append((FLAG_DIR if is_dir else 0) | (FLAG_ENCRYPTED if encrypted else 0))
+
+    def is_dir(self, i):
+        return bool(self.flags[i] & FLAG_DIR)
+
+    def is_encrypted(self, i):
+        return bool(self.flags[i] & FLAG_ENCRYPTED)
+
+    def total_size(self):
+        return sum(self.size)
+
+    def column(self, name):
+        """Return a numeric column, as a zero-copy NumPy array when NumPy is installed.
+
+        The NumPy array shares memory with the listing, which cannot grow
+        while such an array is alive.
+        """
+        if name not in _NUMERIC_COLUMNS:
+            raise Exception(f"Unknown listing column: {name}")
+        values = getattr(self, name)
+        try:
+            import numpy
+        except ImportError:
+            return values
+        return numpy.frombuffer(values, dtype=numpy.dtype(values.typecode) if name != 'flags' else numpy.uint8)
+
+    def order_by(self, name, indexes, reverse=False):
+        """Return indexes (entry numbers) sorted by a numeric column, keeping ties in their given order"""
+        try:
+            import numpy
+        except ImportError:
+            values = getattr(self, name)
+            return sorted(indexes, key=values.__getitem__, reverse=reverse)
+        indexes = numpy.asarray(indexes, dtype=numpy.int64)
+        # Sort a copy: a view would stop a listing that is still being read
+        # from growing.
+        values = getattr(self, name)[:]
+        keys = numpy.frombuffer(values, dtype=numpy.dtype(values.typecode) if name != 'flags' else numpy.uint8)[indexes]
+        if reverse:
+            # Negating keeps the sort stable, unlike reversing an ascending one.
+            keys = -keys.astype(numpy.float64)
+        return indexes[numpy.argsort(keys, kind='stable')].tolist()
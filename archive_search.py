@@ -0,0 +1,339 @@
+import os
+import re
+import threading
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+
+from cancellation import check_cancelled
+
+# A literal that occurs on more than this share of the lines is looked for
+# line by line instead of occurrence by occurrence.
+DENSE_MATCH_SHARE = 8
+# Shortest literal the trigram index can look up.
+TRIGRAM_LENGTH = 3
+# Hex digits following \x, \u and \U in a regex.
+_ESCAPE_DIGITS = {'x': 2, 'u': 4, 'U': 8}
+
+
+def parse_query(text):
+    """Return ('regex', pattern), ('glob', pattern) or ('substring', text) for what was typed in the search box"""
+    if text.startswith('re:'):
+        return 'regex', text[3:]
+    if any(c in text for c in '*?['):
+        return 'glob', text
+    return 'substring', text
+
+
+def glob_to_regex(glob):
+    """Translate a glob to a regex over one path per line.
+
+    A glob without '/' matches member names in any folder; one with '/'
+    matches whole paths. * and ? stay within a folder, ** crosses folders.
+    """
+    out = []
+    i = 0
+    while i < len(glob):
+        c = glob[i]
+        if glob.startswith('**', i):
+            out.append('[^\n]*')
+            i += 2
+            continue
+        if c == '*':
+            out.append('[^/\n]*')
+        elif c == '?':
+            out.append('[^/\n]')
+        elif c == '[' and glob.find(']', i + 2) >= 0:
+            end = glob.find(']', i + 2)
+            body = glob[i + 1:end].replace('\\', '\\\\')
+            if body.startswith(('!', '^')):
+                out.append('[^/\n' + body[1:] + ']')
+            else:
+                out.append('[' + body + ']')
+            i = end + 1
+            continue
+        else:
+            out.append(re.escape(c))
+        i += 1
+    anchor = '^' if '/' in glob else '(?:^|/)'
+    return anchor + ''.join(out) + '$'
+
+
+def _glob_literal(glob):
+    """Return the longest piece of a glob without wildcards"""
+    return max(re.split(r'\*|\?|\[[^]]+\]', glob), key=len)
+
+
+def _regex_literal(pattern):
+    """Return the longest run of plain characters that every match of a compiled regex contains, or ''.
+
+    Only the top level of the pattern is looked at, and a pattern with
+    alternatives anywhere has no such run.
+    """
+    regex = pattern.pattern
+    if '|' in regex or pattern.flags & re.VERBOSE:
+        return ''
+    runs = [[]]
+    depth = 0
+    i = 0
+    while i < len(regex):
+        c = regex[i]
+        if c == '\\' and i + 1 < len(regex):
+            if regex[i + 1].isalnum():
+                # A class such as \d, an anchor such as \b, or a character
+                # code such as \x41 whose digits are not literal text.
+                i = _escape_end(regex, i)
+                runs.append([])
+                continue
+            i += 2
+            c = regex[i - 1]
+        elif c in '*?{':
+            # The character before is optional or repeated a set number of times.
+            if runs[-1]:
+                runs[-1].pop()
+            runs.append([])
+            i = regex.find('}', i) + 1 if c == '{' else i + 1
+            if i == 0:
+                return ''
+            continue
+        elif c in '+.^$()[':
+            runs.append([])
+            if c == '(':
+                depth += 1
+            elif c == ')':
+                depth -= 1
+            elif c == '[':
+                i = _class_end(regex, i)
+            i += 1
+            continue
+        else:
+            i += 1
+        if depth == 0:
+            runs[-1].append(c)
+        else:
+            runs.append([])
+    return ''.join(max(runs, key=len)).lower()
+
+
+def _escape_end(regex, start):
+    """Return the position just after the escape whose backslash is at start"""
+    c = regex[start + 1]
+    if c in _ESCAPE_DIGITS:
+        return start + 2 + _ESCAPE_DIGITS[c]
+    if c == 'N':
+        return regex.find('}', start) + 1 or len(regex)
+    i = start + 1
+    # Octal codes have up to three digits and group references up to two.
+    while i < len(regex) and i < start + 4 and regex[i].isdigit():
+        i += 1
+    return max(i, start + 2)
+
+
+def _class_end(regex, start):
+    """Return the position of the ']' closing the character class opened at start"""
+    i = start + 1
+    if regex[i:i + 1] == '^':
+        i += 1
+    if regex[i:i + 1] == ']':
+        i += 1
+    while i < len(regex) and regex[i] != ']':
+        i += 2 if regex[i] == '\\' else 1
+    return i
+
+
+def _sqlite_glob_escape(text):
+    return re.sub(r'([*?[])', r'[\1]', text)
+
+
+class _Chunk:
+    """Lowercased paths of a run of listing entries, one per line, with where each line starts"""
+
+    def __init__(self, first, names):
+        self.first = first
+        text = '\n'.join(names)
+        if text.count('\n') != len(names) - 1:
+            text = '\n'.join(name.replace('\n', ' ') for name in names)
+        # The same clean-up ArchiveIndex does, on the whole text at once.
+        text = text.replace('\\', '/').lower()
+        while '/\n' in text:
+            text = text.replace('/\n', '\n')
+        self.text = text.rstrip('/')
+        lengths = (len(line) + 1 for line in self.text.split('\n'))
+        self.starts = array('q', accumulate(lengths, initial=0))
+
+    def __len__(self):
+        return len(self.starts) - 1
+
+    def line(self, number):
+        return self.text[self.starts[number]:self.starts[number + 1] - 1]
+
+    def find_substring(self, needle, found):
+        text = self.text
+        first = self.first
+        count = text.count(needle)
+        if not count:
+            return
+        if count * DENSE_MATCH_SHARE > len(self):
+            found.extend(first + number for number, line in enumerate(text.split('\n')) if needle in line)
+            return
+        starts = self.starts
+        position = text.find(needle)
+        while position >= 0:
+            number = bisect_right(starts, position) - 1
+            found.append(first + number)
+            position = text.find(needle, starts[number + 1])
+
+    def find_pattern(self, pattern, found):
+        text = self.text
+        starts = self.starts
+        match = pattern.search(text)
+        while match:
+            number = bisect_right(starts, match.start()) - 1
+            # A match running into the next line does not count; the line
+            # may still match on its own.
+            if text.find('\n', match.start(), match.end()) < 0 or pattern.search(self.line(number)):
+                found.append(self.first + number)
+            if number + 1 >= len(self):
+                break
+            match = pattern.search(text, starts[number + 1])
+
+
+class ArchiveSearchIndex:
+    """Case-insensitive search over the member paths of an ArchiveListing.
+
+    Paths are kept lowercased in large newline-separated strings. update()
+    adds the entries of a listing that is still being read as one more
+    chunk, and a query is answered by scanning the chunks in C (str.find
+    for text, one regex scan for globs and regexes), so Python code only
+    runs for matching lines.
+
+    Once the listing is complete, build_trigram_index() can put the paths
+    in an SQLite FTS5 trigram table in a temporary file, usually from a
+    worker thread. After that, a query containing a literal of three or
+    more characters only looks at the paths holding that literal, which
+    takes milliseconds even for a million entries.
+    """
+
+    def __init__(self, listing):
+        self.listing = listing
+        self.indexed = 0
+        self._chunks = []
+        self._trigram_path = None
+        self._connection = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def update(self, limit=None):
+        """Index the listing entries added since the last call, up to entry number limit"""
+        end = len(self.listing.names) if limit is None else limit
+        if end > self.indexed:
+            self._chunks.append(_Chunk(self.indexed, self.listing.names[self.indexed:end]))
+            self.indexed = end
+
+    def build_trigram_index(self, cancel=None):
+        """Index every path by its trigrams; return whether the index is ready.
+
+        It is not when this SQLite has no trigram tokenizer, or when the
+        search index was closed meanwhile.
+        """
+        import sqlite3
+        import tempfile
+        chunks = list(self._chunks)
+
+        def rows():
+            for chunk in chunks:
+                for number, line in enumerate(chunk.text.split('\n')):
+                    if not number % 10000:
+                        check_cancelled(cancel)
+                    yield chunk.first + number, line
+
+        handle, path = tempfile.mkstemp(prefix='lawranzip-search-', suffix='.sqlite')
+        os.close(handle)
+        built = False
+        try:
+            connection = sqlite3.connect(path)
+            try:
+                connection.execute("PRAGMA journal_mode = OFF")
+                connection.execute("PRAGMA synchronous = OFF")
+                try:
+                    connection.execute("CREATE VIRTUAL TABLE paths USING fts5("
+                                       "path, tokenize = 'trigram', detail = none, columnsize = 0)")
+                except sqlite3.OperationalError:
+                    return False
+                with connection:
+                    connection.executemany("INSERT INTO paths (rowid, path) VALUES (?, ?)", rows())
+                built = True
+            finally:
+                connection.close()
+            with self._lock:
+                # If the index was closed meanwhile, the file goes right away.
+                built = built and not self._closed
+                if built:
+                    self._trigram_path = path
+        finally:
+            if not built:
+                os.remove(path)
+        return built
+
+    def close(self):
+        """Delete the trigram index, now or as soon as it is built"""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        with self._lock:
+            self._closed = True
+            path, self._trigram_path = self._trigram_path, None
+        if path is not None:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def search(self, query):
+        """Return the numbers of the entries matching what was typed in the search box, in listing order
+
+        Raises re.error for a regex that does not compile.
+        """
+        kind, text = parse_query(query)
+        found = array('l')
+        if not text:
+            return found
+        if kind == 'substring':
+            needle = text.lower()
+            if not self._search_trigrams(needle, None, found):
+                for chunk in self._chunks:
+                    chunk.find_substring(needle, found)
+            return found
+        if kind == 'glob':
+            pattern = re.compile(glob_to_regex(text.lower()), re.MULTILINE)
+            literal = _glob_literal(text.lower())
+        else:
+            pattern = re.compile(text, re.MULTILINE | re.IGNORECASE)
+            literal = _regex_literal(pattern)
+        if not self._search_trigrams(literal, pattern, found):
+            for chunk in self._chunks:
+                chunk.find_pattern(pattern, found)
+        return found
+
+    def _search_trigrams(self, literal, pattern, found):
+        """Add the entries whose paths contain literal and match pattern; False if the index cannot help"""
+        if self._trigram_path is None or len(literal) < TRIGRAM_LENGTH:
+            return False
+        import sqlite3
+        if self._connection is None:
+            self._connection = sqlite3.connect(self._trigram_path)
+        glob = '*' + _sqlite_glob_escape(literal) + '*'
+        if pattern is None:
+            # Plain text found on many lines is quicker to scan for.
+            limit = max(1000, self.indexed // DENSE_MATCH_SHARE)
+            count = self._connection.execute("SELECT count(*) FROM (SELECT 1 FROM paths WHERE path GLOB ? LIMIT ?)",
+                                             (glob, limit)).fetchone()[0]
+            if count >= limit:
+                return False
+        rows = self._connection.execute("SELECT rowid, path FROM paths WHERE path GLOB ? ORDER BY rowid", (glob,))
+        if pattern is None:
+            found.extend(entry for entry, _ in rows)
+        else:
+            search = pattern.search
+            found.extend(entry for entry, path in rows if search(path))
+        return True
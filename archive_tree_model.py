@@ -0,0 +1,375 @@
+from datetime import datetime
+from array import array
+
+from PySide6.QtCore import QAbstractItemModel, QModelIndex, Qt, QTimer, Signal
+
+from archive_index import ROOT
+from icon_cache import file_type
+from tri_state import TriStateSelection, CHECKED, PARTIALLY_CHECKED
+
+# Node visibility while a filter is set.
+HIDDEN = 0
+SHOWN = 1
+SHOWN_WITH_CONTENTS = 2
+
+
+class ArchiveTreeModel(QAbstractItemModel):
+    """Checkable tree of archive contents read straight from an ArchiveIndex.
+
+    A folder's children are sorted the first time the view asks for them,
+    i.e. when it is expanded, and are handed to the view FETCH_BATCH rows at
+    a time, so a folder with a million files costs nothing until it is
+    scrolled through. Model indexes carry the node number as their internal
+    id; no per-row Python objects are created. Sizes and dates are read from
+    the index's ArchiveListing columns.
+
+    While an archive is still being listed, entries_available() indexes the
+    new entries INDEX_SLICE at a time between GUI events. New rows go to the
+    end of the folders already shown, and everything is sorted properly once
+    listing_finished() is called; indexing_finished is emitted once every
+    entry is in the tree.
+
+    set_filter() narrows the tree down to some listing entries, the
+    folders holding them and everything inside the folders among them.
+    """
+    indexing_finished = Signal()
+
+    COLUMNS = ["Name", "Size", "Type", "Modified"]
+    FETCH_BATCH = 1000
+    INDEX_SLICE = 20000
+
+    def __init__(self, archive_index, folder_icon, file_icon, format_size, parent=None):
+        super().__init__(parent)
+        self.archive_index = archive_index
+        self.folder_icon = folder_icon
+        self.file_icon = file_icon
+        self.format_size = format_size
+        self._rows = {}
+        self._fetched = {}
+        self._row_of = {}
+        self.selection = TriStateSelection(archive_index)
+        self._sort_column = 0
+        self._sort_reverse = False
+        self._available = archive_index.indexed
+        self._complete = True
+        self._index_pending = False
+        self._visible = None
+        # Expose the first page of top-level rows before any view asks, so
+        # the model answers the same whether or not it has been shown yet.
+        self._fetched[ROOT] = min(self.FETCH_BATCH, len(self._sorted_rows(ROOT)))
+
+    def node(self, index):
+        return index.internalId() if index.isValid() else ROOT
+
+    def _sorted_rows(self, folder):
+        rows = self._rows.get(folder)
+        if rows is None:
+            rows = self._sort_children(folder)
+            self._rows[folder] = rows
+            self._note_folder_rows(rows)
+        return rows
+
+    def _note_folder_rows(self, rows, start=0):
+        is_dir = self.archive_index.is_dir
+        for row in range(start, len(rows)):
+            child = rows[row]
+            if is_dir[child]:
+                self._row_of[child] = row
+
+    def _sort_children(self, folder):
+        """Return the children of folder in display order: folders by name first, then files by the sort column"""
+        children = self.archive_index.children.get(folder, ())
+        visible = self._visible
+        if visible is not None:
+            if visible[folder] == SHOWN_WITH_CONTENTS:
+                for child in children:
+                    visible[child] = SHOWN_WITH_CONTENTS
+            else:
+                children = [child for child in children if visible[child]]
+        return self._sort_nodes(children)
+
+    def _sort_nodes(self, children):
+        archive_index = self.archive_index
+        names = archive_index.names
+        name_id = archive_index.name_id
+        entry = archive_index.entry
+        listing = archive_index.listing
+        is_dir = archive_index.is_dir
+        reverse = self._sort_reverse
+
+        def by_name(node):
+            return names[name_id[node]].lower()
+
+        folders = sorted((child for child in children if is_dir[child]), key=by_name,
+                         reverse=reverse and self._sort_column == 0)
+        files = [child for child in children if not is_dir[child]]
+        if self._sort_column in (1, 3):
+            column = 'size' if self._sort_column == 1 else 'mtime'
+            files.sort(key=by_name)
+            position = {entry[node]: node for node in files}
+            files = [position[index] for index in listing.order_by(column, list(position), reverse)]
+        elif self._sort_column == 2:
+            files.sort(key=lambda node: (file_type(names[name_id[node]]), by_name(node)), reverse=reverse)
+        else:
+            files.sort(key=by_name, reverse=reverse)
+        return array('l', folders + files)
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        """Re-sort every folder the view has seen, keeping selections and expanded folders in place"""
+        self._sort_column = column
+        self._sort_reverse = order == Qt.SortOrder.DescendingOrder
+        self.layoutAboutToBeChanged.emit()
+        old_indexes = self.persistentIndexList()
+        old_nodes = [(index.internalId(), index.column()) for index in old_indexes]
+        for folder in list(self._rows):
+            rows = self._sort_children(folder)
+            self._rows[folder] = rows
+            self._note_folder_rows(rows)
+
+        positions = {}
+        new_indexes = []
+        for node, column in old_nodes:
+            folder = self.archive_index.parent[node]
+            if folder not in positions:
+                positions[folder] = {child: row for row, child in enumerate(self._rows[folder])}
+            row = positions[folder][node]
+            if row < self._fetched.get(folder, 0):
+                new_indexes.append(self.createIndex(row, column, node))
+            else:
+                new_indexes.append(QModelIndex())
+        self.changePersistentIndexList(old_indexes, new_indexes)
+        self.layoutChanged.emit()
+
+    def entries_available(self, count):
+        """Note that the first count listing entries are complete and index them shortly"""
+        self._available = max(self._available, count)
+        self._complete = False
+        self._schedule_indexing()
+
+    def listing_finished(self):
+        """Index whatever is left, then put every folder shown so far in proper order"""
+        self._complete = True
+        self._schedule_indexing()
+
+    def _schedule_indexing(self):
+        if not self._index_pending:
+            self._index_pending = True
+            QTimer.singleShot(0, self._index_more)
+
+    def _index_more(self):
+        self._index_pending = False
+        archive_index = self.archive_index
+        first_new = len(archive_index.parent)
+        archive_index.update(min(self._available, archive_index.indexed + self.INDEX_SLICE))
+        self._nodes_added(first_new)
+        if archive_index.indexed < self._available:
+            self._schedule_indexing()
+        elif self._complete:
+            order = Qt.SortOrder.DescendingOrder if self._sort_reverse else Qt.SortOrder.AscendingOrder
+            self.sort(self._sort_column, order)
+            self.indexing_finished.emit()
+
+    def _nodes_added(self, first_new):
+        """Hand nodes from first_new on to folders the view has already been given"""
+        archive_index = self.archive_index
+        parent_of = archive_index.parent
+        self.selection.nodes_added(first_new)
+        visible = self._visible
+        if visible is not None:
+            # Only what turns up inside a matching folder is shown until
+            # the filter is set again.
+            visible.extend(bytes(len(parent_of) - len(visible)))
+        new_children = {}
+        for node in range(first_new, len(parent_of)):
+            parent = parent_of[node]
+            if visible is not None:
+                if visible[parent] != SHOWN_WITH_CONTENTS:
+                    continue
+                visible[node] = SHOWN_WITH_CONTENTS
+            new_children.setdefault(parent, []).append(node)
+
+        for folder, nodes in new_children.items():
+            rows = self._rows.get(folder)
+            if rows is None:
+                # A folder on screen that had no children yet needs rows
+                # inserted for the view to give it an expand arrow.
+                if len(archive_index.children[folder]) == len(nodes) and self._is_shown(folder):
+                    self.fetchMore(self._index_of(folder))
+                continue
+            start = len(rows)
+            rows.extend(self._sort_nodes(nodes))
+            self._note_folder_rows(rows, start)
+            fetched = self._fetched.get(folder, 0)
+            if fetched == start and fetched < self.FETCH_BATCH and self._is_shown(folder):
+                self.fetchMore(self._index_of(folder))
+
+    def set_filter(self, entries):
+        """Show only the nodes of the given listing entries with their folders, or everything for None"""
+        self.beginResetModel()
+        if entries is None:
+            self._visible = None
+        else:
+            archive_index = self.archive_index
+            node_of = archive_index.node_of
+            parent_of = archive_index.parent
+            is_dir = archive_index.is_dir
+            visible = bytearray(len(parent_of))
+            visible[ROOT] = SHOWN
+            for entry in entries:
+                node = node_of[entry] if entry < len(node_of) else -1
+                if node < 0:
+                    continue
+                visible[node] = SHOWN_WITH_CONTENTS if is_dir[node] else SHOWN
+                parent = parent_of[node]
+                while not visible[parent]:
+                    visible[parent] = SHOWN
+                    parent = parent_of[parent]
+            self._visible = visible
+        self._rows = {}
+        self._fetched = {}
+        self._row_of = {}
+        self._fetched[ROOT] = min(self.FETCH_BATCH, len(self._sorted_rows(ROOT)))
+        self.endResetModel()
+
+    def _is_shown(self, folder):
+        """Whether folder is the root or a row the view has been given"""
+        if folder == ROOT:
+            return True
+        row = self._row_of.get(folder)
+        return row is not None and row < self._fetched.get(self.archive_index.parent[folder], 0)
+
+    def _index_of(self, node, column=0):
+        if node == ROOT:
+            return QModelIndex()
+        return self.createIndex(self._row_of[node], column, node)
+
+    def index(self, row, column, parent=QModelIndex()):
+        folder = self.node(parent)
+        if column < 0 or column >= len(self.COLUMNS) or row < 0 or row >= self._fetched.get(folder, 0):
+            return QModelIndex()
+        return self.createIndex(row, column, self._sorted_rows(folder)[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        return self._index_of(self.archive_index.parent[index.internalId()])
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        return self._fetched.get(self.node(parent), 0)
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(self.COLUMNS)
+
+    def hasChildren(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return False
+        return self.archive_index.has_children(self.node(parent))
+
+    def canFetchMore(self, parent):
+        folder = self.node(parent)
+        if self._visible is not None:
+            return self._fetched.get(folder, 0) < len(self._sorted_rows(folder))
+        return self._fetched.get(folder, 0) < len(self.archive_index.children.get(folder, ()))
+
+    def fetchMore(self, parent):
+        folder = self.node(parent)
+        rows = self._sorted_rows(folder)
+        start = self._fetched.get(folder, 0)
+        end = min(len(rows), start + self.FETCH_BATCH)
+        if end <= start:
+            return
+        self.beginInsertRows(parent, start, end - 1)
+        self._fetched[folder] = end
+        self.endInsertRows()
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.COLUMNS[section]
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.ItemFlag.NoItemFlags
+        flags = Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable
+        if index.column() == 0:
+            flags |= Qt.ItemFlag.ItemIsUserCheckable
+        return flags
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalId()
+        column = index.column()
+        archive_index = self.archive_index
+        is_dir = archive_index.is_dir[node]
+
+        if role == Qt.ItemDataRole.DisplayRole:
+            if column == 0:
+                return archive_index.name(node)
+            entry = archive_index.entry[node]
+            if column == 1:
+                return self.format_size(archive_index.listing.size[entry]) if entry >= 0 and not is_dir else ""
+            if column == 2:
+                return "Folder" if is_dir else file_type(archive_index.name(node))
+            mtime = archive_index.listing.mtime[entry] if entry >= 0 else 0
+            return datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M') if mtime else ""
+        if column != 0:
+            return None
+        if role == Qt.ItemDataRole.DecorationRole:
+            return self.folder_icon if is_dir else self.file_icon
+        if role == Qt.ItemDataRole.CheckStateRole:
+            return Qt.CheckState(self.selection[node])
+        if role == Qt.ItemDataRole.UserRole:
+            return archive_index.path(node)
+        return None
+
+    def setData(self, index, value, role=Qt.ItemDataRole.EditRole):
+        if not index.isValid() or index.column() != 0 or role != Qt.ItemDataRole.CheckStateRole:
+            return False
+        state = value.value if isinstance(value, Qt.CheckState) else int(value)
+        node = index.internalId()
+        checked = state == CHECKED
+        if checked and self.selection[node] == PARTIALLY_CHECKED and \
+                all(self.selection[top] == CHECKED for top in self._shown_subtrees(node)):
+            # A filtered folder stays partly checked for its hidden children;
+            # clicking it again unchecks what it shows.
+            checked = False
+        self.set_checked(node, checked)
+        return True
+
+    def set_checked(self, node, checked):
+        """Check or uncheck node with everything below it, and update the folders above it.
+
+        While a filter is set, nodes it hides keep their state.
+        """
+        changed_folders = {}
+        for top in self._shown_subtrees(node):
+            changed_folders.update(dict.fromkeys(self.selection.set_checked(top, checked)))
+        for folder in changed_folders:
+            self._emit_rows_changed(folder)
+
+    def _shown_subtrees(self, node):
+        """Yield the topmost nodes at or below node that are shown with everything below them"""
+        visible = self._visible
+        children_of = self.archive_index.children
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if visible is None or visible[current] != SHOWN or not self.archive_index.is_dir[current]:
+                yield current
+            else:
+                stack.extend(child for child in reversed(children_of.get(current, ())) if visible[child])
+
+    def _emit_rows_changed(self, folder):
+        """Tell the view that the check boxes of the rows it has been given for folder changed"""
+        fetched = self._fetched.get(folder, 0)
+        if fetched:
+            parent = self._index_of(folder)
+            self.dataChanged.emit(self.index(0, 0, parent), self.index(fetched - 1, 0, parent),
+                                  [Qt.ItemDataRole.CheckStateRole])
+
+    def checked_paths(self):
+        """Return the archive paths of the topmost checked items"""
+        return [self.archive_index.path(node) for node in self.selection.checked_nodes()]
@@ -0,0 +1,228 @@
+import os
+import json
+import time
+import hashlib
+
+from archive_engine import ArchiveJob
+from cancellation import check_cancelled
+from volumes import archive_name, volume_path
+
+# A backup's manifest is kept next to its archive as NAME.manifest.json.
+MANIFEST_SUFFIX = '.manifest.json'
+# Bump when the manifest layout changes.
+MANIFEST_VERSION = 1
+BACKUP_MODES = ('full', 'incremental', 'differential')
+_HASH_READ_SIZE = 1024 * 1024
+
+
+def manifest_path(archive_path):
+    """Return where the manifest of a backup archive, or of any volume of a split one, is kept"""
+    return archive_name(archive_path) + MANIFEST_SUFFIX
+
+
+def file_digest(path, on_bytes=None, cancel=None):
+    """Return the SHA-256 of a file in hex; on_bytes(size) is called after each read"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            check_cancelled(cancel)
+            data = f.read(_HASH_READ_SIZE)
+            if not data:
+                return digest.hexdigest()
+            digest.update(data)
+            if on_bytes:
+                on_bytes(len(data))
+
+
+class BackupManifest:
+    """The source files as they were at one backup, and which of them its archive holds.
+
+    files maps each member name to [size, mtime_ns, sha256]. packed lists
+    the names stored in this backup's archive; the other files had not
+    changed since the parent backup and are held further up the chain.
+    parent is the path of the parent backup's archive relative to this
+    one's folder, or None for a full backup.
+    """
+
+    def __init__(self, kind, parent=None, files=None, packed=None, created=None):
+        self.kind = kind
+        self.parent = parent
+        self.files = files or {}
+        self.packed = packed or []
+        self.created = created or time.time()
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            raise Exception(f"No backup manifest: {path}")
+        except ValueError as e:
+            raise Exception(f"Damaged backup manifest {path}: {e}")
+        if data.get('version') != MANIFEST_VERSION:
+            raise Exception(f"Unsupported backup manifest version in {path}")
+        return cls(data['kind'], data['parent'], data['files'], data['packed'], data['created'])
+
+    def save(self, path):
+        """Write the manifest through a temporary file, so that it is never found half written"""
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'kind': self.kind, 'parent': self.parent,
+                       'created': self.created, 'packed': self.packed, 'files': self.files},
+                      f, separators=(',', ':'))
+        os.replace(temp_path, path)
+
+
+def backup_chain(archive_path):
+    """Return the (archive path, manifest) pairs from the full backup down to archive_path"""
+    chain = []
+    path = os.path.abspath(archive_name(archive_path))
+    while True:
+        if any(path == seen for seen, _ in chain):
+            raise Exception(f"The backup chain of {archive_path} loops back on itself")
+        manifest = BackupManifest.load(manifest_path(path))
+        chain.append((path, manifest))
+        if manifest.parent is None:
+            break
+        path = os.path.normpath(os.path.join(os.path.dirname(path), manifest.parent))
+    chain.reverse()
+    return chain
+
+
+def _existing_archive(path):
+    """Return path, or its first volume when the archive was split"""
+    return path if os.path.exists(path) else volume_path(path, 1)
+
+
+class BackupJob(ArchiveJob):
+    """Back up files and folders into the archive destination and write its manifest.
+
+    mode is 'full'; 'incremental', packing what changed since the backup
+    previous; or 'differential', packing what changed since the full
+    backup that previous builds on. A file has changed when it is new, or
+    when its size or modification time differ and so does its SHA-256.
+    Files whose size and time are the same are not read again.
+
+    Member names are paths relative to the folder holding the sources, so
+    later runs should back up the same sources.
+    """
+
+    def __init__(self, destination, sources, mode='full', previous=None, **kwargs):
+        if mode not in BACKUP_MODES:
+            raise Exception(f"Unknown backup mode: {mode}")
+        if mode != 'full' and previous is None:
+            raise Exception(f"An {mode} backup needs an earlier backup to compare with")
+        sources = [os.path.abspath(source) for source in sources]
+        root = os.path.commonpath([os.path.dirname(source) for source in sources])
+        super().__init__('create', None, destination, archive_root=root, **kwargs)
+        self.sources = sources
+        self.mode = mode
+        self.previous = previous
+        self.manifest = None
+
+    def run(self):
+        parent = None
+        known = {}
+        if self.mode != 'full':
+            chain = backup_chain(self.previous)
+            parent_path, parent_manifest = chain[0] if self.mode == 'differential' else chain[-1]
+            parent = os.path.relpath(parent_path, os.path.dirname(os.path.abspath(self.destination)))
+            known = parent_manifest.files
+
+        manifest_file = manifest_path(self.destination)
+        if os.path.exists(manifest_file):
+            os.remove(manifest_file)
+        files, changed = self._scan(known)
+        self.files_to_add = [path for _, path in changed]
+        super().run()
+        self.manifest = BackupManifest(self.mode, parent, files, [name for name, _ in changed])
+        self.manifest.save(manifest_file)
+
+    def _source_files(self):
+        for source in self.sources:
+            if not os.path.isdir(source):
+                yield source
+                continue
+            for dirpath, dirnames, filenames in os.walk(source):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    yield os.path.join(dirpath, filename)
+
+    def _scan(self, known):
+        """Return the manifest entries of every source file, and the (name, path) of those to pack"""
+        files = {}
+        to_hash = []
+        for path in self._source_files():
+            check_cancelled(self.cancel_token)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # Gone since it was listed, or a broken link.
+                continue
+            name = os.path.relpath(path, self.archive_root).replace(os.sep, '/')
+            entry = known.get(name)
+            if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+                files[name] = entry
+            else:
+                to_hash.append((name, path, stat))
+
+        changed = []
+        tracker = self.new_tracker(sum(stat.st_size for _, _, stat in to_hash))
+        for name, path, stat in to_hash:
+            self.announce(f"Hashing: {name}")
+            files[name] = [stat.st_size, stat.st_mtime_ns, file_digest(path, tracker.advance, self.cancel_token)]
+            if name not in known or known[name][2] != files[name][2]:
+                changed.append((name, path))
+        tracker.finish()
+        return files, changed
+
+
+class RestoreJob(ArchiveJob):
+    """Restore a backup into destination from the chain of archives it builds on.
+
+    Each file is extracted once, from the newest archive in the chain that
+    holds it, which gives what replaying the full backup and every later
+    one in order would. Files that an earlier backup in the chain had and
+    this one does not are then deleted from destination, so restoring over
+    an older restore brings it up to date.
+    """
+
+    def __init__(self, source, destination, **kwargs):
+        super().__init__('extract', source, destination, **kwargs)
+        self._step = 0
+        self._steps = 1
+
+    def _on_tracker_update(self, percent, rate, eta):
+        super()._on_tracker_update((self._step * 100 + percent) // self._steps, rate, eta)
+
+    def run(self):
+        chain = backup_chain(self.source)
+        target = chain[-1][1]
+        holder = {}
+        for path, manifest in chain:
+            for name in manifest.packed:
+                if name in target.files:
+                    holder[name] = path
+        for name in target.files:
+            if name not in holder:
+                raise Exception(f"No archive in the backup chain holds {name}")
+
+        members = {}
+        for name, path in holder.items():
+            members.setdefault(path, []).append(name)
+        steps = [(path, members[path]) for path, _ in chain if path in members]
+        self._steps = max(1, len(steps))
+        for self._step, (path, names) in enumerate(steps):
+            self.source = _existing_archive(path)
+            self.files_to_extract = names
+            super().run()
+        self._remove_deleted(chain, target)
+
+    def _remove_deleted(self, chain, target):
+        destination = os.path.abspath(self.destination)
+        deleted = {name for _, manifest in chain[:-1] for name in manifest.files if name not in target.files}
+        for name in deleted:
+            path = os.path.normpath(os.path.join(destination, name))
+            if path.startswith(destination + os.sep) and os.path.isfile(path):
+                os.remove(path)
@@ -0,0 +1,145 @@
+import io
+import threading
+
+# How often code blocked on a worker process looks at the token, in seconds.
+POLL_INTERVAL = 0.05
+# Largest piece of data compressed in the calling thread between two checks;
+# even LZMA at its highest preset gets through this in well under 100 ms.
+SLICE_SIZE = 128 * 1024
+
+
+class OperationCancelled(Exception):
+    pass
+
+
+class CancellationToken:
+    """Thread-safe flag that long-running work checks at chunk boundaries"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    def is_cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise OperationCancelled("Operation cancelled")
+
+
+def check_cancelled(cancel):
+    """Raise OperationCancelled if the optional token has been cancelled"""
+    if cancel is not None:
+        cancel.check()
+
+
+def compress_in_slices(compressor, data, cancel=None):
+    """Feed data to compressor a slice at a time, checking the token between slices"""
+    if cancel is None:
+        return compressor.compress(data)
+    view = memoryview(data)
+    parts = []
+    for offset in range(0, len(view), SLICE_SIZE):
+        cancel.check()
+        parts.append(compressor.compress(view[offset:offset + SLICE_SIZE]))
+    return b''.join(parts)
+
+
+def wait_result(future, cancel=None):
+    """Return future.result(), checking the token while the future is still running"""
+    if cancel is None:
+        return future.result()
+    while True:
+        cancel.check()
+        try:
+            return future.result(timeout=POLL_INTERVAL)
+        except TimeoutError:
+            pass
+
+
+def wait_any(futures, cancel=None):
+    """Block until at least one of futures is done and return the done set"""
+    # Only the process pools need this, and it drags in logging.
+    from concurrent.futures import FIRST_COMPLETED, wait
+    while True:
+        check_cancelled(cancel)
+        done, _ = wait(futures, timeout=POLL_INTERVAL if cancel is not None else None, return_when=FIRST_COMPLETED)
+        if done:
+            return done
+
+
+def shutdown_now(executor):
+    """Cancel queued work and stop a process pool without waiting for running tasks to finish"""
+    # Worker processes hold no state of ours, so unlike threads they can be
+    # terminated safely mid-task.
+    processes = getattr(executor, '_processes', None) or {}
+    for process in list(processes.values()):
+        process.terminate()
+    executor.shutdown(wait=True, cancel_futures=True)
+
+
+class CancellableStream(io.RawIOBase):
+    """Pass reads and writes through to fileobj, checking the token before each one.
+
+    Used to give libraries that do their own read/write loops, like py7zr,
+    a cancellation point at every block. max_read caps the size of a single
+    read so that the caller's work between checks stays small.
+    """
+
+    def __init__(self, fileobj, cancel, max_read=None):
+        super().__init__()
+        self.fileobj = fileobj
+        self.cancel = cancel
+        self.max_read = max_read
+        self.name = getattr(fileobj, 'name', None)
+
+    def readable(self):
+        return self.fileobj.readable()
+
+    def writable(self):
+        return self.fileobj.writable()
+
+    def seekable(self):
+        return self.fileobj.seekable()
+
+    def read(self, size=-1):
+        self.cancel.check()
+        if not self.max_read:
+            return self.fileobj.read(size)
+        if size is not None and size >= 0:
+            return self.fileobj.read(min(size, self.max_read))
+        # Read to the end in max_read pieces, checking the token between them.
+        parts = []
+        while True:
+            data = self.fileobj.read(self.max_read)
+            if not data:
+                return b''.join(parts)
+            parts.append(data)
+            self.cancel.check()
+
+    def readinto(self, buffer):
+        self.cancel.check()
+        return self.fileobj.readinto(buffer)
+
+    def write(self, data):
+        self.cancel.check()
+        return self.fileobj.write(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.fileobj.seek(offset, whence)
+
+    def tell(self):
+        return self.fileobj.tell()
+
+    def truncate(self, size=None):
+        return self.fileobj.truncate(size)
+
+    def flush(self):
+        self.fileobj.flush()
+
+    def close(self):
+        if not self.closed:
+            super().close()
+            self.fileobj.close()
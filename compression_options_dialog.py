@@ -0,0 +1,89 @@
+from PySide6.QtWidgets import (
+    QDialog, QVBoxLayout, QLabel, QComboBox, QHBoxLayout, QPushButton
+)
+
+from profiles import DEFAULT_BLOCK_SIZE, PROFILES, PROFILE_LABELS
+from volumes import VOLUME_SIZES
+
+
+class CompressionOptionsDialog(QDialog):
+    SEVEN_ZIP_BLOCK_SIZES = {
+        "16 MB (fastest)": 16 * 1024 * 1024,
+        "64 MB (default)": DEFAULT_BLOCK_SIZE,
+        "256 MB": 256 * 1024 * 1024,
+        "1 GB": 1024 * 1024 * 1024,
+        "Single solid block (best ratio)": 0,
+    }
+
+    ZIP_METHODS = {
+        "Deflate or LZMA, by level (most compatible)": None,
+        "Zstandard (method 93, much faster at a similar ratio)": 'zstd',
+    }
+
+    def __init__(self, parent=None, show_block_size=False, default_profile='normal', show_zip_method=False):
+        super().__init__(parent)
+        self.setWindowTitle("Compression Options")
+        self.setModal(True)
+        self.setMinimumWidth(300)
+
+        layout = QVBoxLayout()
+
+        layout.addWidget(QLabel("Compression level:"))
+        self.profile_combo = QComboBox()
+        for profile in PROFILES:
+            self.profile_combo.addItem(PROFILE_LABELS[profile], profile)
+        self.profile_combo.setCurrentIndex(PROFILES.index(default_profile))
+        layout.addWidget(self.profile_combo)
+
+        self.zip_method_combo = None
+        if show_zip_method:
+            layout.addWidget(QLabel("Compression method (older unzip tools cannot open Zstandard):"))
+            self.zip_method_combo = QComboBox()
+            for label, method in self.ZIP_METHODS.items():
+                self.zip_method_combo.addItem(label, method)
+            layout.addWidget(self.zip_method_combo)
+
+        self.block_size_combo = None
+        if show_block_size:
+            layout.addWidget(QLabel("Solid block size (smaller blocks use more cores, larger blocks compress better):"))
+            self.block_size_combo = QComboBox()
+            for label, size in self.SEVEN_ZIP_BLOCK_SIZES.items():
+                self.block_size_combo.addItem(label, size)
+            self.block_size_combo.setCurrentIndex(list(self.SEVEN_ZIP_BLOCK_SIZES.values()).index(DEFAULT_BLOCK_SIZE))
+            layout.addWidget(self.block_size_combo)
+
+        layout.addWidget(QLabel("Split into volumes of:"))
+        self.volume_size_combo = QComboBox()
+        for label, size in VOLUME_SIZES.items():
+            self.volume_size_combo.addItem(label, size)
+        layout.addWidget(self.volume_size_combo)
+
+        button_layout = QHBoxLayout()
+        ok_button = QPushButton("OK")
+        cancel_button = QPushButton("Cancel")
+
+        ok_button.clicked.connect(self.accept)
+        cancel_button.clicked.connect(self.reject)
+
+        button_layout.addStretch()
+        button_layout.addWidget(ok_button)
+        button_layout.addWidget(cancel_button)
+
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+
+    def get_profile(self):
+        return self.profile_combo.currentData()
+
+    def get_zip_method(self):
+        if self.zip_method_combo is None:
+            return None
+        return self.zip_method_combo.currentData()
+
+    def get_block_size(self):
+        if self.block_size_combo is None:
+            return DEFAULT_BLOCK_SIZE
+        return self.block_size_combo.currentData()
+
+    def get_volume_size(self):
+        return self.volume_size_combo.currentData()
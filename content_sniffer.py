@@ -0,0 +1,135 @@
+import os
+import math
+import time
+
+SAMPLE_SIZE = 64 * 1024
+MIN_SNIFF_SIZE = 4 * 1024
+
+# Formats that are compressed already; recompressing them costs CPU for
+# little or no gain.
+INCOMPRESSIBLE_EXTENSIONS = {
+    '7z', 'apk', 'avif', 'br', 'bz2', 'cab', 'docx', 'epub', 'flac', 'gif', 'gz', 'heic', 'jar',
+    'jpeg', 'jpg', 'lz4', 'lzma', 'm4a', 'm4v', 'mkv', 'mov', 'mp3', 'mp4', 'odt', 'ogg', 'opus',
+    'png', 'pptx', 'rar', 'tbz2', 'tgz', 'txz', 'webm', 'webp', 'whl', 'xlsx', 'xz', 'zip', 'zst',
+}
+
+MAGIC_SIGNATURES = [
+    (0, b'\xff\xd8\xff'),                 # JPEG
+    (0, b'\x89PNG\r\n\x1a\n'),            # PNG
+    (0, b'GIF8'),                         # GIF
+    (0, b'PK\x03\x04'),                   # ZIP and ZIP-based documents
+    (0, b'7z\xbc\xaf\x27\x1c'),           # 7-Zip
+    (0, b'Rar!\x1a\x07'),                 # RAR
+    (0, b'\x1f\x8b'),                     # gzip
+    (0, b'\xfd7zXZ\x00'),                 # xz
+    (0, b'BZh'),                          # bzip2
+    (0, b'\x28\xb5\x2f\xfd'),             # Zstandard
+    (0, b'\x04\x22\x4d\x18'),             # LZ4 frame
+    (0, b'\x1a\x45\xdf\xa3'),             # Matroska / WebM
+    (0, b'OggS'),                         # Ogg
+    (0, b'fLaC'),                         # FLAC
+    (0, b'ID3'),                          # MP3 with ID3 tag
+    (4, b'ftyp'),                         # MP4 / MOV / HEIC
+]
+
+# Bits per byte. Known compressed formats only need to look random-ish
+# (headers pull the figure down); unknown data must look fully random.
+KNOWN_FORMAT_ENTROPY = 7.5
+UNKNOWN_FORMAT_ENTROPY = 7.95
+
+
+def shannon_entropy(data):
+    """Return the Shannon entropy of data in bits per byte"""
+    if not data:
+        return 0.0
+    total = len(data)
+    entropy = 0.0
+    for count in map(data.count, range(256)):
+        if count:
+            p = count / total
+            entropy -= p * math.log2(p)
+    return entropy
+
+
+def format_duration(seconds):
+    if seconds < 60:
+        return f"{seconds:.1f} s"
+    return f"{int(seconds // 60)} min {int(seconds % 60)} s"
+
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+class CompressionStats:
+    """Per-run counters for files stored without recompression and the time that saved"""
+
+    def __init__(self):
+        self.sniffed_files = 0
+        self.sniff_seconds = 0.0
+        self.stored_files = 0
+        self.stored_bytes = 0
+        self.compressed_bytes = 0
+        self.compress_seconds = 0.0
+
+    def record_compressed(self, size, seconds):
+        self.compressed_bytes += size
+        self.compress_seconds += seconds
+
+    def estimated_seconds_saved(self):
+        """Time the stored bytes would have taken at this run's measured compression speed"""
+        if not self.compressed_bytes or not self.compress_seconds:
+            return 0.0
+        seconds_per_byte = self.compress_seconds / self.compressed_bytes
+        return max(0.0, self.stored_bytes * seconds_per_byte - self.sniff_seconds)
+
+    def summary(self):
+        if not self.stored_files:
+            return ""
+        return (f"Stored {self.stored_files} already-compressed file(s) ({format_bytes(self.stored_bytes)}) "
+                f"without recompression, saving about {format_duration(self.estimated_seconds_saved())}.")
+
+
+class ContentSniffer:
+    """Decide whether a file is worth compressing from its extension, magic bytes and an entropy sample"""
+
+    def __init__(self, stats=None):
+        self.stats = stats or CompressionStats()
+
+    def is_incompressible(self, path):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return False
+        if size < MIN_SNIFF_SIZE:
+            return False
+
+        start = time.perf_counter()
+        try:
+            with open(path, 'rb') as f:
+                sample = f.read(SAMPLE_SIZE // 2)
+                if size > SAMPLE_SIZE:
+                    # A second block from the middle catches files that only
+                    # start with a compressible header.
+                    f.seek(size // 2)
+                    sample += f.read(SAMPLE_SIZE // 2)
+        except OSError:
+            return False
+
+        ext = os.path.splitext(path)[1][1:].lower()
+        known = ext in INCOMPRESSIBLE_EXTENSIONS or any(
+            sample[offset:offset + len(magic)] == magic for offset, magic in MAGIC_SIGNATURES
+        )
+        threshold = KNOWN_FORMAT_ENTROPY if known else UNKNOWN_FORMAT_ENTROPY
+        incompressible = shannon_entropy(sample) >= threshold
+
+        self.stats.sniffed_files += 1
+        self.stats.sniff_seconds += time.perf_counter() - start
+        if incompressible:
+            self.stats.stored_files += 1
+            self.stats.stored_bytes += size
+        return incompressible
@@ -0,0 +1,320 @@
+import os
+import json
+import lzma
+import struct
+import hashlib
+import multiprocessing
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from cancellation import check_cancelled, compress_in_slices, wait_result, shutdown_now
+from parallel_zip import _InlineExecutor
+
+DEDUP_EXTENSION = '.ldz'
+# Chunks are cut where the hash of the last WINDOW_SIZE bytes is zero at two
+# neighbouring positions, about every 64 KiB of varied data, but never
+# closer than MIN_CHUNK_SIZE or further apart than MAX_CHUNK_SIZE.
+WINDOW_SIZE = 31
+MIN_CHUNK_SIZE = 16 * 1024
+MAX_CHUNK_SIZE = 512 * 1024
+# Unique chunks are gathered into blocks of about this size, each compressed as one xz stream.
+DEDUP_BLOCK_SIZE = 4 * 1024 * 1024
+# Decompressed blocks kept while reading, for chunks that files share.
+CACHED_BLOCKS = 8
+# Bump when the index layout changes.
+DEDUP_VERSION = 1
+_READ_SIZE = 4 * 1024 * 1024
+_MAGIC = b'LZDEDUP1'
+# Index offset, index size, magic.
+_TRAILER = struct.Struct('<QQ8s')
+_DIGEST_SIZE = 16
+# Every byte value scrambled to a nonzero one, so that the window hash of a
+# run of one repeated byte (an odd number of equal values XORed) is never zero.
+_SCRAMBLE = bytes(hashlib.blake2b(bytes([i]), person=b'lawranzip-cdc').digest()[0] % 255 + 1 for i in range(256))
+
+
+def _window_hashes(data):
+    """Return, for every position k of data, the XOR of the scrambled bytes k to k + WINDOW_SIZE - 1.
+
+    The whole buffer is handled as one big integer, so the work is a few
+    shifts and XORs in C rather than a loop over bytes. Windows running
+    past the end of data are short.
+    """
+    scrambled = int.from_bytes(data.translate(_SCRAMBLE), 'little')
+    window = scrambled
+    span = 1
+    while span <= WINDOW_SIZE // 2:
+        window ^= window >> (8 * span)
+        span *= 2
+    # window now covers WINDOW_SIZE + 1 bytes; drop the last one.
+    window ^= scrambled >> (8 * WINDOW_SIZE)
+    return window.to_bytes(len(data), 'little')
+
+
+def iter_chunks(f, cancel=None):
+    """Yield the content-defined chunks of a binary file.
+
+    A cut depends only on the bytes just before it, so the same content
+    is cut the same way wherever it sits in a file, and an insertion only
+    changes the chunks around it.
+    """
+    buffer = b''
+    eof = False
+    while not eof:
+        check_cancelled(cancel)
+        data = f.read(_READ_SIZE)
+        eof = not data
+        buffer = buffer + data if buffer else data
+        hashes = _window_hashes(buffer)
+        # Windows are only complete up to here; later ones need the next read.
+        complete = len(buffer) - WINDOW_SIZE
+        start = 0
+        while start < len(buffer):
+            k = hashes.find(b'\0\0', max(0, start + MIN_CHUNK_SIZE - WINDOW_SIZE - 1), max(0, complete + 1))
+            if 0 <= k and k + 1 + WINDOW_SIZE - start <= MAX_CHUNK_SIZE:
+                cut = k + 1 + WINDOW_SIZE
+            elif complete + WINDOW_SIZE >= start + MAX_CHUNK_SIZE:
+                cut = start + MAX_CHUNK_SIZE
+            elif eof:
+                cut = len(buffer)
+            else:
+                break
+            yield buffer[start:cut]
+            start = cut
+        buffer = buffer[start:]
+
+
+def _compress_block(data, preset, cancel=None):
+    compressor = lzma.LZMACompressor(format=lzma.FORMAT_XZ, preset=preset)
+    return compress_in_slices(compressor, data, cancel) + compressor.flush()
+
+
+def _digest(chunk):
+    return hashlib.blake2b(chunk, digest_size=_DIGEST_SIZE).digest()
+
+
+class DedupMember:
+    """One file or folder of a dedup archive"""
+
+    def __init__(self, name, size, mtime, is_dir, chunks):
+        self.name = name
+        self.size = size
+        self.mtime = mtime
+        self.is_dir = is_dir
+        self.chunks = chunks
+
+
+class DedupArchiveWriter:
+    """Write a deduplicating archive, where every distinct chunk of content is stored once.
+
+    Files are cut into content-defined chunks (see iter_chunks) and each
+    chunk is identified by its BLAKE2b digest. New chunks are appended to a
+    block, and full blocks are compressed as xz in a process pool and
+    written in order. The index at the end, itself xz compressed, lists the
+    blocks, the chunks with their block, offset, size and digest, and the
+    members with their chunk numbers.
+    """
+
+    def __init__(self, fileobj, preset=lzma.PRESET_DEFAULT, workers=None, cancel=None):
+        self.fileobj = fileobj
+        self.preset = preset
+        self.workers = workers or os.cpu_count() or 1
+        self.cancel = cancel
+        self.total_bytes = 0
+        self.unique_bytes = 0
+        self._chunk_numbers = {}
+        self._digests = []
+        self._chunk_block = []
+        self._chunk_offset = []
+        self._chunk_size = []
+        self._members = []
+        self._blocks = []
+        self._block = bytearray()
+        self._block_count = 0
+        self._pending = deque()
+        self._executor = None
+        self._position = len(_MAGIC)
+        self.fileobj.write(_MAGIC)
+
+    def add_file(self, path, arcname, on_bytes=None):
+        """Add a file; on_bytes(size) is called as each chunk is taken in"""
+        mtime = os.path.getmtime(path)
+        chunks = []
+        size = 0
+        with open(path, 'rb') as f:
+            for chunk in iter_chunks(f, self.cancel):
+                chunks.append(self._add_chunk(chunk))
+                size += len(chunk)
+                if on_bytes:
+                    on_bytes(len(chunk))
+        self.total_bytes += size
+        self._members.append([arcname.replace(os.sep, '/'), size, mtime, False, chunks])
+
+    def add_directory(self, path, arcname):
+        self._members.append([arcname.replace(os.sep, '/'), 0, os.path.getmtime(path), True, []])
+
+    def _add_chunk(self, chunk):
+        digest = _digest(chunk)
+        number = self._chunk_numbers.get(digest)
+        if number is not None:
+            return number
+        number = len(self._digests)
+        self._chunk_numbers[digest] = number
+        self._digests.append(digest)
+        self._chunk_block.append(self._block_count)
+        self._chunk_offset.append(len(self._block))
+        self._chunk_size.append(len(chunk))
+        self._block += chunk
+        self.unique_bytes += len(chunk)
+        if len(self._block) >= DEDUP_BLOCK_SIZE:
+            self._submit_block()
+        return number
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.workers <= 1:
+                self._executor = _InlineExecutor()
+            else:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+        return self._executor
+
+    def _submit_block(self):
+        executor = self._get_executor()
+        # Inline blocks are compressed in this thread and can check the token
+        # between slices; pool workers are terminated instead.
+        cancel = self.cancel if isinstance(executor, _InlineExecutor) else None
+        self._pending.append((executor.submit(_compress_block, bytes(self._block), self.preset, cancel),
+                              len(self._block)))
+        self._block = bytearray()
+        self._block_count += 1
+        while len(self._pending) > self.workers * 2 or (self._pending and self._pending[0][0].done()):
+            self._write_next()
+
+    def _write_next(self):
+        future, size = self._pending[0]
+        data = wait_result(future, self.cancel)
+        self._pending.popleft()
+        self._blocks.append([self._position, len(data), size])
+        self.fileobj.write(data)
+        self._position += len(data)
+
+    def close(self):
+        """Write the remaining blocks and the index"""
+        try:
+            if self._block:
+                self._submit_block()
+            while self._pending:
+                self._write_next()
+            index = {
+                'version': DEDUP_VERSION,
+                'blocks': self._blocks,
+                'chunk_block': self._chunk_block,
+                'chunk_offset': self._chunk_offset,
+                'chunk_size': self._chunk_size,
+                'chunk_digests': b''.join(self._digests).hex(),
+                'members': self._members,
+            }
+            data = lzma.compress(json.dumps(index, separators=(',', ':')).encode('utf-8'))
+            self.fileobj.write(data)
+            self.fileobj.write(_TRAILER.pack(self._position, len(data), _MAGIC))
+            if self._executor:
+                self._executor.shutdown(wait=True)
+        except BaseException:
+            self.abort()
+            raise
+
+    def abort(self):
+        """Drop any queued blocks and stop the pool without writing the index"""
+        self._pending.clear()
+        if self._executor:
+            shutdown_now(self._executor)
+            self._executor = None
+
+
+class DedupArchiveReader:
+    """Read the members of a dedup archive from a seekable binary file"""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        fileobj.seek(0)
+        if fileobj.read(len(_MAGIC)) != _MAGIC:
+            raise Exception("Not a LawranZip dedup archive")
+        try:
+            fileobj.seek(-_TRAILER.size, os.SEEK_END)
+            offset, size, magic = _TRAILER.unpack(fileobj.read(_TRAILER.size))
+            if magic != _MAGIC:
+                raise ValueError("no index trailer")
+            fileobj.seek(offset)
+            index = json.loads(lzma.decompress(fileobj.read(size)))
+        except (OSError, ValueError, struct.error, lzma.LZMAError) as e:
+            raise Exception(f"Damaged dedup archive: {e}")
+        if index.get('version') != DEDUP_VERSION:
+            raise Exception(f"Unsupported dedup archive version: {index.get('version')}")
+        self.blocks = index['blocks']
+        self.chunk_block = index['chunk_block']
+        self.chunk_offset = index['chunk_offset']
+        self.chunk_size = index['chunk_size']
+        self.digests = bytes.fromhex(index['chunk_digests'])
+        self.members = [DedupMember(*member) for member in index['members']]
+        self._cache = OrderedDict()
+
+    def packed_sizes(self):
+        """Return the compressed bytes each member added to the archive, counting shared chunks once"""
+        ratios = [compressed / size if size else 1.0 for _, compressed, size in self.blocks]
+        seen = set()
+        sizes = []
+        for member in self.members:
+            packed = 0
+            for number in member.chunks:
+                if number not in seen:
+                    seen.add(number)
+                    packed += self.chunk_size[number] * ratios[self.chunk_block[number]]
+            sizes.append(round(packed))
+        return sizes
+
+    def _block(self, number):
+        data = self._cache.get(number)
+        if data is not None:
+            self._cache.move_to_end(number)
+            return data
+        offset, compressed, _ = self.blocks[number]
+        self.fileobj.seek(offset)
+        data = lzma.decompress(self.fileobj.read(compressed), format=lzma.FORMAT_XZ)
+        self._cache[number] = data
+        while len(self._cache) > CACHED_BLOCKS:
+            self._cache.popitem(last=False)
+        return data
+
+    def read_chunks(self, member, cancel=None):
+        """Yield the content of a member chunk by chunk, checking each against its digest"""
+        for number in member.chunks:
+            check_cancelled(cancel)
+            offset = self.chunk_offset[number]
+            chunk = self._block(self.chunk_block[number])[offset:offset + self.chunk_size[number]]
+            if _digest(chunk) != self.digests[number * _DIGEST_SIZE:(number + 1) * _DIGEST_SIZE]:
+                raise Exception(f"Chunk {number} does not match its digest")
+            yield chunk
+
+    def extract(self, members, destination, on_member=None, on_bytes=None, cancel=None):
+        """Write members under destination, in the order their data lies in the archive"""
+        destination = os.path.abspath(destination)
+        members = sorted(members, key=lambda member: self.chunk_block[member.chunks[0]] if member.chunks else -1)
+        for member in members:
+            target = os.path.normpath(os.path.join(destination, member.name))
+            if not target.startswith(destination + os.sep):
+                raise Exception(f"Unsafe member name: {member.name}")
+            if on_member:
+                on_member(member.name)
+            if member.is_dir:
+                os.makedirs(target, exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as out:
+                for chunk in self.read_chunks(member, cancel):
+                    out.write(chunk)
+                    if on_bytes:
+                        on_bytes(len(chunk))
+            os.utime(target, (member.mtime, member.mtime))
@@ -0,0 +1,96 @@
+import os
+import time
+
+from PySide6.QtCore import QThread, Signal
+
+from cancellation import CancellationToken, OperationCancelled
+
+# Scanned entries are handed to the view at least this often, in seconds, and
+# at most this many at a time.
+SCAN_BATCH_INTERVAL = 0.1
+SCAN_BATCH_SIZE = 2000
+
+
+def directory_sort_key(name, is_dir):
+    """Folders first, then by name ignoring case"""
+    return not is_dir, name.lower()
+
+
+class DirectoryScanThread(QThread):
+    """Thread to read a folder without blocking UI, in two passes.
+
+    The first pass reads names only (scandir tells folders from files without
+    a stat call on most file systems) and sends them as entries_found batches
+    of (name, path, is_dir) in the order they are read, then emits
+    names_done. The second pass stats each entry, in the order the view
+    sorts them, and sends stats_found batches of (number, size, mtime), where
+    number is the entry's position in the order it was sent; size and mtime
+    are None when the entry cannot be read.
+    """
+    entries_found = Signal(object)
+    names_done = Signal()
+    stats_found = Signal(object)
+    finished = Signal(bool, str)  # success, error_message
+
+    def __init__(self, directory_path):
+        super().__init__()
+        self.directory_path = directory_path
+        self.cancel_token = CancellationToken()
+
+    def cancel(self):
+        """Stop scanning at the next entry"""
+        self.cancel_token.cancel()
+
+    def run(self):
+        try:
+            entries = self.read_names()
+            self.names_done.emit()
+            self.read_stats(entries)
+            self.finished.emit(True, "")
+        except OperationCancelled:
+            self.finished.emit(False, "Scan cancelled")
+        except OSError as e:
+            self.finished.emit(False, str(e))
+
+    def read_names(self):
+        """Send every entry's name in batches; return the DirEntry objects with their folder flags"""
+        entries = []
+        batch = []
+        last = time.perf_counter()
+        with os.scandir(self.directory_path) as scan:
+            for entry in scan:
+                self.cancel_token.check()
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                entries.append((entry, is_dir))
+                batch.append((entry.name, entry.path, is_dir))
+                now = time.perf_counter()
+                if len(batch) >= SCAN_BATCH_SIZE or now - last >= SCAN_BATCH_INTERVAL:
+                    self.entries_found.emit(batch)
+                    batch = []
+                    last = now
+        if batch:
+            self.entries_found.emit(batch)
+        return entries
+
+    def read_stats(self, entries):
+        """Send sizes and modification times, top of the sorted view first"""
+        order = sorted(range(len(entries)), key=lambda i: directory_sort_key(entries[i][0].name, entries[i][1]))
+        batch = []
+        last = time.perf_counter()
+        for number in order:
+            self.cancel_token.check()
+            try:
+                stat = entries[number][0].stat()
+                batch.append((number, stat.st_size, stat.st_mtime))
+            except OSError:
+                batch.append((number, None, None))
+            now = time.perf_counter()
+            if len(batch) >= SCAN_BATCH_SIZE or now - last >= SCAN_BATCH_INTERVAL:
+                self.stats_found.emit(batch)
+                batch = []
+                last = now
+        if batch:
+            self.stats_found.emit(batch)
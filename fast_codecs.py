@@ -0,0 +1,136 @@
+import os
+import sys
+import zipfile
+
+from profiles import ZIP_ZSTANDARD
+
+# Zstandard comes from the standard library from Python 3.14 and from the
+# backports.zstd package before that; LZ4 from the lz4 package. Both are
+# imported by the code paths that need them, so that neither is required
+# for the other formats.
+
+# Window for long-distance matching: 128 MiB, as zstd --long uses. Larger
+# windows need every reader to raise its memory limit to decode them.
+ZSTD_LONG_WINDOW_LOG = 27
+TAR_ZSTD_EXTENSIONS = ('.tar.zst', '.tzst')
+TAR_LZ4_EXTENSIONS = ('.tar.lz4',)
+
+
+def load_zstd():
+    """Return the zstd module, from the standard library or backports.zstd"""
+    try:
+        from compression import zstd
+    except ImportError:
+        try:
+            from backports import zstd
+        except ImportError:
+            raise Exception("Zstandard support needs Python 3.14 or the backports.zstd package")
+    return zstd
+
+
+def load_lz4():
+    """Return the lz4.frame module"""
+    try:
+        import lz4.frame
+    except ImportError:
+        raise Exception("LZ4 support needs the lz4 package")
+    return lz4.frame
+
+
+def zstd_options(level, long_distance=False, threads=0):
+    """Return zstd compression parameters; threads > 0 compresses in that many libzstd threads"""
+    zstd = load_zstd()
+    options = {zstd.CompressionParameter.compression_level: level}
+    if long_distance:
+        options[zstd.CompressionParameter.enable_long_distance_matching] = 1
+        options[zstd.CompressionParameter.window_log] = ZSTD_LONG_WINDOW_LOG
+    if threads > 0:
+        options[zstd.CompressionParameter.nb_workers] = threads
+    return options
+
+
+def zstd_threads():
+    """Return how many threads libzstd should compress in: all cores, or none of its own on one core"""
+    cores = os.cpu_count() or 1
+    return cores if cores > 1 else 0
+
+
+def open_tar_stream(name, fileobj, mode, level=None, long_distance=False):
+    """Wrap fileobj in a zstd or lz4 stream for tarfile, which cannot handle either itself.
+
+    name tells the format; returns None for other formats. Writing zstd
+    uses every core through libzstd's own threads, which still produce one
+    frame, so long-distance matches can reach across the whole window.
+    """
+    name = name.lower()
+    if name.endswith(TAR_ZSTD_EXTENSIONS):
+        zstd = load_zstd()
+        if mode == 'r':
+            return zstd.ZstdFile(fileobj, 'r')
+        return zstd.ZstdFile(fileobj, 'w', options=zstd_options(level, long_distance, zstd_threads()))
+    if name.endswith(TAR_LZ4_EXTENSIONS):
+        frame = load_lz4()
+        if mode == 'r':
+            return frame.LZ4FrameFile(fileobj, 'rb')
+        return frame.LZ4FrameFile(fileobj, 'wb', compression_level=level, content_checksum=True)
+    return None
+
+
+def register_zip_zstd():
+    """Teach zipfile, and pyzipper's copy of it once imported, to read and write ZIP method 93.
+
+    zipfile only knows Zstandard from Python 3.14, where this does nothing.
+    Call again after importing pyzipper; modules already done are skipped.
+    """
+    modules = [zipfile]
+    if 'pyzipper' in sys.modules:
+        modules.append(sys.modules['pyzipper'].zipfile)
+    for module in modules:
+        if getattr(module, 'ZIP_ZSTANDARD', None) == ZIP_ZSTANDARD or getattr(module, '_lawranzip_zstd', False):
+            continue
+        _patch_zipfile(module)
+        module._lawranzip_zstd = True
+
+
+def _patch_zipfile(module):
+    check_compression = module._check_compression
+    get_compressor = module._get_compressor
+
+    def _check_compression(compression):
+        if compression == ZIP_ZSTANDARD:
+            load_zstd()
+        else:
+            check_compression(compression)
+
+    def _get_compressor(compress_type, compresslevel=None):
+        if compress_type == ZIP_ZSTANDARD:
+            return load_zstd().ZstdCompressor(level=compresslevel)
+        return get_compressor(compress_type, compresslevel)
+
+    module._check_compression = _check_compression
+    module._get_compressor = _get_compressor
+    module.compressor_names[ZIP_ZSTANDARD] = 'zstd'
+
+    # The standard zipfile picks decompressors with a module function,
+    # pyzipper with a ZipExtFile method.
+    if hasattr(module, '_get_decompressor'):
+        get_decompressor = module._get_decompressor
+
+        def _get_decompressor(compress_type):
+            if compress_type == ZIP_ZSTANDARD:
+                return load_zstd().ZstdDecompressor()
+            return get_decompressor(compress_type)
+
+        module._get_decompressor = _get_decompressor
+    else:
+        get_decompressor_method = module.ZipExtFile.get_decompressor
+
+        def get_decompressor(self, compress_type):
+            if compress_type == ZIP_ZSTANDARD:
+                return load_zstd().ZstdDecompressor()
+            return get_decompressor_method(self, compress_type)
+
+        module.ZipExtFile.get_decompressor = get_decompressor
+
+
+register_zip_zstd()
@@ -6,6 +6,8 @@ from PySide6.QtCore import QDir, Qt, QStandardPaths
 from PySide6.QtGui import QIcon
 import os
 
+from icon_cache import ICON_CACHE, CachingIconProvider
+
 
 class FileBrowserDialog(QDialog):
     def __init__(self, parent=None, directory_only=False, file_only=False, name_filters=None):
@@ -60,6 +62,9 @@ class FileBrowserDialog(QDialog):
 
         # Initialize the file system model
         self.model = QFileSystemModel()
+        # Kept as an attribute: the model does not take ownership of it.
+        self.icon_provider = CachingIconProvider(ICON_CACHE)
+        self.model.setIconProvider(self.icon_provider)
         self.model.setRootPath("")  # Show entire file system
 
         # Apply name filters if provided
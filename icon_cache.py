@@ -0,0 +1,130 @@
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from PySide6.QtCore import QFileInfo
+from PySide6.QtWidgets import QFileIconProvider
+
+# Most distinct icons kept; the least recently used one is dropped beyond this.
+ICON_CACHE_SIZE = 512
+# Files of these types can each have an icon of their own.
+PER_FILE_ICON_EXTENSIONS = ('.exe', '.lnk', '.ico', '.url', '.desktop')
+# Looked up in the background at startup so the first folders open warm.
+PRELOAD_EXTENSIONS = (
+    '.txt', '.md', '.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx', '.odt', '.csv', '.json',
+    '.xml', '.html', '.css', '.js', '.py', '.c', '.h', '.cpp', '.java', '.sh', '.ini', '.log',
+    '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.svg', '.webp', '.mp3', '.wav', '.flac', '.mp4', '.mkv',
+    '.avi', '.mov', '.zip', '.7z', '.rar', '.tar', '.gz', '.xz', '.bz2', '.iso', '.dll', '.so',
+)
+
+
+def file_type(name):
+    """Return the type text shown when the platform has no description: the upper-case extension"""
+    _, ext = os.path.splitext(name)
+    return ext[1:].upper() if ext else "File"
+
+
+class IconTypeCache:
+    """Bounded LRU cache of the icons and type descriptions of files.
+
+    Asking the platform for a file's icon or type can mean a shell or MIME
+    database query, so answers are kept per extension (one entry for all
+    folders) and shared by every view. Types in PER_FILE_ICON_EXTENSIONS are
+    kept per path, and drives are never cached. Lookups may come from any
+    thread; QFileSystemModel asks its icon provider from a worker thread.
+    """
+
+    def __init__(self, max_entries=ICON_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._provider = None
+
+    def provider(self):
+        """Return the platform icon provider, created on first use since it needs a running QApplication"""
+        with self._lock:
+            if self._provider is None:
+                self._provider = QFileIconProvider()
+            return self._provider
+
+    def icon_and_type(self, path, is_dir, file_info=None):
+        """Return the (icon, type text) of a file or folder"""
+        key = self._key(path, is_dir)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+        return self._store(key, self._look_up(path, is_dir, file_info))
+
+    def _key(self, path, is_dir):
+        if is_dir:
+            return '/'
+        extension = os.path.splitext(path)[1].lower()
+        return path if extension in PER_FILE_ICON_EXTENSIONS else extension
+
+    def _store(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def _look_up(self, path, is_dir, file_info):
+        provider = self.provider()
+        file_info = file_info or QFileInfo(path)
+        type_str = provider.type(file_info) or ("Folder" if is_dir else file_type(path))
+        return provider.icon(file_info), type_str
+
+    def hit_rate(self):
+        """Return the share of lookups answered from the cache, from 0 to 1"""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def describe(self):
+        return (f"Icon cache: {self.hit_rate():.0%} hits of {self.hits + self.misses} lookups, "
+                f"{len(self._entries)}/{self.max_entries} entries")
+
+    def preload(self, extensions=PRELOAD_EXTENSIONS):
+        """Look up the folder icon and common file types in a background thread"""
+        def run():
+            # The platform only describes files that exist, so empty
+            # stand-ins are looked up in a scratch folder.
+            try:
+                with tempfile.TemporaryDirectory(prefix='lawranzip-icons-') as folder:
+                    self._store('/', self._look_up(folder, True, None))
+                    for extension in extensions:
+                        path = os.path.join(folder, 'preload' + extension)
+                        open(path, 'wb').close()
+                        self._store(self._key(path, False), self._look_up(path, False, None))
+            except OSError:
+                pass
+
+        self.provider()
+        threading.Thread(target=run, daemon=True).start()
+
+
+class CachingIconProvider(QFileIconProvider):
+    """Icon provider for QFileSystemModel that answers from an IconTypeCache"""
+
+    def __init__(self, cache):
+        super().__init__()
+        self.cache = cache
+
+    def icon(self, info):
+        if not isinstance(info, QFileInfo) or info.isRoot():
+            return super().icon(info)
+        return self.cache.icon_and_type(info.filePath(), info.isDir(), info)[0]
+
+    def type(self, info):
+        if info.isRoot():
+            return super().type(info)
+        return self.cache.icon_and_type(info.filePath(), info.isDir(), info)[1]
+
+
+ICON_CACHE = IconTypeCache()
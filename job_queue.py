@@ -0,0 +1,222 @@
+import os
+import threading
+import itertools
+
+from cancellation import OperationCancelled
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+# Every job already spreads its compression across all cores, so running
+# more than a few at once only adds contention.
+DEFAULT_MAX_RUNNING = max(1, min(4, os.cpu_count() or 1))
+
+
+def _existing_ancestor(path):
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+
+def _is_solid_state(device):
+    """Return True if the block device behind an st_dev is known not to be a spinning disk"""
+    # Only Linux exposes this; everywhere else the device is treated as a
+    # spinning disk, which is the safe choice.
+    sys_path = f"/sys/dev/block/{os.major(device)}:{os.minor(device)}"
+    for queue in (os.path.join(sys_path, 'queue', 'rotational'), os.path.join(sys_path, '..', 'queue', 'rotational')):
+        try:
+            with open(queue) as f:
+                return f.read().strip() == '0'
+        except OSError:
+            pass
+    return False
+
+
+def job_devices(job):
+    """Return the st_dev of every disk an ArchiveJob reads from or writes to"""
+    paths = list(job.files_to_add) if job.operation == 'create' else [job.source]
+    paths.append(job.destination)
+    devices = set()
+    for path in paths:
+        try:
+            devices.add(os.stat(_existing_ancestor(path)).st_dev)
+        except OSError:
+            pass
+    return devices
+
+
+class QueuedJob:
+    """An ArchiveJob waiting in or run by a JobQueue, with its last reported state"""
+
+    def __init__(self, job_id, job, priority, label):
+        self.id = job_id
+        self.job = job
+        self.priority = priority
+        self.label = label
+        self.state = QUEUED
+        self.progress = 0
+        self.rate = 0.0
+        self.eta = -1.0
+        self.message = ""
+        self.devices = set()
+
+
+class JobQueue:
+    """Run ArchiveJobs on a bounded set of threads, highest priority first.
+
+    Jobs of equal priority run in submission order. A job that shares a
+    spinning disk with a running job waits, and the next job that touches
+    other disks is started instead, so that two jobs never fight over one
+    disk head. on_change(queued_job) is called from worker threads whenever
+    a job's state or progress changes.
+    """
+
+    def __init__(self, max_running=DEFAULT_MAX_RUNNING, on_change=None):
+        self.max_running = max(1, max_running)
+        self.on_change = on_change
+        self._jobs = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._busy_devices = {}
+        self._solid_state = {}
+
+    def submit(self, job, priority=0, label=None):
+        """Queue an ArchiveJob and return its QueuedJob"""
+        queued = QueuedJob(next(self._ids), job, priority, label or os.path.basename(job.destination))
+        job.on_progress = lambda percent: self._report(queued, progress=percent)
+        job.on_throughput = lambda rate, eta: self._report(queued, rate=rate, eta=eta)
+        job.on_file = lambda text: self._report(queued, message=text)
+        with self._lock:
+            self._jobs.append(queued)
+        self._notify(queued)
+        self._schedule()
+        return queued
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs)
+
+    def set_priority(self, queued, priority):
+        """Change the priority of a job that has not started yet"""
+        with self._lock:
+            if queued.state != QUEUED:
+                return
+            queued.priority = priority
+        self._notify(queued)
+        self._schedule()
+
+    def cancel(self, queued):
+        """Drop a waiting job, or ask a running one to stop"""
+        with self._lock:
+            if queued.state == QUEUED:
+                queued.state = CANCELLED
+                queued.message = "Cancelled"
+                self._idle.notify_all()
+            elif queued.state == RUNNING:
+                queued.job.cancel()
+                queued.message = "Cancelling..."
+            else:
+                return
+        self._notify(queued)
+
+    def cancel_all(self):
+        for queued in self.jobs():
+            self.cancel(queued)
+
+    def clear_finished(self):
+        with self._lock:
+            self._jobs = [queued for queued in self._jobs if queued.state not in FINISHED_STATES]
+
+    def pending_count(self):
+        with self._lock:
+            return sum(1 for queued in self._jobs if queued.state not in FINISHED_STATES)
+
+    def wait(self, timeout=None):
+        """Block until every job has finished; returns False on timeout"""
+        with self._idle:
+            return self._idle.wait_for(
+                lambda: all(queued.state in FINISHED_STATES for queued in self._jobs), timeout
+            )
+
+    def _report(self, queued, **values):
+        for name, value in values.items():
+            setattr(queued, name, value)
+        self._notify(queued)
+
+    def _notify(self, queued):
+        if self.on_change:
+            self.on_change(queued)
+
+    def _exclusive_devices(self, devices):
+        """Return the devices that must not be shared with another running job"""
+        exclusive = set()
+        for device in devices:
+            if device not in self._solid_state:
+                self._solid_state[device] = _is_solid_state(device)
+            if not self._solid_state[device]:
+                exclusive.add(device)
+        return exclusive
+
+    def _next_job(self):
+        """Return the best waiting job whose disks are free, or None"""
+        best = None
+        for queued in self._jobs:
+            if queued.state != QUEUED:
+                continue
+            if not queued.devices:
+                queued.devices = self._exclusive_devices(job_devices(queued.job))
+            if queued.devices & self._busy_devices.keys():
+                continue
+            if best is None or queued.priority > best.priority:
+                best = queued
+        return best
+
+    def _schedule(self):
+        started = []
+        with self._lock:
+            running = sum(1 for queued in self._jobs if queued.state == RUNNING)
+            while running < self.max_running:
+                queued = self._next_job()
+                if queued is None:
+                    break
+                queued.state = RUNNING
+                queued.message = "Starting..."
+                for device in queued.devices:
+                    self._busy_devices[device] = queued
+                running += 1
+                started.append(queued)
+        for queued in started:
+            self._notify(queued)
+            threading.Thread(target=self._run, args=(queued,), daemon=True).start()
+
+    def _run(self, queued):
+        try:
+            queued.job.run()
+            state, message = DONE, "Completed"
+            summary = queued.job.sniffer.stats.summary()
+            if summary:
+                message += f". {summary}"
+        except OperationCancelled:
+            state, message = CANCELLED, "Cancelled"
+        except Exception as e:
+            state, message = FAILED, f"Error: {e}"
+        with self._lock:
+            queued.state = state
+            queued.message = message
+            if state == DONE:
+                queued.progress = 100
+            for device in queued.devices:
+                if self._busy_devices.get(device) is queued:
+                    del self._busy_devices[device]
+            self._idle.notify_all()
+        self._notify(queued)
+        self._schedule()
@@ -0,0 +1,130 @@
+from PySide6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QTableWidget, QTableWidgetItem, QProgressBar, QHeaderView,
+    QAbstractItemView, QLabel
+)
+from PySide6.QtCore import Qt, Signal, Slot
+
+from job_queue import RUNNING
+from progress_tracker import format_throughput
+
+
+class JobQueueDialog(QDialog):
+    """Non-modal view of a JobQueue: one row per job with its priority, state and progress"""
+    job_changed = Signal(object)
+
+    COLUMNS = ["Archive", "Priority", "State", "Progress", "Details"]
+
+    def __init__(self, job_queue, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Job Queue")
+        self.setMinimumSize(800, 400)
+
+        self.job_queue = job_queue
+        self.rows = {}
+        self.jobs = {}
+
+        layout = QVBoxLayout()
+
+        self.summary_label = QLabel("")
+        layout.addWidget(self.summary_label)
+
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+        header = self.table.horizontalHeader()
+        header.setSectionResizeMode(0, QHeaderView.ResizeMode.Interactive)
+        header.setSectionResizeMode(4, QHeaderView.ResizeMode.Stretch)
+        self.table.setColumnWidth(0, 220)
+        layout.addWidget(self.table)
+
+        button_layout = QHBoxLayout()
+        raise_button = QPushButton("Raise Priority")
+        lower_button = QPushButton("Lower Priority")
+        cancel_button = QPushButton("Cancel Job")
+        cancel_all_button = QPushButton("Cancel All")
+        clear_button = QPushButton("Clear Finished")
+        close_button = QPushButton("Close")
+
+        raise_button.clicked.connect(lambda: self.change_priority(1))
+        lower_button.clicked.connect(lambda: self.change_priority(-1))
+        cancel_button.clicked.connect(self.cancel_selected)
+        cancel_all_button.clicked.connect(self.job_queue.cancel_all)
+        clear_button.clicked.connect(self.clear_finished)
+        close_button.clicked.connect(self.hide)
+
+        button_layout.addWidget(raise_button)
+        button_layout.addWidget(lower_button)
+        button_layout.addWidget(cancel_button)
+        button_layout.addWidget(cancel_all_button)
+        button_layout.addWidget(clear_button)
+        button_layout.addStretch()
+        button_layout.addWidget(close_button)
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+
+        # The queue reports from its worker threads; the signal carries each
+        # change over to the GUI thread.
+        self.job_changed.connect(self.update_job)
+        self.job_queue.on_change = self.job_changed.emit
+        for queued in self.job_queue.jobs():
+            self.update_job(queued)
+
+    @Slot(object)
+    def update_job(self, queued):
+        row = self.rows.get(queued.id)
+        if row is None:
+            if queued not in self.job_queue.jobs():
+                return
+            row = self.table.rowCount()
+            self.table.insertRow(row)
+            self.rows[queued.id] = row
+            self.jobs[queued.id] = queued
+            name_item = QTableWidgetItem(queued.label)
+            name_item.setData(Qt.ItemDataRole.UserRole, queued.id)
+            name_item.setToolTip(queued.job.destination)
+            self.table.setItem(row, 0, name_item)
+            for column in (1, 2, 4):
+                self.table.setItem(row, column, QTableWidgetItem(""))
+            progress_bar = QProgressBar()
+            progress_bar.setRange(0, 100)
+            self.table.setCellWidget(row, 3, progress_bar)
+
+        self.table.item(row, 1).setText(str(queued.priority))
+        self.table.item(row, 2).setText(queued.state.capitalize())
+        self.table.cellWidget(row, 3).setValue(queued.progress)
+        details = queued.message
+        if queued.state == RUNNING and queued.rate > 0:
+            details = f"{format_throughput(queued.rate, queued.eta)} - {queued.message}"
+        self.table.item(row, 4).setText(details)
+        self.update_summary()
+
+    def update_summary(self):
+        counts = {}
+        for queued in self.jobs.values():
+            counts[queued.state] = counts.get(queued.state, 0) + 1
+        self.summary_label.setText(", ".join(f"{count} {state}" for state, count in sorted(counts.items())))
+
+    def selected_jobs(self):
+        selected = []
+        for index in self.table.selectionModel().selectedRows():
+            job_id = self.table.item(index.row(), 0).data(Qt.ItemDataRole.UserRole)
+            selected.append(self.jobs[job_id])
+        return selected
+
+    def change_priority(self, step):
+        for queued in self.selected_jobs():
+            self.job_queue.set_priority(queued, queued.priority + step)
+
+    def cancel_selected(self):
+        for queued in self.selected_jobs():
+            self.job_queue.cancel(queued)
+
+    def clear_finished(self):
+        self.job_queue.clear_finished()
+        self.table.setRowCount(0)
+        self.rows.clear()
+        self.jobs.clear()
+        for queued in self.job_queue.jobs():
+            self.update_job(queued)
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""Command-line front end for LawranZip: create, extract, list and test archives without the GUI"""
+import os
+import sys
+import time
+import signal
+import getpass
+import argparse
+
+from archive_engine import ArchiveJob, CREATE_EXTENSIONS, list_archive, test_archive, is_password_error
+from backup import BackupJob, RestoreJob
+from cancellation import OperationCancelled
+from content_sniffer import format_bytes
+from profiles import PROFILES, DEFAULT_PROFILE, DEFAULT_BLOCK_SIZE, ZIP_METHODS
+from progress_tracker import format_throughput
+from volumes import parse_volume_size
+
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_USAGE = 2
+EXIT_PASSWORD = 3
+EXIT_CANCELLED = 130
+
+
+class ConsoleProgress:
+    """Draw job progress on one stderr line when stderr is a terminal"""
+
+    def __init__(self, quiet=False):
+        self.enabled = not quiet and sys.stderr.isatty()
+        self.percent = 0
+        self.text = ""
+
+    def on_progress(self, percent):
+        self.percent = percent
+        self.draw()
+
+    def on_throughput(self, rate, eta):
+        self.text = format_throughput(rate, eta)
+        self.draw()
+
+    def draw(self):
+        if self.enabled:
+            sys.stderr.write(f"\r{self.percent:3d}% {self.text}".ljust(60))
+            sys.stderr.flush()
+
+    def done(self):
+        if self.enabled:
+            sys.stderr.write("\n")
+            sys.stderr.flush()
+
+
+def get_password(args):
+    if args.password is None and args.ask_password:
+        return getpass.getpass("Password: ")
+    return args.password
+
+
+def run_job(args, job):
+    """Run job, cancelling it cleanly on Ctrl+C, and return an exit code"""
+    progress = ConsoleProgress(args.quiet)
+    job.on_progress = progress.on_progress
+    job.on_throughput = progress.on_throughput
+    previous = signal.signal(signal.SIGINT, lambda signum, frame: job.cancel())
+    try:
+        job.run()
+    except OperationCancelled:
+        progress.done()
+        print("lawranzip: cancelled", file=sys.stderr)
+        return EXIT_CANCELLED
+    finally:
+        signal.signal(signal.SIGINT, previous)
+    progress.done()
+    if not args.quiet:
+        summary = job.sniffer.stats.summary()
+        if summary:
+            print(summary, file=sys.stderr)
+    return EXIT_OK
+
+
+def cmd_create(args):
+    if not args.archive.lower().endswith(CREATE_EXTENSIONS):
+        raise Exception(f"Unsupported archive format for creation: {args.archive}")
+    for path in args.files:
+        if not os.path.exists(path):
+            raise Exception(f"No such file or directory: {path}")
+    job = ArchiveJob('create', None, args.archive, password=get_password(args),
+                     files_to_add=[os.path.abspath(path) for path in args.files],
+                     block_size=int(args.block_size * 1024 * 1024), profile=args.level,
+                     volume_size=args.volume_size, zip_method=args.zip_method)
+    return run_job(args, job)
+
+
+def cmd_update(args):
+    if not args.files and not args.delete:
+        raise Exception("Nothing to add or delete")
+    for path in args.files:
+        if not os.path.exists(path):
+            raise Exception(f"No such file or directory: {path}")
+    job = ArchiveJob('update', None, args.archive, password=get_password(args),
+                     files_to_add=[os.path.abspath(path) for path in args.files],
+                     files_to_remove=args.delete, profile=args.level, zip_method=args.zip_method)
+    return run_job(args, job)
+
+
+def cmd_backup(args):
+    if not args.archive.lower().endswith(CREATE_EXTENSIONS):
+        raise Exception(f"Unsupported archive format for creation: {args.archive}")
+    for path in args.sources:
+        if not os.path.exists(path):
+            raise Exception(f"No such file or directory: {path}")
+    if args.incremental:
+        mode, previous = 'incremental', args.incremental
+    elif args.differential:
+        mode, previous = 'differential', args.differential
+    else:
+        mode, previous = 'full', None
+    job = BackupJob(args.archive, args.sources, mode, previous, password=get_password(args), profile=args.level,
+                    volume_size=args.volume_size)
+    code = run_job(args, job)
+    if code == EXIT_OK and not args.quiet:
+        print(f"{mode} backup: {len(job.manifest.packed)} of {len(job.manifest.files)} files packed", file=sys.stderr)
+    return code
+
+
+def cmd_restore(args):
+    destination = args.output or os.getcwd()
+    os.makedirs(destination, exist_ok=True)
+    return run_job(args, RestoreJob(args.archive, destination, password=get_password(args)))
+
+
+def cmd_extract(args):
+    destination = args.output or os.getcwd()
+    os.makedirs(destination, exist_ok=True)
+    job = ArchiveJob('extract', args.archive, destination, password=get_password(args),
+                     files_to_extract=args.members)
+    return run_job(args, job)
+
+
+def cmd_list(args):
+    listing = list_archive(args.archive, get_password(args))
+    for i, name in enumerate(listing.names):
+        if listing.is_dir(i) and not name.endswith('/'):
+            name += '/'
+        mtime = listing.mtime[i]
+        modified = time.strftime('%Y-%m-%d %H:%M', time.localtime(mtime)) if mtime else ''
+        print(f"{listing.size[i]:>14} {listing.compressed_size[i]:>14} {modified:>16}  {name}")
+    if not args.quiet:
+        print(f"{len(listing)} entries, {format_bytes(listing.total_size())}", file=sys.stderr)
+    return EXIT_OK
+
+
+def cmd_test(args):
+    on_file = None if args.quiet else (lambda name: print(f"Testing: {name}", file=sys.stderr))
+    problems = test_archive(args.archive, get_password(args), on_file)
+    for problem in problems:
+        print(problem)
+    if problems:
+        return EXIT_ERROR
+    if not args.quiet:
+        print("Everything is OK", file=sys.stderr)
+    return EXIT_OK
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='lawranzip', description="Create, extract, list and test archives.")
+    parser.add_argument('-q', '--quiet', action='store_true', help="only print errors and listings")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_password_options(command):
+        command.add_argument('-p', '--password', help="archive password")
+        command.add_argument('--ask-password', action='store_true', help="prompt for the password")
+
+    create = commands.add_parser('create', help="create an archive from files and folders")
+    add_password_options(create)
+    create.add_argument('-l', '--level', choices=PROFILES, default=DEFAULT_PROFILE,
+                        help=f"compression profile (default: {DEFAULT_PROFILE})")
+    create.add_argument('--block-size', type=float, default=DEFAULT_BLOCK_SIZE / (1024 * 1024), metavar='MB',
+                        help="7-Zip solid block size in MB, 0 for one solid block (default: %(default)g)")
+    create.add_argument('-m', '--zip-method', choices=ZIP_METHODS,
+                        help="compress ZIP members with this method at the profile's level instead of "
+                             "Deflate or LZMA; zstd is ZIP method 93")
+    create.add_argument('-v', '--volume-size', type=parse_volume_size, metavar='SIZE',
+                        help="split the archive into volumes NAME.001, NAME.002, ... of SIZE bytes each "
+                             "(suffix k, m or g for KiB, MiB or GiB)")
+    create.add_argument('archive', help="archive to create: " + ", ".join(CREATE_EXTENSIONS))
+    create.add_argument('files', nargs='+', help="files and folders to add")
+    create.set_defaults(func=cmd_create)
+
+    update = commands.add_parser('update', help="add files to a ZIP archive, replacing members of the same name, "
+                                                "or delete members, without recompressing the rest")
+    add_password_options(update)
+    update.add_argument('-l', '--level', choices=PROFILES, default=DEFAULT_PROFILE,
+                        help=f"compression profile for added files (default: {DEFAULT_PROFILE})")
+    update.add_argument('-m', '--zip-method', choices=ZIP_METHODS,
+                        help="compress added files with this method instead of Deflate or LZMA")
+    update.add_argument('-d', '--delete', action='append', default=[], metavar='MEMBER',
+                        help="member or folder to delete; may be given more than once")
+    update.add_argument('archive')
+    update.add_argument('files', nargs='*', help="files and folders to add")
+    update.set_defaults(func=cmd_update)
+
+    backup = commands.add_parser('backup', help="back up files and folders, or only what changed since an "
+                                                "earlier backup, with a manifest next to the archive")
+    add_password_options(backup)
+    backup.add_argument('-l', '--level', choices=PROFILES, default=DEFAULT_PROFILE,
+                        help=f"compression profile (default: {DEFAULT_PROFILE})")
+    backup.add_argument('-v', '--volume-size', type=parse_volume_size, metavar='SIZE',
+                        help="split the archive into volumes of SIZE bytes each")
+    since = backup.add_mutually_exclusive_group()
+    since.add_argument('-i', '--incremental', metavar='PREVIOUS',
+                       help="only pack what changed since the backup PREVIOUS")
+    since.add_argument('-d', '--differential', metavar='PREVIOUS',
+                       help="only pack what changed since the full backup that PREVIOUS builds on")
+    backup.add_argument('archive', help="archive to create: " + ", ".join(CREATE_EXTENSIONS))
+    backup.add_argument('sources', nargs='+', help="files and folders to back up")
+    backup.set_defaults(func=cmd_backup)
+
+    restore = commands.add_parser('restore', help="restore a backup from its archive and the ones it builds on")
+    add_password_options(restore)
+    restore.add_argument('-o', '--output', help="destination folder (default: current folder)")
+    restore.add_argument('archive')
+    restore.set_defaults(func=cmd_restore)
+
+    extract = commands.add_parser('extract', help="extract all or some members of an archive")
+    add_password_options(extract)
+    extract.add_argument('-o', '--output', help="destination folder (default: current folder)")
+    extract.add_argument('archive')
+    extract.add_argument('members', nargs='*', help="members or folders to extract (default: all)")
+    extract.set_defaults(func=cmd_extract)
+
+    list_command = commands.add_parser('list', help="list archive contents: size, packed size, modified, name")
+    add_password_options(list_command)
+    list_command.add_argument('archive')
+    list_command.set_defaults(func=cmd_list)
+
+    test = commands.add_parser('test', help="decompress every member and verify its checksum")
+    add_password_options(test)
+    test.add_argument('archive')
+    test.set_defaults(func=cmd_test)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command not in ('create', 'backup') and not os.path.isfile(args.archive):
+        print(f"lawranzip: no such archive: {args.archive}", file=sys.stderr)
+        return EXIT_USAGE
+    try:
+        return args.func(args)
+    except KeyboardInterrupt:
+        print("lawranzip: cancelled", file=sys.stderr)
+        return EXIT_CANCELLED
+    except Exception as e:
+        print(f"lawranzip: {e}", file=sys.stderr)
+        return EXIT_PASSWORD if is_password_error(str(e)) else EXIT_ERROR
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+import os
+import sys
+import time
+import zlib
+from array import array
+
+from archive_listing import ArchiveListing
+
+# Least recently used listings are dropped once the stored listings take more
+# than this much space.
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+# Bump when the stored layout changes; older caches are then discarded.
+CACHE_VERSION = 2
+
+
+def user_cache_dir():
+    """Return the per-user cache folder for LawranZip"""
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~/AppData/Local')
+        return os.path.join(base, 'LawranZip', 'Cache')
+    if sys.platform == 'darwin':
+        return os.path.expanduser('~/Library/Caches/LawranZip')
+    return os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'lawranzip')
+
+
+def _archive_key(archive_path):
+    """Return the cache key of an archive: its real path, size, modification time and inode"""
+    path = os.path.realpath(archive_path)
+    stat = os.stat(path)
+    return path, stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+class ListingCache:
+    """SQLite store of archive listings keyed by (path, size, mtime, inode).
+
+    A listing is kept as its zlib-compressed columns, so loading it back is
+    a few bulk copies rather than a parse of the archive. Any change to the
+    archive file changes its key and the stale row is replaced on the next
+    listing. The cache is best effort: if the database cannot be used the
+    archive is simply read again.
+    """
+
+    def __init__(self, path=None, max_bytes=MAX_CACHE_BYTES):
+        self.path = path or os.path.join(user_cache_dir(), 'listings.sqlite')
+        self.max_bytes = max_bytes
+
+    def _connect(self):
+        import sqlite3
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=5)
+        if connection.execute("PRAGMA user_version").fetchone()[0] != CACHE_VERSION:
+            connection.execute("DROP TABLE IF EXISTS listings")
+            connection.execute("PRAGMA user_version = %d" % CACHE_VERSION)
+        # Only takes effect on a new database, where it lets evictions shrink the file.
+        connection.execute("PRAGMA auto_vacuum = FULL")
+        connection.execute("""CREATE TABLE IF NOT EXISTS listings (
+            path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER,
+            names BLOB, sizes BLOB, compressed_sizes BLOB, mtimes BLOB, flags BLOB, offsets BLOB,
+            bytes INTEGER, last_used REAL)""")
+        return connection
+
+    def load(self, archive_path):
+        """Return the cached ArchiveListing of an unchanged archive, or None"""
+        import sqlite3
+        try:
+            path, size, mtime_ns, inode = _archive_key(archive_path)
+            connection = self._connect()
+            try:
+                with connection:
+                    row = connection.execute(
+                        "SELECT names, sizes, compressed_sizes, mtimes, flags, offsets FROM listings "
+                        "WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ?",
+                        (path, size, mtime_ns, inode)).fetchone()
+                    if row is None:
+                        return None
+                    connection.execute("UPDATE listings SET last_used = ? WHERE path = ?", (time.time(), path))
+            finally:
+                connection.close()
+        except (OSError, sqlite3.Error):
+            return None
+
+        names, sizes, compressed_sizes, mtimes, flags, offsets = (zlib.decompress(blob) for blob in row)
+        listing = ArchiveListing()
+        if names:
+            listing.names = names.decode('utf-8', 'surrogateescape').split('\0')
+        listing.size = array('q', sizes)
+        listing.compressed_size = array('q', compressed_sizes)
+        listing.mtime = array('d', mtimes)
+        listing.flags = bytearray(flags)
+        listing.offset = array('q', offsets)
+        return listing if len(listing.names) == len(listing.flags) else None
+
+    def store(self, archive_path, listing):
+        """Remember the listing of an archive, then drop the least recently used ones over the size cap"""
+        import sqlite3
+        blobs = [zlib.compress(data, 1) for data in (
+            '\0'.join(listing.names).encode('utf-8', 'surrogateescape'),
+            listing.size.tobytes(), listing.compressed_size.tobytes(), listing.mtime.tobytes(),
+            bytes(listing.flags), listing.offset.tobytes())]
+        total = sum(len(blob) for blob in blobs)
+        if total > self.max_bytes:
+            return
+        try:
+            key = _archive_key(archive_path)
+            connection = self._connect()
+            try:
+                with connection:
+                    connection.execute("INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                       (*key, *blobs, total, time.time()))
+                    self._evict(connection)
+            finally:
+                connection.close()
+        except (OSError, sqlite3.Error):
+            pass
+
+    def _evict(self, connection):
+        used = 0
+        stale = []
+        for path, size in connection.execute("SELECT path, bytes FROM listings ORDER BY last_used DESC"):
+            used += size
+            if used > self.max_bytes:
+                stale.append((path,))
+        connection.executemany("DELETE FROM listings WHERE path = ?", stale)
+
+    def clear(self):
+        """Forget every cached listing"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -1,20 +1,39 @@
 import os
+import re
+import time
 from datetime import datetime
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QPushButton, QFileDialog, QTreeWidget, QTreeWidgetItem, QLabel,
     QMessageBox, QProgressBar, QHeaderView, QDialog,
-    QLineEdit, QStyle, QFileIconProvider, QTreeWidgetItemIterator
+    QLineEdit, QStyle, QInputDialog, QTreeView
 )
-from PySide6.QtCore import Slot, Qt, QSize, QFileInfo
+from PySide6.QtCore import Slot, Qt, QSize, QTimer
 from PySide6.QtGui import QAction, QIcon
 
 from password_dialog import PasswordDialog
 from worker import WorkerThread
-from archive_viewer import ArchiveListThread
+from archive_engine import ArchiveJob
+from job_queue import JobQueue
+from job_queue_dialog import JobQueueDialog
+from profiles import DEFAULT_BLOCK_SIZE, DEFAULT_PROFILE
+from compression_options_dialog import CompressionOptionsDialog
+from archive_viewer import ArchiveListThread, SearchIndexThread
+from archive_tree_model import ArchiveTreeModel
+from archive_index import ArchiveIndex
+from archive_search import ArchiveSearchIndex
+from directory_scanner import DirectoryScanThread, directory_sort_key
 from file_browser_dialog import FileBrowserDialog
+from icon_cache import ICON_CACHE, file_type
 from theme import get_dark_theme_palette, get_light_theme_palette, get_aurora_theme_palette, get_stylesheet
 from progress_dialog import ProgressDialog
+from progress_tracker import format_throughput
+from volumes import output_path
+
+# The archive filter is applied once typing pauses for this long, in ms.
+SEARCH_DELAY = 150
+# Search results with at most this many matches are shown expanded.
+SEARCH_EXPAND_LIMIT = 200
 
 
 class MainWindow(QMainWindow):
@@ -26,9 +45,21 @@ class MainWindow(QMainWindow):
         self.current_archive = None
         self.worker_thread = None
         self.list_thread = None
+        self.scan_thread = None
+        self.retired_threads = []
+        self.scanned_items = []
+        self.scanned_keys = []
+        self.scanned_batches = 0
+        self.checked_files = {}
+        self.icon_cache = ICON_CACHE
+        self.archive_model = None
+        self.archive_search = None
+        self.search_thread = None
         self.progress_dialog = None
-        self.icon_provider = QFileIconProvider()
+        self.job_queue = JobQueue()
+        self.job_queue_dialog = None
 
+        self.icon_cache.preload()
         self.init_ui()
         self.create_menu()
         self.set_theme('aurora')
@@ -83,6 +114,17 @@ class MainWindow(QMainWindow):
         location_layout.addWidget(location_label)
         location_layout.addWidget(self.location_bar)
 
+        self.search_box = QLineEdit()
+        self.search_box.setPlaceholderText("Search archive: text, *.glob or re:regex")
+        self.search_box.setClearButtonEnabled(True)
+        self.search_box.setVisible(False)
+        self.search_box.textChanged.connect(self.on_search_text_changed)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DELAY)
+        self.search_timer.timeout.connect(self.apply_archive_filter)
+        location_layout.addWidget(self.search_box)
+
         self.file_tree = QTreeWidget()
         self.file_tree.setHeaderLabels(["Name", "Size", "Type", "Modified"])
         header = self.file_tree.header()
@@ -94,15 +136,28 @@ class MainWindow(QMainWindow):
         self.file_tree.itemActivated.connect(self.handle_item_activated)
         self.file_tree.itemSelectionChanged.connect(self.on_item_selection_changed)
 
+        # Archive contents get their own view over a lazy model, so that huge
+        # archives never turn into one widget item per entry.
+        self.archive_tree = QTreeView()
+        self.archive_tree.setUniformRowHeights(True)
+        self.archive_tree.setVisible(False)
+
         self.progress_bar = QProgressBar()
         self.progress_bar.setVisible(False)
+        self.cancel_btn = QPushButton("Cancel")
+        self.cancel_btn.setVisible(False)
+        self.cancel_btn.clicked.connect(self.cancel_operation)
+        progress_layout = QHBoxLayout()
+        progress_layout.addWidget(self.progress_bar)
+        progress_layout.addWidget(self.cancel_btn)
 
         self.status_label = QLabel("Ready")
 
         main_layout.addLayout(button_layout)
         main_layout.addLayout(location_layout)
         main_layout.addWidget(self.file_tree)
-        main_layout.addWidget(self.progress_bar)
+        main_layout.addWidget(self.archive_tree)
+        main_layout.addLayout(progress_layout)
         main_layout.addWidget(self.status_label)
 
         central_widget.setLayout(main_layout)
@@ -176,10 +231,33 @@ class MainWindow(QMainWindow):
         tar_xz_action = QAction(self.tar_xz_icon, "Create TAR.XZ Archive", self)
         tar_xz_action.triggered.connect(self.create_tar_xz_archive)
         file_menu.addAction(tar_xz_action)
+        tar_zst_action = QAction("Create TAR.ZST Archive (fast)", self)
+        tar_zst_action.triggered.connect(self.create_tar_zst_archive)
+        file_menu.addAction(tar_zst_action)
+        tar_lz4_action = QAction("Create TAR.LZ4 Archive (fastest)", self)
+        tar_lz4_action.triggered.connect(self.create_tar_lz4_archive)
+        file_menu.addAction(tar_lz4_action)
+        dedup_action = QAction("Create Dedup Archive (.ldz)", self)
+        dedup_action.triggered.connect(self.create_dedup_archive)
+        file_menu.addAction(dedup_action)
         extract_action = QAction(self.extract_icon, "Extract Archive", self)
         extract_action.triggered.connect(self.extract_archive)
         file_menu.addAction(extract_action)
         file_menu.addSeparator()
+        add_to_archive_action = QAction("Add Files to ZIP Archive...", self)
+        add_to_archive_action.triggered.connect(self.add_to_archive)
+        file_menu.addAction(add_to_archive_action)
+        delete_from_archive_action = QAction("Delete Checked from ZIP Archive", self)
+        delete_from_archive_action.triggered.connect(self.delete_from_archive)
+        file_menu.addAction(delete_from_archive_action)
+        file_menu.addSeparator()
+        batch_action = QAction("Batch Compress Checked Items...", self)
+        batch_action.triggered.connect(self.batch_compress)
+        file_menu.addAction(batch_action)
+        queue_action = QAction("Job Queue", self)
+        queue_action.triggered.connect(self.show_job_queue)
+        file_menu.addAction(queue_action)
+        file_menu.addSeparator()
         exit_action = QAction("Exit", self)
         exit_action.triggered.connect(self.close)
         file_menu.addAction(exit_action)
@@ -207,7 +285,8 @@ class MainWindow(QMainWindow):
         app.setStyleSheet(get_stylesheet(theme))
 
     def get_supported_read_extensions(self):
-        return ['7z', 'bz2', 'gz', 'rar', 'tar', 'tbz2', 'tgz', 'txz', 'xz', 'zip', 'zipx', 'jar']
+        # .001 is the first volume of a split archive.
+        return ['7z', 'bz2', 'gz', 'rar', 'tar', 'tbz2', 'tgz', 'txz', 'xz', 'zip', 'zipx', 'jar', 'zst', 'tzst', 'lz4', 'ldz', '001']
 
     def create_zip_archive(self):
         files_to_add = self.get_checked_items()
@@ -223,6 +302,10 @@ class MainWindow(QMainWindow):
         if not save_path.lower().endswith('.zip'):
             save_path += '.zip'
 
+        options_dialog = CompressionOptionsDialog(self, show_zip_method=True)
+        if options_dialog.exec() != QDialog.DialogCode.Accepted:
+            return
+
         password = None
         use_password = QMessageBox.question(
             self, "Password Protection",
@@ -239,7 +322,9 @@ class MainWindow(QMainWindow):
             else:
                 return
 
-        self.start_compression_task('create', None, save_path, password, files_to_add=files_to_add)
+        self.start_compression_task('create', None, save_path, password, files_to_add=files_to_add,
+                                    profile=options_dialog.get_profile(), volume_size=options_dialog.get_volume_size(),
+                                    zip_method=options_dialog.get_zip_method())
 
     def create_7zip_archive(self):
         files_to_add = self.get_checked_items()
@@ -255,6 +340,10 @@ class MainWindow(QMainWindow):
         if not save_path.lower().endswith('.7z'):
             save_path += '.7z'
 
+        options_dialog = CompressionOptionsDialog(self, show_block_size=True)
+        if options_dialog.exec() != QDialog.DialogCode.Accepted:
+            return
+
         password = None
         use_password = QMessageBox.question(
             self, "Password Protection",
@@ -271,23 +360,167 @@ class MainWindow(QMainWindow):
             else:
                 return
 
-        self.start_compression_task('create', None, save_path, password, files_to_add=files_to_add)
+        self.start_compression_task('create', None, save_path, password, files_to_add=files_to_add,
+                                    block_size=options_dialog.get_block_size(), profile=options_dialog.get_profile(),
+                                    volume_size=options_dialog.get_volume_size())
 
     def create_tar_xz_archive(self):
+        self.create_tarball("TAR.XZ", '.tar.xz')
+
+    def create_tar_zst_archive(self):
+        self.create_tarball("TAR.ZST", '.tar.zst')
+
+    def create_tar_lz4_archive(self):
+        self.create_tarball("TAR.LZ4", '.tar.lz4')
+
+    def create_tarball(self, label, extension):
+        files_to_add = self.get_checked_items()
+        if not files_to_add:
+            QMessageBox.warning(self, "No Files Selected", "Please select files or folders to add to the archive.")
+            return
+
+        save_path, _ = QFileDialog.getSaveFileName(self, f"Save {label} Archive", "", f"{label} Archive (*{extension})")
+
+        if not save_path:
+            return
+
+        if not save_path.lower().endswith(extension):
+            save_path += extension
+
+        options_dialog = CompressionOptionsDialog(self)
+        if options_dialog.exec() != QDialog.DialogCode.Accepted:
+            return
+
+        self.start_compression_task('create', None, save_path, files_to_add=files_to_add,
+                                    profile=options_dialog.get_profile(), volume_size=options_dialog.get_volume_size())
+
+    def create_dedup_archive(self):
+        """Create an archive that stores content repeated across the checked files only once"""
         files_to_add = self.get_checked_items()
         if not files_to_add:
             QMessageBox.warning(self, "No Files Selected", "Please select files or folders to add to the archive.")
             return
 
-        save_path, _ = QFileDialog.getSaveFileName(self, "Save TAR.XZ Archive", "", "TAR.XZ Archive (*.tar.xz)")
+        save_path, _ = QFileDialog.getSaveFileName(self, "Save Dedup Archive", "", "Dedup Archive (*.ldz)")
 
         if not save_path:
             return
 
-        if not save_path.lower().endswith('.tar.xz'):
-            save_path += '.tar.xz'
+        if not save_path.lower().endswith('.ldz'):
+            save_path += '.ldz'
+
+        options_dialog = CompressionOptionsDialog(self)
+        if options_dialog.exec() != QDialog.DialogCode.Accepted:
+            return
+
+        self.start_compression_task('create', None, save_path, files_to_add=files_to_add,
+                                    profile=options_dialog.get_profile(), volume_size=options_dialog.get_volume_size())
+
+    def can_update_current_archive(self):
+        if self.current_archive is None or not self.current_archive.lower().endswith('.zip'):
+            QMessageBox.warning(self, "No ZIP Archive Open",
+                                "Open a ZIP archive to add files to it or delete members from it.")
+            return False
+        return True
 
-        self.start_compression_task('create', None, save_path, files_to_add=files_to_add)
+    def add_to_archive(self):
+        """Add files to the open ZIP archive; members it already holds are not recompressed"""
+        if not self.can_update_current_archive():
+            return
+        browser = FileBrowserDialog(self)
+        if browser.exec() != QDialog.DialogCode.Accepted:
+            return
+        files_to_add = browser.get_selected_paths()
+        if not files_to_add:
+            return
+        self.start_compression_task('update', None, self.current_archive, files_to_add=files_to_add)
+
+    def delete_from_archive(self):
+        if not self.can_update_current_archive():
+            return
+        files_to_remove = self.get_checked_items()
+        if not files_to_remove:
+            QMessageBox.warning(self, "No Files Selected", "Please check the members to delete from the archive.")
+            return
+        answer = QMessageBox.question(
+            self, "Delete from Archive",
+            f"Delete {len(files_to_remove)} checked item(s) from {os.path.basename(self.current_archive)}?",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+        )
+        if answer != QMessageBox.StandardButton.Yes:
+            return
+        self.start_compression_task('update', None, self.current_archive, files_to_remove=files_to_remove)
+
+    BATCH_FORMATS = {
+        "ZIP (.zip)": '.zip',
+        "7-Zip (.7z)": '.7z',
+        "TAR.XZ (.tar.xz)": '.tar.xz',
+        "TAR.ZST (.tar.zst)": '.tar.zst',
+        "TAR.LZ4 (.tar.lz4)": '.tar.lz4',
+        "Dedup (.ldz)": '.ldz',
+    }
+
+    def batch_compress(self):
+        """Queue one archive per checked file or folder"""
+        items = self.get_checked_items() if self.current_archive is None else []
+        if not items:
+            QMessageBox.warning(self, "No Files Selected",
+                                "Please check the files or folders to compress, each into its own archive.")
+            return
+
+        label, ok = QInputDialog.getItem(self, "Batch Compress", "Archive format:", list(self.BATCH_FORMATS), 0, False)
+        if not ok:
+            return
+        extension = self.BATCH_FORMATS[label]
+
+        options_dialog = CompressionOptionsDialog(self, show_block_size=extension == '.7z',
+                                                  show_zip_method=extension == '.zip')
+        if options_dialog.exec() != QDialog.DialogCode.Accepted:
+            return
+
+        output_dialog = FileBrowserDialog(self, directory_only=True)
+        if output_dialog.exec() != QDialog.DialogCode.Accepted:
+            return
+        output_paths = output_dialog.get_selected_paths()
+        if not output_paths:
+            return
+
+        for path in items:
+            name = os.path.basename(path.rstrip(os.sep))
+            destination = os.path.join(output_paths[0], name + extension)
+            count = 2
+            while os.path.exists(output_path(destination, options_dialog.get_volume_size())):
+                destination = os.path.join(output_paths[0], f"{name} ({count}){extension}")
+                count += 1
+            job = ArchiveJob('create', None, destination, files_to_add=[path],
+                             block_size=options_dialog.get_block_size(), profile=options_dialog.get_profile(),
+                             volume_size=options_dialog.get_volume_size(), zip_method=options_dialog.get_zip_method())
+            self.job_queue.submit(job)
+
+        self.status_label.setText(f"Queued {len(items)} archive(s)")
+        self.show_job_queue()
+
+    def show_job_queue(self):
+        if self.job_queue_dialog is None:
+            self.job_queue_dialog = JobQueueDialog(self.job_queue, self)
+        self.job_queue_dialog.show()
+        self.job_queue_dialog.raise_()
+
+    def closeEvent(self, event):
+        pending = self.job_queue.pending_count()
+        if pending:
+            answer = QMessageBox.question(
+                self, "Jobs Still Running",
+                f"{pending} queued job(s) have not finished. Cancel them and quit?",
+                QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+            )
+            if answer != QMessageBox.StandardButton.Yes:
+                event.ignore()
+                return
+            self.job_queue.cancel_all()
+            self.job_queue.wait(timeout=10)
+        self.close_archive_search()
+        super().closeEvent(event)
 
     def extract_archive(self):
         archive_to_extract = self.current_archive
@@ -336,72 +569,190 @@ class MainWindow(QMainWindow):
         return f"{size:.1f} {power_labels[n]}B"
 
     def get_file_type(self, filename):
-        _, ext = os.path.splitext(filename)
-        return ext[1:].upper() if ext else "File"
+        return file_type(filename)
+
+    def show_archive_view(self, visible):
+        self.archive_tree.setVisible(visible)
+        self.file_tree.setVisible(not visible)
+        self.search_box.setVisible(visible)
+        if not visible:
+            self.archive_tree.setModel(None)
+            self.archive_model = None
+            self.close_archive_search()
 
     def load_directory_contents(self, directory_path):
+        if self.cancel_listing():
+            self.progress_bar.setVisible(False)
+            self.cancel_btn.setVisible(False)
+            self.set_buttons_enabled(True)
+        self.cancel_directory_scan()
+        self.show_archive_view(False)
         self.file_tree.clear()
+        self.scanned_items = []
+        self.scanned_keys = []
+        self.scanned_batches = 0
+        self.checked_files = {}
         self.location_bar.setText(directory_path)
         self.current_archive = None
         self.extract_btn.setEnabled(False)
-        self.status_label.setText(f"Viewing: {directory_path}")
+        self.status_label.setText(f"Reading: {directory_path}")
+
+        # Names arrive first and sizes and dates follow, so a slow network
+        # folder shows what it contains long before every entry is stat'ed.
+        self.scan_thread = DirectoryScanThread(directory_path)
+        self.scan_thread.entries_found.connect(self.on_directory_entries_found)
+        self.scan_thread.names_done.connect(self.on_directory_names_done)
+        self.scan_thread.stats_found.connect(self.on_directory_stats_found)
+        self.scan_thread.finished.connect(self.on_directory_scan_finished)
+        self.scan_thread.start()
+
+    def cancel_directory_scan(self):
+        """Stop a directory scan that is still running"""
+        thread = self.scan_thread
+        self.scan_thread = None
+        self.retire_thread(thread)
+
+    def retire_thread(self, thread):
+        """Cancel a running list or scan thread and keep it referenced until it ends; return whether it was running"""
+        running = thread is not None and thread.isRunning()
+        if running:
+            thread.cancel()
+            # Its late signals are ignored because it is no longer the
+            # current thread of its kind.
+            self.retired_threads.append(thread)
+        self.retired_threads = [t for t in self.retired_threads if not t.isFinished()]
+        return running
+
+    @Slot(object)
+    def on_directory_entries_found(self, batch):
+        if self.sender() is not self.scan_thread:
+            return
+        # scanned_items and scanned_keys stay in scan order, which is how
+        # stats_found numbers the entries; only the view is sorted.
+        items = []
+        keys = []
+        for name, path, is_dir in batch:
+            icon, type_str = self.icon_cache.icon_and_type(path, is_dir)
+            item = QTreeWidgetItem([name, '', type_str, ''])
+            item.setIcon(0, icon)
+            item.setData(0, Qt.ItemDataRole.UserRole, path)
+            item.setData(0, Qt.ItemDataRole.UserRole + 1, is_dir)
+            item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+            item.setCheckState(0, Qt.CheckState.Unchecked)
+            items.append(item)
+            keys.append(directory_sort_key(name, is_dir))
+        self.scanned_items.extend(items)
+        self.scanned_keys.extend(keys)
+        self.scanned_batches += 1
+        self.file_tree.addTopLevelItems([items[i] for i in sorted(range(len(keys)), key=keys.__getitem__)])
 
-        try:
-            dirs, files = [], []
-            for entry in os.scandir(directory_path):
-                (dirs if entry.is_dir() else files).append(entry)
-
-            dirs.sort(key=lambda e: e.name.lower())
-            files.sort(key=lambda e: e.name.lower())
-
-            for entry in dirs + files:
-                file_info = QFileInfo(entry.path)
-                icon = self.icon_provider.icon(file_info)
-                name = entry.name
-                try:
-                    stat = entry.stat()
-                    size = stat.st_size
-                    modified = datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M')
-                except OSError:
-                    size, modified = 0, ''
-
-                size_str = self.format_size(size) if not file_info.isDir() else ''
-                type_str = self.icon_provider.type(file_info) or (self.get_file_type(name) if not file_info.isDir() else "Folder")
-
-                item = QTreeWidgetItem([name, size_str, type_str, modified])
-                item.setIcon(0, icon)
-                item.setData(0, Qt.ItemDataRole.UserRole, entry.path)
-                item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
-                item.setCheckState(0, Qt.CheckState.Unchecked)
-                self.file_tree.addTopLevelItem(item)
-
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Could not read directory '{directory_path}':\n{e}")
+    @Slot()
+    def on_directory_names_done(self):
+        if self.sender() is not self.scan_thread:
+            return
+        if self.scanned_batches > 1:
+            # Batches were sorted one at a time; put the whole folder in order.
+            keys = self.scanned_keys
+            self.file_tree.invisibleRootItem().takeChildren()
+            self.file_tree.addTopLevelItems(
+                [self.scanned_items[i] for i in sorted(range(len(keys)), key=keys.__getitem__)])
+        self.status_label.setText(f"Viewing: {self.scan_thread.directory_path}")
+        self.status_label.setToolTip(self.icon_cache.describe())
+
+    @Slot(object)
+    def on_directory_stats_found(self, batch):
+        if self.sender() is not self.scan_thread:
+            return
+        items = self.scanned_items
+        keys = self.scanned_keys
+        # With the model quiet, setText does not look up each item's row
+        # (a linear search in a big folder); one repaint covers the batch.
+        model = self.file_tree.model()
+        model.blockSignals(True)
+        for number, size, mtime in batch:
+            if size is None:
+                continue
+            item = items[number]
+            if keys[number][0]:
+                item.setText(1, self.format_size(size))
+            item.setText(3, datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M'))
+        model.blockSignals(False)
+        self.file_tree.viewport().update()
+
+    @Slot(bool, str)
+    def on_directory_scan_finished(self, success, error_message):
+        if self.sender() is not self.scan_thread:
+            return
+        directory_path = self.scan_thread.directory_path
+        self.scan_thread = None
+        if not success and error_message != "Scan cancelled":
+            self.status_label.setText(f"Viewing: {directory_path}")
+            QMessageBox.critical(self, "Error", f"Could not read directory '{directory_path}':\n{error_message}")
 
     def load_archive_contents(self, password=None):
         if not self.current_archive:
             return
 
-        self.file_tree.clear()
+        self.cancel_listing()
+        self.cancel_directory_scan()
+        self.show_archive_view(True)
+        self.archive_tree.setModel(None)
+        self.archive_model = None
+        self.close_archive_search()
+        self.search_box.clear()
         self.status_label.setText("Reading archive...")
         self.set_buttons_enabled(False)
         self.progress_bar.setVisible(True)
         self.progress_bar.setRange(0, 0)
+        self.cancel_btn.setVisible(True)
+        self.cancel_btn.setEnabled(True)
 
         self.list_thread = ArchiveListThread(self.current_archive, password)
+        self.list_thread.entries_added.connect(self.on_list_entries_added)
         self.list_thread.finished.connect(self.on_list_finished)
         self.list_thread.requires_password.connect(self.on_list_password_required)
         self.list_thread.start()
 
-    @Slot(bool, list, str)
-    def on_list_finished(self, success, file_list, error_message):
+    def cancel_listing(self):
+        """Stop an archive listing that is still running; return whether there was one"""
+        thread = self.list_thread
+        self.list_thread = None
+        return self.retire_thread(thread)
+
+    @Slot(object, int, int)
+    def on_list_entries_added(self, listing, count, percent):
+        if self.sender() is not self.list_thread:
+            return
+        if self.archive_model is None:
+            self.populate_tree(ArchiveIndex(listing, 0))
+        self.archive_model.entries_available(count)
+        if percent >= 0:
+            self.progress_bar.setRange(0, 100)
+            self.progress_bar.setValue(percent)
+        if not self.list_thread.cancel_token.is_cancelled():
+            self.status_label.setText(f"Reading archive... {count} items")
+
+    @Slot(bool, object, str)
+    def on_list_finished(self, success, listing, error_message):
+        if self.sender() is not self.list_thread:
+            return
         self.progress_bar.setVisible(False)
+        self.cancel_btn.setVisible(False)
         self.set_buttons_enabled(True)
 
         if success:
-            self.populate_tree(file_list)
-            self.status_label.setText(f"Archive loaded: {len(file_list)} items")
+            self.archive_model.listing_finished()
+            self.status_label.setText(f"Archive loaded: {len(listing)} items")
             self.extract_btn.setEnabled(True)
+        elif self.list_thread.cancel_token.is_cancelled():
+            # Keep what was read so far; it can be browsed and extracted.
+            read = 0
+            if self.archive_model:
+                read = len(self.archive_model.archive_index.listing)
+                self.archive_model.entries_available(read)
+                self.archive_model.listing_finished()
+            self.status_label.setText(f"Listing cancelled: {read} items read")
+            self.extract_btn.setEnabled(self.archive_model is not None)
         else:
             if "Password required" not in error_message:
                 QMessageBox.critical(self, "Error", error_message)
@@ -411,6 +762,8 @@ class MainWindow(QMainWindow):
 
     @Slot()
     def on_list_password_required(self):
+        if self.sender() is not self.list_thread:
+            return
         password_dialog = PasswordDialog(self)
         if password_dialog.exec() == QDialog.DialogCode.Accepted:
             password = password_dialog.get_password()
@@ -426,50 +779,69 @@ class MainWindow(QMainWindow):
             self.current_archive = None
             self.location_bar.clear()
 
-    def populate_tree(self, file_list):
-        self.file_tree.clear()
-        items = {'': self.file_tree.invisibleRootItem()}
-
-        for file_info in sorted(file_list, key=lambda x: x.get('name', '')):
-            path = file_info.get('name', '')
-            if not path:
-                continue
+    def populate_tree(self, archive_index):
+        self.archive_model = ArchiveTreeModel(archive_index, self.folder_icon, self.file_icon, self.format_size, self)
+        self.archive_model.indexing_finished.connect(self.on_archive_indexed)
+        self.archive_search = ArchiveSearchIndex(archive_index.listing)
+        self.archive_tree.setModel(self.archive_model)
+        header = self.archive_tree.header()
+        header.setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        header.setSectionResizeMode(1, QHeaderView.ResizeMode.Interactive)
+        header.setSectionResizeMode(2, QHeaderView.ResizeMode.Interactive)
+        header.setSectionResizeMode(3, QHeaderView.ResizeMode.Interactive)
+        header.setSortIndicator(0, Qt.SortOrder.AscendingOrder)
+        self.archive_tree.setSortingEnabled(True)
+
+    def close_archive_search(self):
+        """Drop the search index of the archive on show, stopping its build if it is running"""
+        self.search_timer.stop()
+        self.retire_thread(self.search_thread)
+        self.search_thread = None
+        if self.archive_search is not None:
+            self.archive_search.close()
+            self.archive_search = None
 
-            size = file_info.get('size', 0)
-            is_dir = file_info.get('is_dir', False)
-            path = path.replace('\\', '/').rstrip('/')
-            path_parts = path.split('/')
-
-            parent_path = ''
-            for i, part in enumerate(path_parts):
-                current_path = '/'.join(path_parts[:i + 1])
-                if current_path not in items:
-                    parent_item = items.get(parent_path, self.file_tree.invisibleRootItem())
-                    is_current_dir = (i < len(path_parts) - 1) or is_dir
-                    item_path_data = current_path + ('/' if is_current_dir else '')
-                    size_str = self.format_size(size) if not is_current_dir and size else ""
-                    type_str = "Folder" if is_current_dir else self.get_file_type(part)
-
-                    item = QTreeWidgetItem(parent_item, [part, size_str, type_str, ""])
-                    item.setIcon(0, self.folder_icon if is_current_dir else self.file_icon)
-                    item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
-                    item.setCheckState(0, Qt.CheckState.Unchecked)
-                    item.setData(0, Qt.ItemDataRole.UserRole, item_path_data)
-                    items[current_path] = item
-                parent_path = current_path
+    @Slot()
+    def on_archive_indexed(self):
+        if self.sender() is not self.archive_model:
+            return
+        # Every entry is in the tree now: index the paths for searching in
+        # the background, and show any matches among the late entries.
+        self.search_thread = SearchIndexThread(self.archive_search)
+        self.search_thread.start()
+        if self.search_box.text().strip():
+            self.apply_archive_filter()
+
+    def on_search_text_changed(self, text):
+        self.search_timer.start()
+
+    def apply_archive_filter(self):
+        if self.archive_model is None:
+            return
+        query = self.search_box.text().strip()
+        if not query:
+            self.archive_model.set_filter(None)
+            self.status_label.setText(f"Archive loaded: {len(self.archive_model.archive_index.listing)} items")
+            return
+        if self.search_thread is None:
+            # Still listing: search what is in the tree so far.
+            self.archive_search.update(self.archive_model.archive_index.indexed)
+        started = time.perf_counter()
+        try:
+            matches = self.archive_search.search(query)
+        except re.error as e:
+            self.status_label.setText(f"Invalid pattern: {e}")
+            return
+        elapsed = time.perf_counter() - started
+        self.archive_model.set_filter(matches)
+        if len(matches) <= SEARCH_EXPAND_LIMIT:
+            self.archive_tree.expandAll()
+        self.status_label.setText(f"{len(matches)} matches ({elapsed * 1000:.0f} ms)")
 
     def get_checked_items(self):
-        checked_paths = []
-        iterator = QTreeWidgetItemIterator(self.file_tree, QTreeWidgetItemIterator.IteratorFlag.Checked)
-        while iterator.value():
-            item = iterator.value()
-            parent = item.parent()
-            if not parent or parent == self.file_tree.invisibleRootItem() or parent.checkState(0) != Qt.CheckState.Checked:
-                path = item.data(0, Qt.ItemDataRole.UserRole)
-                if path:
-                    checked_paths.append(path)
-            iterator += 1
-        return checked_paths
+        if self.current_archive is not None:
+            return self.archive_model.checked_paths() if self.archive_model else []
+        return sorted(self.checked_files, key=self.checked_files.__getitem__)
 
     def on_item_selection_changed(self):
         if self.current_archive is None:
@@ -484,29 +856,12 @@ class MainWindow(QMainWindow):
 
     def handle_item_changed(self, item, column):
         if column == 0:
-            self.file_tree.blockSignals(True)
-            check_state = item.checkState(0)
-
-            def update_children(parent_item):
-                for i in range(parent_item.childCount()):
-                    child = parent_item.child(i)
-                    child.setCheckState(0, check_state)
-                    update_children(child)
-
-            update_children(item)
-
-            def update_parents(child_item):
-                parent = child_item.parent()
-                if parent and parent != self.file_tree.invisibleRootItem():
-                    child_states = {parent.child(i).checkState(0) for i in range(parent.childCount())}
-                    if len(child_states) == 1:
-                        parent.setCheckState(0, child_states.pop())
-                    else:
-                        parent.setCheckState(0, Qt.CheckState.PartiallyChecked)
-                    update_parents(parent)
-
-            update_parents(item)
-            self.file_tree.blockSignals(False)
+            # The folder view is flat, so a check changes only its own row.
+            path = item.data(0, Qt.ItemDataRole.UserRole)
+            if item.checkState(0) == Qt.CheckState.Checked:
+                self.checked_files[path] = directory_sort_key(item.text(0), item.data(0, Qt.ItemDataRole.UserRole + 1))
+            else:
+                self.checked_files.pop(path, None)
 
     def handle_item_activated(self, item, column):
         if self.current_archive is None:
@@ -519,11 +874,14 @@ class MainWindow(QMainWindow):
                     self.location_bar.setText(path)
                     self.load_archive_contents()
 
-    def start_compression_task(self, operation, source, destination, password=None, files_to_add=None, files_to_extract=None):
+    def start_compression_task(self, operation, source, destination, password=None, files_to_add=None, files_to_extract=None,
+                               block_size=DEFAULT_BLOCK_SIZE, profile=DEFAULT_PROFILE, volume_size=None,
+                               files_to_remove=None, zip_method=None):
         self.set_buttons_enabled(False)
         self.status_label.setText("Processing...")
 
-        self.worker_thread = WorkerThread(operation, source, destination, password, files_to_add, files_to_extract)
+        self.worker_thread = WorkerThread(operation, source, destination, password, files_to_add, files_to_extract,
+                                          block_size, profile, volume_size, files_to_remove, zip_method)
         self.worker_thread.finished.connect(self.on_operation_finished)
         self.worker_thread.requires_password.connect(self.on_password_required)
 
@@ -531,29 +889,44 @@ class MainWindow(QMainWindow):
             self.progress_dialog = ProgressDialog(self)
             self.worker_thread.progress.connect(self.progress_dialog.update_progress)
             self.worker_thread.file_changed.connect(self.progress_dialog.update_status)
+            self.worker_thread.throughput.connect(self.progress_dialog.update_throughput)
             self.progress_dialog.rejected.connect(self.cancel_operation)
             self.progress_dialog.show()
         else:
             self.progress_bar.setVisible(True)
             self.progress_bar.setRange(0, 100)
             self.progress_bar.setValue(0)
+            self.cancel_btn.setVisible(True)
+            self.cancel_btn.setEnabled(True)
             self.worker_thread.progress.connect(self.update_progress)
+            self.worker_thread.throughput.connect(self.update_throughput)
 
         self.worker_thread.start()
 
     @Slot()
     def cancel_operation(self):
+        if self.list_thread and self.list_thread.isRunning():
+            self.list_thread.cancel()
+            self.cancel_btn.setEnabled(False)
+            self.status_label.setText("Cancelling...")
+            return
+        # The worker stops at its next chunk boundary, removes its partial
+        # output and then reports back through on_operation_finished.
         if self.worker_thread and self.worker_thread.isRunning():
-            self.worker_thread.terminate()
-            self.worker_thread.wait()
-            self.status_label.setText("Operation cancelled")
-            self.set_buttons_enabled(True)
+            self.worker_thread.cancel()
+            self.cancel_btn.setEnabled(False)
+            self.status_label.setText("Cancelling...")
 
     @Slot(int)
     def update_progress(self, value):
-        if self.worker_thread.operation == 'create':
+        if self.worker_thread.job.operation in ('create', 'update'):
             self.progress_bar.setValue(value)
 
+    @Slot(float, float)
+    def update_throughput(self, rate, eta):
+        if self.worker_thread.job.operation in ('create', 'update') and not self.worker_thread.job.cancel_token.is_cancelled():
+            self.status_label.setText(f"Processing... {format_throughput(rate, eta)}".strip())
+
     @Slot(bool, str)
     def on_operation_finished(self, success, message):
         if self.progress_dialog:
@@ -565,17 +938,26 @@ class MainWindow(QMainWindow):
 
         self.set_buttons_enabled(True)
         self.progress_bar.setVisible(False)
+        self.cancel_btn.setVisible(False)
+
+        if not success and self.worker_thread.job.cancel_token.is_cancelled():
+            self.status_label.setText("Operation cancelled")
+            return
 
         if success:
-            self.status_label.setText("Operation completed successfully!")
-            QMessageBox.information(self, "Success", "Operation completed successfully!")
+            summary = self.worker_thread.job.sniffer.stats.summary()
+            self.status_label.setText(f"Operation completed successfully! {summary}".strip())
+            QMessageBox.information(self, "Success", f"Operation completed successfully!\n\n{summary}".strip())
 
-            if self.worker_thread.operation == 'create':
-                self.current_archive = self.worker_thread.destination
+            if self.worker_thread.job.operation == 'create':
+                self.current_archive = output_path(self.worker_thread.job.destination,
+                                                   self.worker_thread.job.volume_size)
                 self.location_bar.setText(self.current_archive)
                 self.load_archive_contents()
-            elif self.worker_thread.operation == 'extract':
-                self.load_directory_contents(self.worker_thread.destination)
+            elif self.worker_thread.job.operation == 'extract':
+                self.load_directory_contents(self.worker_thread.job.destination)
+            elif self.worker_thread.job.operation == 'update':
+                self.load_archive_contents()
 
         else:
             if "password" not in message.lower():
@@ -590,6 +972,7 @@ class MainWindow(QMainWindow):
 
         self.set_buttons_enabled(True)
         self.progress_bar.setVisible(False)
+        self.cancel_btn.setVisible(False)
         self.status_label.setText("Ready")
 
         password_dialog = PasswordDialog(self)
@@ -597,12 +980,17 @@ class MainWindow(QMainWindow):
             password = password_dialog.get_password()
             if password:
                 self.start_compression_task(
-                    self.worker_thread.operation,
-                    self.worker_thread.source,
-                    self.worker_thread.destination,
+                    self.worker_thread.job.operation,
+                    self.worker_thread.job.source,
+                    self.worker_thread.job.destination,
                     password,
-                    self.worker_thread.files_to_add,
-                    self.worker_thread.files_to_extract
+                    self.worker_thread.job.files_to_add,
+                    self.worker_thread.job.files_to_extract,
+                    self.worker_thread.job.block_size,
+                    self.worker_thread.job.profile,
+                    self.worker_thread.job.volume_size,
+                    self.worker_thread.job.files_to_remove,
+                    self.worker_thread.job.zip_method
                 )
             else:
                 QMessageBox.warning(self, "Error", "A password was not provided.")
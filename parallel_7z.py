@@ -0,0 +1,267 @@
+import os
+import time
+import pathlib
+import tempfile
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import py7zr
+from py7zr.archiveinfo import (
+    FilesInfo, Header, PackInfo, SignatureHeader, StreamsInfo, SubstreamsInfo, UnpackInfo
+)
+
+from cancellation import SLICE_SIZE, CancellableStream, check_cancelled, wait_result, shutdown_now
+from parallel_zip import _InlineExecutor
+from volumes import create_output, remove_output
+from profiles import DEFAULT_BLOCK_SIZE, encrypted_filters
+
+_MIN_DICT_SIZE = 1024 * 1024
+_MAX_DICT_SIZE = 64 * 1024 * 1024
+_COPY_SIZE = 1024 * 1024
+_STORE_FILTERS = [{'id': py7zr.FILTER_COPY}]
+
+
+def _block_filters(filters, block_bytes):
+    """Shrink the LZMA dictionary to the block size; a larger window cannot help and costs memory per worker"""
+    dict_size = min(max(block_bytes, _MIN_DICT_SIZE), _MAX_DICT_SIZE)
+    result = []
+    for f in filters:
+        f = dict(f)
+        if f['id'] in (py7zr.FILTER_LZMA2, py7zr.FILTER_LZMA) and 'dict_size' not in f:
+            f['dict_size'] = dict_size
+        result.append(f)
+    return result
+
+
+class _CancellablePath(type(pathlib.Path())):
+    """Path whose open() returns a stream that checks a cancellation token on every read"""
+
+    def open(self, mode='r', *args, **kwargs):
+        return CancellableStream(super().open(mode, *args, **kwargs), self.cancel, max_read=SLICE_SIZE)
+
+
+def cancellable_path(path, cancel):
+    """Return path in a form py7zr reads in small slices, checking the token between them"""
+    if cancel is None:
+        return path
+    source = _CancellablePath(path)
+    source.cancel = cancel
+    return source
+
+
+def _compress_block(entries, part_path, filters, password, cancel=None):
+    """Write one block of entries as a standalone single-folder 7z archive"""
+    start = time.perf_counter()
+    try:
+        zf = py7zr.SevenZipFile(part_path, 'w', filters=filters, password=password)
+        try:
+            for path, arcname in entries:
+                zf.write(cancellable_path(path, cancel), arcname)
+        except BaseException:
+            # Skip close(), which would flush the encoder and write a header
+            # for a part that is about to be deleted.
+            zf.fp.close()
+            raise
+        zf.close()
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    return part_path, time.perf_counter() - start
+
+
+class ParallelSevenZipWriter:
+    """Compress independent solid blocks of a 7z archive in a process pool.
+
+    Each block is compressed into its own temporary single-folder archive next
+    to the destination; the packed streams are then copied in order and the
+    headers merged into one multi-folder archive. Smaller blocks give more
+    parallelism at some cost in ratio. A file never spans blocks, so a file
+    larger than the block size gets a block of its own. With a sniffer,
+    already-compressed files are gathered into separate stored blocks.
+    """
+
+    def __init__(self, destination, filters, password=None, block_size=DEFAULT_BLOCK_SIZE, workers=None,
+                 sniffer=None, cancel=None, volume_size=None):
+        self.destination = destination
+        self.filters = filters
+        self.password = password
+        self.block_size = block_size
+        self.workers = workers or os.cpu_count() or 1
+        self.sniffer = sniffer
+        self.cancel = cancel
+        self.volume_size = volume_size
+        self.spool_dir = os.path.dirname(os.path.abspath(destination))
+
+    def plan_blocks(self, entries):
+        """Group (path, arcname) pairs into (entries, uncompressed bytes, stored) blocks of roughly block_size.
+
+        Folders and empty files all go in a first block of their own. py7zr
+        hands folders' streams to the file entries with data in order, and
+        loses track when an entry without data follows a file in a later
+        block, so those entries must come before every file with data.
+        """
+        blocks = []
+        groups = {False: ([], 0), True: ([], 0)}
+        sniff = self.sniffer is not None and self.filters != _STORE_FILTERS
+        empty = []
+        for path, arcname in entries:
+            size = 0
+            stored = False
+            if os.path.isfile(path) and not os.path.islink(path):
+                size = os.path.getsize(path)
+                stored = sniff and self.sniffer.is_incompressible(path)
+            if not size and not os.path.islink(path):
+                empty.append((path, arcname))
+                continue
+            group, group_bytes = groups[stored]
+            group.append((path, arcname))
+            group_bytes += size
+            if group_bytes >= self.block_size:
+                blocks.append((group, group_bytes, stored))
+                group, group_bytes = [], 0
+            groups[stored] = (group, group_bytes)
+        for stored, (group, group_bytes) in groups.items():
+            if group:
+                blocks.append((group, group_bytes, stored))
+        if empty:
+            blocks.insert(0, (empty, 0, False))
+        return blocks
+
+    def write_files(self, entries, on_block=None):
+        """Write (path, arcname) pairs to the destination; on_block(done, total, size) is called per merged block"""
+        blocks = self.plan_blocks(entries)
+        if self.workers <= 1 or len(blocks) <= 1:
+            executor = _InlineExecutor()
+            task_cancel = self.cancel
+        else:
+            # Pool tasks cannot see the token; the pool is terminated instead.
+            task_cancel = None
+            executor = ProcessPoolExecutor(
+                max_workers=min(self.workers, len(blocks)),
+                mp_context=multiprocessing.get_context('spawn')
+            )
+
+        header = self._new_header()
+        pending = deque()
+        window = self.workers * 2
+        done = 0
+        try:
+            with create_output(self.destination, self.volume_size) as fp:
+                sig_header = SignatureHeader()
+                sig_header._write_skeleton(fp)
+                afterheader = fp.tell()
+
+                for block_entries, block_bytes, stored in blocks:
+                    check_cancelled(self.cancel)
+                    fd, part_path = tempfile.mkstemp(dir=self.spool_dir, prefix='.lawranzip-', suffix='.7z')
+                    os.close(fd)
+                    filters = _STORE_FILTERS if stored else _block_filters(self.filters, block_bytes)
+                    filters = encrypted_filters(filters, self.password)
+                    future = executor.submit(_compress_block, block_entries, part_path, filters, self.password,
+                                             task_cancel)
+                    pending.append((future, part_path, block_bytes, stored))
+                    while len(pending) > window or (pending and pending[0][0].done()):
+                        done += 1
+                        block_bytes = self._merge_next(fp, header, pending)
+                        if on_block:
+                            on_block(done, len(blocks), block_bytes)
+                while pending:
+                    done += 1
+                    block_bytes = self._merge_next(fp, header, pending)
+                    if on_block:
+                        on_block(done, len(blocks), block_bytes)
+
+                header_pos, header_len, header_crc = header.write(fp, afterheader, encoded=True, encrypted=False)
+                sig_header.nextheaderofs = header_pos - afterheader
+                sig_header.calccrc(header_len, header_crc)
+                sig_header.write(fp)
+        except BaseException:
+            shutdown_now(executor)
+            for _, part_path, _, _ in pending:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+            remove_output(self.destination, self.volume_size)
+            raise
+        executor.shutdown(wait=True)
+
+    @staticmethod
+    def _new_header():
+        header = Header()
+        header.main_streams = StreamsInfo()
+        header.main_streams.packinfo = PackInfo()
+        header.main_streams.packinfo.enable_digests = False
+        header.main_streams.unpackinfo = UnpackInfo()
+        header.main_streams.substreamsinfo = SubstreamsInfo()
+        header.main_streams.substreamsinfo.unpacksizes = []
+        header.files_info = FilesInfo()
+        return header
+
+    def _merge_next(self, fp, header, pending):
+        future, _, block_bytes, stored = pending[0]
+        part_path, elapsed = wait_result(future, self.cancel)
+        pending.popleft()
+        if self.sniffer and not stored:
+            self.sniffer.stats.record_compressed(block_bytes, elapsed)
+        self._merge_part(fp, header, part_path)
+        return block_bytes
+
+    def _merge_part(self, fp, header, part_path):
+        """Append the packed streams of one block archive and merge its header"""
+        try:
+            with py7zr.SevenZipFile(part_path, 'r', password=self.password) as part:
+                part_header = part.header
+                afterheader = part.afterheader
+
+            files = part_header.files_info.files if part_header.files_info else []
+            files_info = header.files_info
+            files_info.files.extend(files)
+            empty_streams = sum(1 for f in files if f['emptystream'])
+            emptyfiles = list(part_header.files_info.emptyfiles) if part_header.files_info else []
+            files_info.emptyfiles.extend(emptyfiles + [False] * (empty_streams - len(emptyfiles)))
+
+            streams = part_header.main_streams
+            # py7zr gives a block of folders and empty files a folder with
+            # no streams in it; that folder must not be merged.
+            if empty_streams == len(files) or streams is None or streams.packinfo is None \
+                    or not streams.packinfo.packsizes:
+                return
+
+            packinfo = header.main_streams.packinfo
+            part_pack = streams.packinfo
+            packinfo.packsizes.extend(part_pack.packsizes)
+            packinfo.numstreams += len(part_pack.packsizes)
+            if part_pack.crcs:
+                packinfo.digestdefined.extend(part_pack.digestdefined)
+                packinfo.crcs.extend(part_pack.crcs)
+            else:
+                packinfo.digestdefined.extend([False] * len(part_pack.packsizes))
+                packinfo.crcs.extend([0] * len(part_pack.packsizes))
+
+            unpackinfo = header.main_streams.unpackinfo
+            unpackinfo.folders.extend(streams.unpackinfo.folders)
+            unpackinfo.numfolders = len(unpackinfo.folders)
+
+            substreams = header.main_streams.substreamsinfo
+            part_sub = streams.substreamsinfo
+            substreams.num_unpackstreams_folders.extend(part_sub.num_unpackstreams_folders)
+            if part_sub.unpacksizes is None:
+                # Only written when some folder holds several files
+                substreams.unpacksizes.extend(f.get_unpack_size() for f in streams.unpackinfo.folders)
+            else:
+                substreams.unpacksizes.extend(part_sub.unpacksizes)
+            substreams.digests.extend(part_sub.digests)
+            substreams.digestsdefined.extend(part_sub.digestsdefined)
+
+            with open(part_path, 'rb') as src:
+                src.seek(afterheader + part_pack.packpos)
+                remaining = sum(part_pack.packsizes)
+                while remaining:
+                    data = src.read(min(_COPY_SIZE, remaining))
+                    if not data:
+                        raise py7zr.exceptions.Bad7zFile("Truncated block archive")
+                    fp.write(data)
+                    remaining -= len(data)
+        finally:
+            os.remove(part_path)
@@ -0,0 +1,202 @@
+import io
+import os
+import lzma
+import zlib
+import struct
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from cancellation import compress_in_slices, wait_result, shutdown_now
+from parallel_zip import _InlineExecutor
+
+XZ_BLOCK_SIZE = 24 * 1024 * 1024
+GZIP_BLOCK_SIZE = 4 * 1024 * 1024
+
+_XZ_MAGIC = b'\xfd7zXZ\x00'
+_XZ_FOOTER_MAGIC = b'YZ'
+# gzip extra subfield holding the size of the whole member, so that readers
+# can hop from member to member without inflating them (see seek_index).
+GZIP_SIZE_SUBFIELD = b'LZ'
+_GZIP_HEADER_SIZE = 20
+
+
+def _encode_varint(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _decode_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def _xz_stream_flags(check):
+    flags = bytes([0, check])
+    return flags + struct.pack('<I', zlib.crc32(flags))
+
+
+def _compress_xz_block(data, preset, check, cancel=None):
+    """Compress data as one xz block; returns (block bytes, unpadded size, uncompressed size)"""
+    compressor = lzma.LZMACompressor(format=lzma.FORMAT_XZ, check=check, preset=preset)
+    stream = compress_in_slices(compressor, data, cancel) + compressor.flush()
+    # A single-threaded encode holds exactly one block between the 12-byte
+    # stream header and the index; its index record gives the sizes.
+    backward_size = (struct.unpack('<I', stream[-8:-4])[0] + 1) * 4
+    index = stream[-12 - backward_size:-12]
+    count, pos = _decode_varint(index, 1)
+    if count != 1:
+        raise ValueError(f"Expected one xz block, got {count}")
+    unpadded, pos = _decode_varint(index, pos)
+    uncompressed, pos = _decode_varint(index, pos)
+    return stream[12:-12 - backward_size], unpadded, uncompressed
+
+
+def _compress_gzip_block(data, level, cancel=None):
+    """Compress data as one standalone gzip member that records its own size"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    deflated = compress_in_slices(compressor, data, cancel) + compressor.flush()
+    member_size = _GZIP_HEADER_SIZE + len(deflated) + 8
+    extra_flags = 2 if level == 9 else 4 if level == 1 else 0
+    header = struct.pack('<4BIBBH', 0x1f, 0x8b, 8, 0x04, 0, extra_flags, 255, 8)
+    header += GZIP_SIZE_SUBFIELD + struct.pack('<HI', 4, member_size)
+    return header + deflated + struct.pack('<II', zlib.crc32(data), len(data) & 0xFFFFFFFF)
+
+
+class ParallelCompressedStream(io.RawIOBase):
+    """Write-only stream that compresses fixed-size blocks in a process pool (pixz/pigz-style).
+
+    'xz' produces a single xz stream of independent blocks with a block index,
+    so each block can later be located and decompressed on its own; 'gz'
+    produces concatenated gzip members that carry their own size in the
+    header's extra field. Both read back with the standard xz and gzip tools
+    and with tarfile.
+    """
+
+    def __init__(self, fileobj, fmt, level=None, block_size=None, workers=None, cancel=None):
+        super().__init__()
+        if fmt not in ('xz', 'gz'):
+            raise ValueError(f"Unsupported stream format: {fmt}")
+        self.fileobj = fileobj
+        self.fmt = fmt
+        if fmt == 'xz':
+            self.level = lzma.PRESET_DEFAULT if level is None else level
+            self.block_size = block_size or XZ_BLOCK_SIZE
+        else:
+            self.level = 9 if level is None else level
+            self.block_size = block_size or GZIP_BLOCK_SIZE
+        self.workers = workers or os.cpu_count() or 1
+        self.cancel = cancel
+        self.check = lzma.CHECK_CRC64
+        self._buffer = bytearray()
+        self._pending = deque()
+        self._records = []
+        self._position = 0
+        self._executor = None
+
+        if fmt == 'xz':
+            self.fileobj.write(_XZ_MAGIC + _xz_stream_flags(self.check))
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        self._buffer += data
+        self._position += len(data)
+        while len(self._buffer) >= self.block_size:
+            block = bytes(self._buffer[:self.block_size])
+            del self._buffer[:self.block_size]
+            self._submit(block)
+        return len(data)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._buffer:
+                self._submit(bytes(self._buffer))
+                self._buffer = bytearray()
+            while self._pending:
+                self._write_next()
+            if self.fmt == 'xz':
+                self._write_xz_trailer()
+            if self._executor:
+                self._executor.shutdown(wait=True)
+        except BaseException:
+            self.abort()
+            raise
+        finally:
+            super().close()
+
+    def abort(self):
+        """Drop any queued blocks and stop the pool without writing a trailer"""
+        self._pending.clear()
+        if self._executor:
+            shutdown_now(self._executor)
+            self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.workers <= 1:
+                self._executor = _InlineExecutor()
+            else:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+        return self._executor
+
+    def _submit(self, block):
+        executor = self._get_executor()
+        # Inline blocks are compressed in this thread and can check the token
+        # between slices; pool workers are terminated instead.
+        cancel = self.cancel if isinstance(executor, _InlineExecutor) else None
+        if self.fmt == 'xz':
+            self._pending.append(executor.submit(_compress_xz_block, block, self.level, self.check, cancel))
+        else:
+            self._pending.append(executor.submit(_compress_gzip_block, block, self.level, cancel))
+        while len(self._pending) > self.workers * 2 or (self._pending and self._pending[0].done()):
+            self._write_next()
+
+    def _write_next(self):
+        result = wait_result(self._pending[0], self.cancel)
+        self._pending.popleft()
+        self._write_result(result)
+
+    def _write_result(self, result):
+        if self.fmt == 'xz':
+            block, unpadded, uncompressed = result
+            self._records.append((unpadded, uncompressed))
+            self.fileobj.write(block)
+        else:
+            self._records.append(len(result))
+            self.fileobj.write(result)
+
+    def _write_xz_trailer(self):
+        index = bytearray(b'\x00')
+        index += _encode_varint(len(self._records))
+        for unpadded, uncompressed in self._records:
+            index += _encode_varint(unpadded)
+            index += _encode_varint(uncompressed)
+        index += bytes(-len(index) % 4)
+        index += struct.pack('<I', zlib.crc32(index))
+        self.fileobj.write(index)
+
+        footer = struct.pack('<I', len(index) // 4 - 1) + bytes([0, self.check])
+        self.fileobj.write(struct.pack('<I', zlib.crc32(footer)) + footer + _XZ_FOOTER_MAGIC)
@@ -0,0 +1,503 @@
+import os
+import bz2
+import time
+import zlib
+import shutil
+import tempfile
+import zipfile
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from cancellation import check_cancelled, compress_in_slices, wait_result, wait_any, shutdown_now
+from fast_codecs import load_zstd, register_zip_zstd
+from profiles import ZIP_ZSTANDARD
+from volumes import open_archive
+
+CHUNK_SIZE = 4 * 1024 * 1024
+SPOOL_THRESHOLD = 64 * 1024 * 1024
+INLINE_THRESHOLD = 8 * 1024 * 1024
+EXTRACT_BATCH_SIZE = 16 * 1024 * 1024
+EXTRACT_BATCH_FILES = 256
+_DEFLATE_WINDOW = 32 * 1024
+_READ_SIZE = 1024 * 1024
+
+# Deflate and stored members are split into chunks; the other codecs produce a
+# single stream per member and are compressed whole by one worker.
+_CHUNKED_TYPES = (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)
+
+
+def _gf2_matrix_times(mat, vec):
+    total = 0
+    i = 0
+    while vec:
+        if vec & 1:
+            total ^= mat[i]
+        vec >>= 1
+        i += 1
+    return total
+
+
+def _gf2_matrix_square(mat):
+    return [_gf2_matrix_times(mat, mat[n]) for n in range(32)]
+
+
+def crc32_combine(crc1, crc2, len2):
+    """Return the CRC-32 of two concatenated blocks from their separate CRCs (zlib's crc32_combine)"""
+    if len2 <= 0:
+        return crc1
+    odd = [0xEDB88320] + [1 << n for n in range(31)]
+    even = _gf2_matrix_square(odd)
+    odd = _gf2_matrix_square(even)
+    while True:
+        even = _gf2_matrix_square(odd)
+        if len2 & 1:
+            crc1 = _gf2_matrix_times(even, crc1)
+        len2 >>= 1
+        if not len2:
+            break
+        odd = _gf2_matrix_square(even)
+        if len2 & 1:
+            crc1 = _gf2_matrix_times(odd, crc1)
+        len2 >>= 1
+        if not len2:
+            break
+    return crc1 ^ crc2
+
+
+def _new_compressor(compress_type, level):
+    if compress_type == zipfile.ZIP_BZIP2:
+        return bz2.BZ2Compressor(level if level is not None else 9)
+    if compress_type == zipfile.ZIP_LZMA:
+        return zipfile.LZMACompressor()
+    if compress_type == ZIP_ZSTANDARD:
+        # One frame per member in this worker's thread; the pool already
+        # keeps every core busy with other members.
+        return load_zstd().ZstdCompressor(level=level)
+    raise ValueError(f"Unsupported ZIP compression method: {compress_type}")
+
+
+def _compress_chunk(path, offset, length, compress_type, level, final, cancel=None):
+    """Read one chunk of a file and compress it as part of a deflate or stored member"""
+    start = time.perf_counter()
+    with open(path, 'rb') as f:
+        zdict = b''
+        if compress_type == zipfile.ZIP_DEFLATED and offset:
+            # Prime the window with the preceding bytes, as pigz does, so
+            # chunking costs almost nothing in ratio.
+            window_start = max(0, offset - _DEFLATE_WINDOW)
+            f.seek(window_start)
+            zdict = f.read(offset - window_start)
+        else:
+            f.seek(offset)
+        data = f.read(length)
+
+    crc = zlib.crc32(data)
+    if compress_type == zipfile.ZIP_STORED:
+        return crc, len(data), data, time.perf_counter() - start
+
+    level = zlib.Z_DEFAULT_COMPRESSION if level is None else level
+    if zdict:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, 8, zlib.Z_DEFAULT_STRATEGY, zdict)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    # Non-final chunks end on a byte boundary without a final block, so the
+    # raw deflate streams concatenate into one valid stream.
+    payload = compress_in_slices(compressor, data, cancel)
+    payload += compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+    return crc, len(data), payload, time.perf_counter() - start
+
+
+def _compress_member(path, compress_type, level, spool_dir, cancel=None):
+    """Compress a whole file as a single LZMA, BZIP2 or Zstandard member stream"""
+    start = time.perf_counter()
+    compressor = _new_compressor(compress_type, level)
+    crc = 0
+    size = 0
+    spool = None
+    parts = []
+    buffered = 0
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                check_cancelled(cancel)
+                data = f.read(_READ_SIZE)
+                if not data:
+                    break
+                crc = zlib.crc32(data, crc)
+                size += len(data)
+                out = compress_in_slices(compressor, data, cancel)
+                if not out:
+                    continue
+                if spool is None and buffered + len(out) > SPOOL_THRESHOLD:
+                    spool = tempfile.NamedTemporaryFile(dir=spool_dir, prefix='.lawranzip-', delete=False)
+                    spool.writelines(parts)
+                    parts = []
+                if spool is not None:
+                    spool.write(out)
+                else:
+                    parts.append(out)
+                    buffered += len(out)
+        tail = compressor.flush()
+        if spool is not None:
+            spool.write(tail)
+            spool.close()
+            return crc, size, spool.name, time.perf_counter() - start
+        parts.append(tail)
+        return crc, size, b''.join(parts), time.perf_counter() - start
+    except BaseException:
+        if spool is not None:
+            spool.close()
+            os.remove(spool.name)
+        raise
+
+
+# Archive handle opened once by each extraction worker process.
+_worker_zf = None
+
+
+def _open_worker_archive(zipfile_cls, path, pwd):
+    """Pool initializer: give this worker process its own handle on the archive"""
+    global _worker_zf
+    # Unpickling zipfile_cls may have imported pyzipper in this process.
+    register_zip_zstd()
+    _worker_zf = zipfile_cls(open_archive(path), 'r')
+    if pwd:
+        _worker_zf.setpassword(pwd)
+
+
+def _extract_batch(names, destination):
+    """Extract a run of members with this worker's handle; returns the uncompressed bytes written"""
+    written = 0
+    for name in names:
+        info = _worker_zf.getinfo(name)
+        _worker_zf.extract(info, destination)
+        written += info.file_size
+    return written
+
+
+def member_target_path(zf, info, destination):
+    """Return the path zipfile.extract() writes info to, applying the same name sanitising"""
+    arcname = info.filename.replace('/', os.path.sep)
+    if os.path.altsep:
+        arcname = arcname.replace(os.path.altsep, os.path.sep)
+    arcname = os.path.splitdrive(arcname)[1]
+    arcname = os.path.sep.join(x for x in arcname.split(os.path.sep) if x not in ('', os.path.curdir, os.path.pardir))
+    if os.path.sep == '\\':
+        arcname = zf._sanitize_windows_name(arcname, os.path.sep)
+    return os.path.normpath(os.path.join(destination, arcname))
+
+
+class _InlineExecutor:
+    """Executor stand-in that runs tasks in the calling thread"""
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+class _PendingMember:
+    def __init__(self, zinfo, path):
+        self.zinfo = zinfo
+        self.path = path
+        self.crc = 0
+        self.file_size = 0
+        self.compress_size = 0
+        self.encrypter = None
+        self.zip64 = False
+
+
+class ParallelZipWriter:
+    """Compress ZIP members in a process pool and append them to an open archive in order.
+
+    Works with both ``zipfile.ZipFile`` and ``pyzipper.AESZipFile`` opened in
+    'w' or 'a' mode; the archive's compression, level and encryption settings are used.
+    With a sniffer, files that would not shrink are stored instead.
+    """
+
+    def __init__(self, zf, workers=None, chunk_size=CHUNK_SIZE, sniffer=None, cancel=None):
+        self.zf = zf
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.compress_type = zf.compression
+        self.level = getattr(zf, 'compresslevel', None)
+        self.sniffer = sniffer
+        self.cancel = cancel
+        self.spool_parent = os.path.dirname(os.path.abspath(zf.filename)) if zf.filename else None
+        self.spool_dir = None
+        self._task_cancel = None
+
+    def write_files(self, entries, on_member=None, on_bytes=None):
+        """Write (path, arcname) pairs to the archive.
+
+        on_member(arcname) is called as each member lands and on_bytes(size)
+        as each chunk of uncompressed input is written.
+        """
+        entries = list(entries)
+        total_size = 0
+        for path, _ in entries:
+            try:
+                total_size += os.path.getsize(path)
+            except OSError:
+                pass
+
+        if self.workers <= 1 or total_size < INLINE_THRESHOLD:
+            executor = _InlineExecutor()
+            # Inline tasks run in this thread, so they can check the token
+            # themselves; pool tasks are stopped by terminating the pool.
+            self._task_cancel = self.cancel
+        else:
+            executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            self._task_cancel = None
+        # Spool files go in a per-run directory so that ones left by a
+        # terminated worker are removed with it.
+        self.spool_dir = tempfile.mkdtemp(dir=self.spool_parent, prefix='.lawranzip-')
+
+        pending = deque()
+        window = self.workers * 2
+        try:
+            for path, arcname in entries:
+                check_cancelled(self.cancel)
+                member = _PendingMember(self._make_zipinfo(path, arcname), path)
+                tasks = self._plan_member(member)
+                for i, (fn, args) in enumerate(tasks):
+                    pending.append((member, i == 0, i == len(tasks) - 1, executor.submit(fn, *args)))
+                    while len(pending) > window:
+                        self._drain_one(pending, on_member, on_bytes)
+            while pending:
+                self._drain_one(pending, on_member, on_bytes)
+        except BaseException:
+            shutdown_now(executor)
+            raise
+        finally:
+            shutil.rmtree(self.spool_dir, ignore_errors=True)
+        executor.shutdown(wait=True)
+
+    def _make_zipinfo(self, path, arcname):
+        zipinfo_cls = getattr(self.zf, 'zipinfo_cls', zipfile.ZipInfo)
+        zinfo = zipinfo_cls.from_file(path, arcname, strict_timestamps=self.zf._strict_timestamps)
+        zinfo.compress_type = self.compress_type
+        zinfo._compresslevel = self.level
+        if (self.sniffer and self.compress_type != zipfile.ZIP_STORED
+                and not zinfo.is_dir() and self.sniffer.is_incompressible(path)):
+            zinfo.compress_type = zipfile.ZIP_STORED
+            zinfo._compresslevel = None
+        return zinfo
+
+    def _plan_member(self, member):
+        size = member.zinfo.file_size
+        compress_type = member.zinfo.compress_type
+        if compress_type not in _CHUNKED_TYPES:
+            return [(_compress_member, (member.path, compress_type, self.level, self.spool_dir, self._task_cancel))]
+
+        tasks = []
+        offset = 0
+        while True:
+            length = min(self.chunk_size, size - offset)
+            final = offset + length >= size
+            tasks.append((_compress_chunk, (member.path, offset, length, compress_type, self.level, final,
+                                            self._task_cancel)))
+            if final:
+                return tasks
+            offset += length
+
+    def _drain_one(self, pending, on_member, on_bytes):
+        member, first, last, future = pending[0]
+        crc, size, payload, elapsed = wait_result(future, self.cancel)
+        pending.popleft()
+        if self.sniffer and member.zinfo.compress_type != zipfile.ZIP_STORED:
+            self.sniffer.stats.record_compressed(size, elapsed)
+        if first:
+            self._begin_member(member)
+        member.crc = crc32_combine(member.crc, crc, size)
+        member.file_size += size
+        self._write_payload(member, payload)
+        if on_bytes:
+            on_bytes(size)
+        if last:
+            self._end_member(member)
+            if on_member:
+                on_member(member.zinfo.filename)
+
+    def _begin_member(self, member):
+        zf = self.zf
+        zinfo = member.zinfo
+        zinfo.flag_bits = 0
+        zinfo.CRC = 0
+        zinfo.compress_size = 0
+        if getattr(zf, 'encryption', None) is not None:
+            zinfo.flag_bits |= 0x01
+            member.encrypter = zf.get_encrypter()
+            member.encrypter.update_zipinfo(zinfo)
+        if zinfo.compress_type == zipfile.ZIP_LZMA:
+            # Compressed data includes an end-of-stream (EOS) marker
+            zinfo.flag_bits |= 0x02
+        if not zinfo.external_attr:
+            zinfo.external_attr = 0o600 << 16
+
+        member.zip64 = zf._allowZip64 and zinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT
+        zf.fp.seek(zf.start_dir)
+        zinfo.header_offset = zf.fp.tell()
+        zf._writecheck(zinfo)
+        zf._didModify = True
+        zf.fp.write(zinfo.FileHeader(member.zip64))
+        if member.encrypter:
+            header = member.encrypter.encryption_header()
+            member.compress_size += len(header)
+            zf.fp.write(header)
+
+    def _write_payload(self, member, payload):
+        if isinstance(payload, str):
+            try:
+                with open(payload, 'rb') as spool:
+                    while True:
+                        data = spool.read(_READ_SIZE)
+                        if not data:
+                            break
+                        self._write_data(member, data)
+            finally:
+                os.remove(payload)
+        else:
+            self._write_data(member, payload)
+
+    def _write_data(self, member, data):
+        if member.encrypter:
+            data = member.encrypter.encrypt(data)
+        member.compress_size += len(data)
+        self.zf.fp.write(data)
+
+    def _end_member(self, member):
+        zf = self.zf
+        zinfo = member.zinfo
+        if member.encrypter:
+            tail = member.encrypter.flush()
+            member.compress_size += len(tail)
+            zf.fp.write(tail)
+        zinfo.CRC = member.crc
+        zinfo.file_size = member.file_size
+        zinfo.compress_size = member.compress_size
+        if member.encrypter:
+            member.encrypter.finalize_zipinfo(zinfo)
+        if not member.zip64 and max(zinfo.file_size, zinfo.compress_size) > zipfile.ZIP64_LIMIT:
+            raise RuntimeError("File size unexpectedly exceeded ZIP64 limit")
+
+        zf.start_dir = zf.fp.tell()
+        zf.fp.seek(zinfo.header_offset)
+        zf.fp.write(zinfo.FileHeader(member.zip64))
+        zf.fp.seek(zf.start_dir)
+        zf.filelist.append(zinfo)
+        zf.NameToInfo[zinfo.filename] = zinfo
+
+
+class ParallelZipExtractor:
+    """Extract ZIP members in a process pool, each worker reading through its own archive handle.
+
+    Members are taken in header order and cut into runs of roughly equal
+    compressed size, so every worker reads a contiguous stretch of the file.
+    Works with ``zipfile.ZipFile`` and ``pyzipper.AESZipFile``; the password
+    set on the archive is handed to the workers.
+    """
+
+    def __init__(self, zf, workers=None, batch_size=EXTRACT_BATCH_SIZE, batch_files=EXTRACT_BATCH_FILES, cancel=None):
+        self.zf = zf
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.batch_files = batch_files
+        self.cancel = cancel
+
+    def extract(self, members, destination, on_member=None, on_bytes=None):
+        """Extract ZipInfo members.
+
+        on_member(name) is called as a member (or, from the pool, a run of
+        members) is started or finished, and on_bytes(size) with the
+        uncompressed bytes written.
+        """
+        members = sorted(members, key=lambda info: info.header_offset)
+        compressed = sum(info.compress_size for info in members)
+        if self.workers <= 1 or compressed < INLINE_THRESHOLD or not isinstance(self.zf.filename, str):
+            self._extract_inline(members, destination, on_member, on_bytes)
+            return
+
+        files = self._prepare_directories(members, destination)
+        batches = self._plan_batches(files)
+        executor = ProcessPoolExecutor(
+            max_workers=min(self.workers, len(batches)),
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_open_worker_archive,
+            initargs=(type(self.zf), self.zf.filename, self.zf.pwd)
+        )
+        try:
+            futures = {executor.submit(_extract_batch, names, destination): names for names in batches}
+            pending = set(futures)
+            while pending:
+                for future in wait_any(pending, self.cancel):
+                    pending.discard(future)
+                    written = future.result()
+                    if on_member:
+                        on_member(futures[future][-1])
+                    if on_bytes:
+                        on_bytes(written)
+        except BaseException:
+            shutdown_now(executor)
+            raise
+        executor.shutdown(wait=True)
+
+    def _extract_inline(self, members, destination, on_member, on_bytes):
+        for info in members:
+            if on_member:
+                on_member(info.filename)
+            target = member_target_path(self.zf, info, destination)
+            if info.is_dir():
+                os.makedirs(target, exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with self.zf.open(info) as source, open(target, 'wb') as out:
+                while True:
+                    check_cancelled(self.cancel)
+                    data = source.read(_READ_SIZE)
+                    if not data:
+                        break
+                    out.write(data)
+                    if on_bytes:
+                        on_bytes(len(data))
+
+    def _prepare_directories(self, members, destination):
+        """Create every target directory up front so workers never race on makedirs; returns the file members"""
+        files = []
+        for info in members:
+            check_cancelled(self.cancel)
+            if info.is_dir():
+                self.zf.extract(info, destination)
+            else:
+                os.makedirs(os.path.dirname(member_target_path(self.zf, info, destination)), exist_ok=True)
+                files.append(info)
+        return files
+
+    def _plan_batches(self, files):
+        # Aim for several runs per worker so a slow run does not leave the
+        # others idle at the end.
+        compressed = sum(info.compress_size for info in files)
+        target = max(1, min(self.batch_size, compressed // (self.workers * 4)))
+        batches = []
+        names = []
+        size = 0
+        for info in files:
+            names.append(info.filename)
+            size += info.compress_size
+            if size >= target or len(names) >= self.batch_files:
+                batches.append(names)
+                names = []
+                size = 0
+        if names:
+            batches.append(names)
+        return batches
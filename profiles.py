@@ -0,0 +1,93 @@
+import lzma
+import zipfile
+
+# py7zr's FILTER_COPY and FILTER_CRYPTO_AES256_SHA256; spelled out so that
+# importing the profiles does not load py7zr.
+SEVEN_ZIP_FILTER_COPY = 0x33
+SEVEN_ZIP_FILTER_AES = 0x06F10701
+# Default solid block size for 7-Zip archives compressed in parallel.
+DEFAULT_BLOCK_SIZE = 64 * 1024 * 1024
+
+# Compression profiles shared by every create path, from fastest to smallest.
+PROFILES = ['store', 'fast', 'normal', 'max']
+DEFAULT_PROFILE = 'max'
+
+PROFILE_LABELS = {
+    'store': "Store (no compression)",
+    'fast': "Fast",
+    'normal': "Normal",
+    'max': "Maximum",
+}
+
+# ZIP method 93 (PKWARE APPNOTE 6.3.7); zipfile only names it from Python 3.14.
+ZIP_ZSTANDARD = 93
+
+# (compression method, compresslevel)
+ZIP_PROFILES = {
+    'store': (zipfile.ZIP_STORED, None),
+    'fast': (zipfile.ZIP_DEFLATED, 1),
+    'normal': (zipfile.ZIP_DEFLATED, 6),
+    'max': (zipfile.ZIP_LZMA, None),
+}
+
+SEVEN_ZIP_PROFILES = {
+    'store': [{'id': SEVEN_ZIP_FILTER_COPY}],
+    'fast': [{'id': lzma.FILTER_LZMA2, 'preset': 1}],
+    'normal': [{'id': lzma.FILTER_LZMA2, 'preset': 5}],
+    'max': [{'id': lzma.FILTER_LZMA2, 'preset': 9}],
+}
+
+# xz has no stored mode, so 'store' uses the cheapest preset.
+XZ_PRESETS = {
+    'store': 0,
+    'fast': 1,
+    'normal': 6,
+    'max': 9,
+}
+
+GZIP_LEVELS = {
+    'store': 0,
+    'fast': 1,
+    'normal': 6,
+    'max': 9,
+}
+
+# (level, long-distance matching) for .tar.zst and ZIP method 93. zstd has no
+# stored mode either; level 3 is zstd's own default and its best speed for
+# the ratio.
+ZSTD_PROFILES = {
+    'store': (1, False),
+    'fast': (3, False),
+    'normal': (9, True),
+    'max': (19, True),
+}
+
+# LZ4 frame levels; 3 and above use the slower high-compression match finder.
+LZ4_LEVELS = {
+    'store': 0,
+    'fast': 0,
+    'normal': 9,
+    'max': 16,
+}
+
+# Choices of ZIP compression method besides the profile's own.
+ZIP_METHODS = {
+    'zstd': ZIP_ZSTANDARD,
+}
+
+
+def check_profile(profile):
+    if profile not in PROFILES:
+        raise Exception(f"Unknown compression profile: {profile}")
+    return profile
+
+
+def encrypted_filters(filters, password):
+    """Return 7z filters with AES appended when there is a password.
+
+    py7zr only adds encryption by itself when no filters are given, so an
+    explicit filter list without this would silently ignore the password.
+    """
+    if not password:
+        return filters
+    return list(filters) + [{'id': SEVEN_ZIP_FILTER_AES}]
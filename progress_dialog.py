@@ -1,6 +1,8 @@
 from PySide6.QtWidgets import QDialog, QVBoxLayout, QLabel, QProgressBar, QPushButton
 from PySide6.QtCore import Slot
 
+from progress_tracker import format_throughput
+
 class ProgressDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -14,12 +16,14 @@ class ProgressDialog(QDialog):
         self.progress_bar.setValue(0)
 
         self.status_label = QLabel("Starting extraction...")
+        self.throughput_label = QLabel("")
 
         self.cancel_button = QPushButton("Cancel")
         self.cancel_button.clicked.connect(self.reject)
 
         layout.addWidget(self.status_label)
         layout.addWidget(self.progress_bar)
+        layout.addWidget(self.throughput_label)
         layout.addWidget(self.cancel_button)
         self.setLayout(layout)
 
@@ -30,3 +34,7 @@ class ProgressDialog(QDialog):
     @Slot(str)
     def update_status(self, status):
         self.status_label.setText(status)
+
+    @Slot(float, float)
+    def update_throughput(self, rate, eta):
+        self.throughput_label.setText(format_throughput(rate, eta))
@@ -0,0 +1,123 @@
+import io
+import time
+import threading
+
+from cancellation import check_cancelled
+from content_sniffer import format_bytes, format_duration
+
+# At most this many progress/throughput signals per second reach the GUI.
+UPDATE_INTERVAL = 0.1
+# Weight of the newest sample in the smoothed transfer rate.
+RATE_SMOOTHING = 0.3
+
+
+def format_throughput(rate, eta):
+    """Return e.g. '12.3 MB/s, about 1 min 5 s left' for a ProgressTracker update"""
+    if rate <= 0:
+        return ""
+    text = f"{format_bytes(rate)}/s"
+    if eta >= 0:
+        text += f", about {format_duration(eta)} left"
+    return text
+
+
+class ProgressTracker:
+    """Turn uncompressed byte counts into rate-limited percent, throughput and ETA callbacks.
+
+    on_update(percent, rate, eta) receives bytes per second and seconds left
+    (-1 when unknown). Safe to feed from several threads. With a cancellation
+    token, every advance is also a cancellation point.
+    """
+
+    def __init__(self, total, on_update, interval=UPDATE_INTERVAL, cancel=None):
+        self.total = max(0, total)
+        self.on_update = on_update
+        self.interval = interval
+        self.cancel = cancel
+        self.done = 0
+        self.rate = 0.0
+        self.finished = False
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._last_time = self._started
+        self._last_done = 0
+
+    def advance(self, size):
+        check_cancelled(self.cancel)
+        if size <= 0 or self.finished:
+            return
+        with self._lock:
+            self.done += size
+            self._maybe_update(False)
+
+    def finish(self):
+        """Report completion; later updates, e.g. from a lagging reporter thread, are ignored"""
+        with self._lock:
+            self.done = max(self.done, self.total)
+            self.finished = True
+            self._maybe_update(True)
+
+    def percent(self):
+        if not self.total:
+            # Nothing to count: 0 until the work is over.
+            return 100 if self.finished else 0
+        return min(100, int(self.done * 100 / self.total))
+
+    def _maybe_update(self, force):
+        now = time.perf_counter()
+        elapsed = now - self._last_time
+        if not force and elapsed < self.interval:
+            return
+        if elapsed > 0:
+            sample = (self.done - self._last_done) / elapsed
+            self.rate = sample if not self.rate else RATE_SMOOTHING * sample + (1 - RATE_SMOOTHING) * self.rate
+        if not self.rate and now > self._started:
+            self.rate = self.done / (now - self._started)
+        self._last_time = now
+        self._last_done = self.done
+
+        remaining = max(0, self.total - self.done)
+        eta = remaining / self.rate if self.rate > 0 else -1
+        self.on_update(self.percent(), self.rate, eta)
+
+
+class CountingStream(io.RawIOBase):
+    """Pass reads and writes through to fileobj, advancing a ProgressTracker by the bytes moved"""
+
+    def __init__(self, fileobj, tracker):
+        super().__init__()
+        self.fileobj = fileobj
+        self.tracker = tracker
+
+    def readable(self):
+        return self.fileobj.readable()
+
+    def writable(self):
+        return self.fileobj.writable()
+
+    def seekable(self):
+        return self.fileobj.seekable()
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.tracker.advance(len(data))
+        return data
+
+    def readinto(self, buffer):
+        count = self.fileobj.readinto(buffer)
+        self.tracker.advance(count or 0)
+        return count
+
+    def write(self, data):
+        count = self.fileobj.write(data)
+        self.tracker.advance(len(data) if count is None else count)
+        return count
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.fileobj.seek(offset, whence)
+
+    def tell(self):
+        return self.fileobj.tell()
+
+    def flush(self):
+        self.fileobj.flush()
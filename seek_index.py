@@ -0,0 +1,230 @@
+import io
+import lzma
+import zlib
+import struct
+from bisect import bisect_right
+
+from parallel_tar import GZIP_SIZE_SUBFIELD, _XZ_MAGIC, _XZ_FOOTER_MAGIC, _decode_varint
+
+_READ_SIZE = 64 * 1024
+
+
+class SeekIndex:
+    """Places in a compressed tarball where decompression can start afresh.
+
+    Each segment is an xz block or a gzip member, stored as (uncompressed
+    start, compressed start, compressed end, prefix). prefix is fed to a new
+    decoder before the segment's bytes: for xz it is the stream header a lone
+    block needs in order to be decoded.
+    """
+
+    def __init__(self, fmt, segments):
+        self.fmt = fmt
+        self.segments = segments
+        self._starts = [segment[0] for segment in segments]
+
+    def __len__(self):
+        return len(self.segments)
+
+    def segment_at(self, position):
+        """Return the number of the last segment starting at or before an uncompressed position"""
+        return max(0, bisect_right(self._starts, position) - 1)
+
+    def new_decoder(self):
+        if self.fmt == 'xz':
+            return lzma.LZMADecompressor(lzma.FORMAT_XZ)
+        return zlib.decompressobj(31)
+
+
+def build_seek_index(archive_path):
+    """Return the SeekIndex of a .tar.xz or .tar.gz, or None if it can only be read from the start.
+
+    xz files list their blocks in the stream index at the end of the file.
+    gzip members written by LawranZip (and BGZF members) state their own
+    size, so they are found by hopping from header to header. Other gzip
+    files are one deflate stream, which zlib cannot resume part way through
+    from Python, so they are read from the start.
+    """
+    name = archive_path.lower()
+    try:
+        with open(archive_path, 'rb') as f:
+            if name.endswith(('.xz', '.txz')):
+                fmt, segments = 'xz', _xz_segments(f)
+            elif name.endswith(('.gz', '.tgz')):
+                fmt, segments = 'gz', _gzip_segments(f)
+            else:
+                return None
+    except (OSError, ValueError, IndexError, struct.error, zlib.error):
+        return None
+    if not segments or len(segments) < 2:
+        return None
+    return SeekIndex(fmt, segments)
+
+
+def _xz_segments(f):
+    """Return the blocks of every stream in an xz file, read from the stream indexes backwards"""
+    end = f.seek(0, io.SEEK_END)
+    streams = []
+    while end > 0:
+        while end >= 4:
+            f.seek(end - 4)
+            if f.read(4) != b'\0\0\0\0':
+                break
+            end -= 4
+        f.seek(end - 12)
+        footer = f.read(12)
+        if len(footer) != 12 or footer[10:] != _XZ_FOOTER_MAGIC:
+            raise ValueError("Not an xz stream")
+        backward_size = (struct.unpack('<I', footer[4:8])[0] + 1) * 4
+        index_start = end - 12 - backward_size
+        f.seek(index_start)
+        index = f.read(backward_size)
+        if index[0] != 0:
+            raise ValueError("Bad xz index")
+        count, pos = _decode_varint(index, 1)
+        records = []
+        for _ in range(count):
+            unpadded, pos = _decode_varint(index, pos)
+            uncompressed, pos = _decode_varint(index, pos)
+            records.append((unpadded, uncompressed))
+        start = index_start - sum((unpadded + 3) & ~3 for unpadded, _ in records) - 12
+        f.seek(start)
+        header = f.read(12)
+        if start < 0 or header[:6] != _XZ_MAGIC:
+            raise ValueError("Bad xz stream header")
+        streams.append((start, header, records))
+        end = start
+
+    segments = []
+    uncompressed_start = 0
+    for start, header, records in reversed(streams):
+        position = start + 12
+        for unpadded, uncompressed in records:
+            block_end = position + ((unpadded + 3) & ~3)
+            segments.append((uncompressed_start, position, block_end, header))
+            position = block_end
+            uncompressed_start += uncompressed
+    return segments
+
+
+def _gzip_member_size(extra):
+    """Return the member size recorded in a gzip extra field, or None"""
+    pos = 0
+    while pos + 4 <= len(extra):
+        field_id = extra[pos:pos + 2]
+        length = struct.unpack('<H', extra[pos + 2:pos + 4])[0]
+        data = extra[pos + 4:pos + 4 + length]
+        if field_id == GZIP_SIZE_SUBFIELD and length == 4:
+            return struct.unpack('<I', data)[0]
+        if field_id == b'BC' and length == 2:
+            return struct.unpack('<H', data)[0] + 1
+        pos += 4 + length
+    return None
+
+
+def _gzip_segments(f):
+    """Hop through gzip members that state their size; None if any member does not"""
+    end = f.seek(0, io.SEEK_END)
+    segments = []
+    position = 0
+    uncompressed_start = 0
+    while position < end:
+        f.seek(position)
+        header = f.read(12)
+        if len(header) < 12 or header[:3] != b'\x1f\x8b\x08' or not header[3] & 0x04:
+            return None
+        size = _gzip_member_size(f.read(struct.unpack('<H', header[10:12])[0]))
+        if size is None or position + size > end:
+            return None
+        f.seek(position + size - 4)
+        segments.append((uncompressed_start, position, position + size, b''))
+        uncompressed_start += struct.unpack('<I', f.read(4))[0]
+        position += size
+    return segments
+
+
+class SeekableTarStream(io.RawIOBase):
+    """Read-only, seekable view of the uncompressed stream of a tarball.
+
+    Reads decode forward from the current segment. A seek backwards, or
+    further ahead than the next segment start, restarts decoding at the
+    segment holding the target instead of inflating everything before it.
+    """
+
+    def __init__(self, fileobj, seek_index):
+        super().__init__()
+        self.fileobj = fileobj
+        self.seek_index = seek_index
+        self._start(0)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def _start(self, segment):
+        start, compressed_start, _, prefix = self.seek_index.segments[segment]
+        self._segment = segment
+        self._decoder = self.seek_index.new_decoder()
+        if prefix:
+            self._decoder.decompress(prefix)
+        self._compressed_position = compressed_start
+        self._buffer = b''
+        self._offset = 0
+        self._position = start
+
+    def _fill(self):
+        """Decode more of the stream into the buffer; return False at its end"""
+        segments = self.seek_index.segments
+        while True:
+            compressed_end = segments[self._segment][2]
+            if self._compressed_position >= compressed_end:
+                if self._segment + 1 >= len(segments):
+                    return False
+                self._start(self._segment + 1)
+                continue
+            self.fileobj.seek(self._compressed_position)
+            data = self.fileobj.read(min(_READ_SIZE, compressed_end - self._compressed_position))
+            if not data:
+                raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+            self._compressed_position += len(data)
+            output = self._decoder.decompress(data)
+            if output:
+                self._buffer = output
+                self._offset = 0
+                return True
+
+    def readinto(self, buffer):
+        # tarfile expects whole header blocks, so fill the buffer completely
+        # unless the stream ends.
+        view = memoryview(buffer).cast('B')
+        filled = 0
+        while filled < len(view):
+            if self._offset >= len(self._buffer) and not self._fill():
+                break
+            count = min(len(view) - filled, len(self._buffer) - self._offset)
+            view[filled:filled + count] = self._buffer[self._offset:self._offset + count]
+            self._offset += count
+            self._position += count
+            filled += count
+        return filled
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("Cannot seek from the end of a compressed stream")
+        segment = self.seek_index.segment_at(offset)
+        if offset < self._position or self.seek_index.segments[segment][0] > self._position:
+            self._start(segment)
+        while self._position < offset:
+            if self._offset >= len(self._buffer) and not self._fill():
+                break
+            step = min(offset - self._position, len(self._buffer) - self._offset)
+            self._offset += step
+            self._position += step
+        return self._position
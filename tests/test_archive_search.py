@@ -0,0 +1,55 @@
+import re
+import unittest
+
+from archive_listing import ArchiveListing
+from archive_search import ArchiveSearchIndex, _regex_literal
+
+
+class ArchiveSearch(unittest.TestCase):
+    """Queries must find the same entries with and without the trigram index"""
+
+    def setUp(self):
+        self.names = ['docs/', 'docs/Readme.md', 'docs/guide.txt', 'src/main.py', 'src/util/Abcd.py',
+                      'src/util/xabcdx.py', 'build/abc.o']
+        listing = ArchiveListing()
+        for name in self.names:
+            listing.append(name, 1, 1, name.endswith('/'))
+        self.index = ArchiveSearchIndex(listing)
+        # Two chunks, as when the listing arrives while it is being read.
+        self.index.update(limit=3)
+        self.index.update()
+
+    def tearDown(self):
+        self.index.close()
+
+    def found(self, query):
+        return [self.names[i] for i in self.index.search(query)]
+
+    def check(self, query, expected):
+        self.assertEqual(self.found(query), expected, query)
+        if self.index.build_trigram_index():
+            self.assertEqual(self.found(query), expected, query + ' (trigram index)')
+
+    def test_substring(self):
+        self.check('abcd', ['src/util/Abcd.py', 'src/util/xabcdx.py'])
+
+    def test_glob(self):
+        self.check('*.py', ['src/main.py', 'src/util/Abcd.py', 'src/util/xabcdx.py'])
+        self.check('src/*.py', ['src/main.py'])
+        self.check('src/**.py', ['src/main.py', 'src/util/Abcd.py', 'src/util/xabcdx.py'])
+
+    def test_regex(self):
+        self.check(r're:^docs/.*\.(md|txt)$', ['docs/Readme.md', 'docs/guide.txt'])
+        self.check(r're:\x41bcd\.', ['src/util/Abcd.py'])
+        self.check(r're:\101bcd\.', ['src/util/Abcd.py'])
+
+    def test_literal_skips_character_codes(self):
+        self.assertEqual(_regex_literal(re.compile(r'\x41bcd')), 'bcd')
+        self.assertEqual(_regex_literal(re.compile(r'\u0041bcd')), 'bcd')
+        self.assertEqual(_regex_literal(re.compile(r'\101bcd')), 'bcd')
+        self.assertEqual(_regex_literal(re.compile(r'(a)\1bcd')), 'bcd')
+        self.assertEqual(_regex_literal(re.compile(r'\N{DIGIT ONE}bcd')), 'bcd')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+
+from PySide6.QtCore import QCoreApplication, Qt
+
+from archive_index import ArchiveIndex
+from archive_listing import ArchiveListing
+from archive_tree_model import ArchiveTreeModel
+from tri_state import CHECKED, PARTIALLY_CHECKED, UNCHECKED
+
+
+class FilteredCheckStates(unittest.TestCase):
+    """Checking a folder while a filter is set only changes the rows the filter shows"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QCoreApplication.instance() or QCoreApplication([])
+
+    def setUp(self):
+        listing = ArchiveListing()
+        for name in ['docs/', 'docs/a.txt', 'docs/b.md', 'docs/sub/', 'docs/sub/c.txt', 'docs/sub/d.md', 'e.txt']:
+            listing.append(name, 1, 1, name.endswith('/'))
+        self.listing = listing
+        self.archive_index = ArchiveIndex(listing)
+        self.model = ArchiveTreeModel(self.archive_index, None, None, str)
+
+    def node(self, path):
+        return self.archive_index.node_of[self.listing.names.index(path)]
+
+    def state(self, path):
+        return self.model.selection[self.node(path)]
+
+    def show_entries(self, *paths):
+        self.model.set_filter([self.listing.names.index(path) for path in paths])
+
+    def click(self, path):
+        node = self.node(path)
+        checked = self.state(path) != CHECKED
+        index = self.model.createIndex(0, 0, node)
+        self.model.setData(index, Qt.CheckState.Checked if checked else Qt.CheckState.Unchecked,
+                           Qt.ItemDataRole.CheckStateRole)
+
+    def test_unfiltered_folder_checks_everything(self):
+        self.click('docs/')
+        self.assertEqual(self.state('docs/b.md'), CHECKED)
+        self.assertEqual(self.state('docs/sub/d.md'), CHECKED)
+        self.assertEqual(self.state('e.txt'), UNCHECKED)
+
+    def test_filtered_folder_checks_shown_files_only(self):
+        self.show_entries('docs/a.txt', 'docs/sub/c.txt')
+        self.click('docs/')
+        self.assertEqual(self.state('docs/a.txt'), CHECKED)
+        self.assertEqual(self.state('docs/sub/c.txt'), CHECKED)
+        self.assertEqual(self.state('docs/b.md'), UNCHECKED)
+        self.assertEqual(self.state('docs/sub/d.md'), UNCHECKED)
+        self.assertEqual(self.state('docs/'), PARTIALLY_CHECKED)
+        self.assertEqual(self.model.checked_paths(), ['docs/a.txt', 'docs/sub/c.txt'])
+
+        # Clicking the partly checked folder again unchecks what it shows.
+        self.click('docs/')
+        self.assertEqual(self.model.checked_paths(), [])
+
+    def test_matched_folder_checks_its_contents(self):
+        self.show_entries('docs/sub/')
+        self.click('docs/')
+        self.assertEqual(self.state('docs/sub/'), CHECKED)
+        self.assertEqual(self.state('docs/sub/d.md'), CHECKED)
+        self.assertEqual(self.state('docs/a.txt'), UNCHECKED)
+
+    def test_filtered_uncheck_keeps_hidden_files(self):
+        self.click('docs/')
+        self.show_entries('docs/a.txt')
+        self.click('docs/a.txt')
+        self.assertEqual(self.state('docs/a.txt'), UNCHECKED)
+        self.assertEqual(self.state('docs/b.md'), CHECKED)
+        self.model.set_filter(None)
+        self.assertEqual(self.state('docs/'), PARTIALLY_CHECKED)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import os
+import tempfile
+import unittest
+
+import archive_engine
+from backup import BackupJob, BackupManifest, RestoreJob, backup_chain, manifest_path
+
+
+class BackupChain(unittest.TestCase):
+    """Full, incremental and differential backups restore the files as they were at each one"""
+
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.temp.name, 'data')
+        self.backups = os.path.join(self.temp.name, 'backups')
+        os.makedirs(self.backups)
+        self.cache = archive_engine.LISTING_CACHE.path
+        archive_engine.LISTING_CACHE.path = os.path.join(self.temp.name, 'listings.sqlite')
+        self.write({'a.txt': b'a1', 'sub/b.txt': b'b1', 'sub/c.txt': b'c1'})
+
+    def tearDown(self):
+        archive_engine.LISTING_CACHE.path = self.cache
+        self.temp.cleanup()
+
+    def write(self, contents):
+        for name, data in contents.items():
+            path = os.path.join(self.src, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+            # A later second, so the size and time check notices the change.
+            stat = os.stat(path)
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2 * 10 ** 9))
+
+    def snapshot(self, folder):
+        files = {}
+        for dirpath, _, filenames in os.walk(folder):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                with open(path, 'rb') as f:
+                    files[os.path.relpath(path, folder).replace(os.sep, '/')] = f.read()
+        return files
+
+    def backup(self, name, mode='full', previous=None, **kwargs):
+        archive = os.path.join(self.backups, name)
+        job = BackupJob(archive, [self.src], mode, previous, **kwargs)
+        job.run()
+        return archive, job.manifest
+
+    def restore(self, archive, destination='restore'):
+        out = os.path.join(self.temp.name, destination)
+        RestoreJob(archive, out).run()
+        return self.snapshot(os.path.join(out, 'data'))
+
+    def test_incremental_chain(self):
+        full, manifest = self.backup('full.zip')
+        self.assertEqual(sorted(manifest.packed), ['data/a.txt', 'data/sub/b.txt', 'data/sub/c.txt'])
+        states = [(full, self.snapshot(self.src))]
+
+        self.write({'a.txt': b'a2', 'sub/d.txt': b'd2'})
+        os.remove(os.path.join(self.src, 'sub', 'c.txt'))
+        first, manifest = self.backup('inc1.zip', 'incremental', full)
+        self.assertEqual(sorted(manifest.packed), ['data/a.txt', 'data/sub/d.txt'])
+        states.append((first, self.snapshot(self.src)))
+
+        self.write({'sub/b.txt': b'b3'})
+        second, manifest = self.backup('inc2.zip', 'incremental', first)
+        self.assertEqual(manifest.packed, ['data/sub/b.txt'])
+        states.append((second, self.snapshot(self.src)))
+        self.assertEqual([path for path, _ in backup_chain(second)], [full, first, second])
+
+        for number, (archive, expected) in enumerate(states):
+            self.assertEqual(self.restore(archive, f'restore{number}'), expected)
+
+        # Restoring over an older restore deletes what was removed since.
+        self.assertEqual(self.restore(full, 'again'), states[0][1])
+        self.assertEqual(self.restore(second, 'again'), states[2][1])
+
+    def test_differential(self):
+        full, _ = self.backup('full.tar.xz', profile='fast')
+        self.write({'a.txt': b'a2'})
+        first, _ = self.backup('diff1.tar.xz', 'differential', full, profile='fast')
+        self.write({'sub/b.txt': b'b3'})
+        second, manifest = self.backup('diff2.tar.xz', 'differential', first, profile='fast')
+        self.assertEqual(sorted(manifest.packed), ['data/a.txt', 'data/sub/b.txt'])
+        self.assertEqual([path for path, _ in backup_chain(second)], [full, second])
+        self.assertEqual(self.restore(second), self.snapshot(self.src))
+
+    def test_unchanged_content_is_not_packed(self):
+        full, _ = self.backup('full.zip')
+        # Same bytes with a new time: hashed again, found equal and not packed.
+        self.write({'a.txt': b'a1'})
+        _, manifest = self.backup('inc.zip', 'incremental', full)
+        self.assertEqual(manifest.packed, [])
+        self.assertEqual(BackupManifest.load(manifest_path(os.path.join(self.backups, 'inc.zip'))).files,
+                         manifest.files)
+
+    def test_split_backup(self):
+        with open(os.path.join(self.src, 'big.bin'), 'wb') as f:
+            f.write(os.urandom(300 * 1024))
+        full, _ = self.backup('full.zip', profile='store', volume_size=100 * 1024)
+        self.assertFalse(os.path.exists(full))
+        self.assertTrue(os.path.exists(manifest_path(full)))
+        self.assertEqual(self.restore(full + '.002'), self.snapshot(self.src))
+
+    def test_incremental_needs_a_previous_backup(self):
+        with self.assertRaises(Exception):
+            BackupJob(os.path.join(self.backups, 'inc.zip'), [self.src], 'incremental')
+        with self.assertRaisesRegex(Exception, 'No backup manifest'):
+            self.backup('inc.zip', 'incremental', os.path.join(self.backups, 'missing.zip'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import io
+import os
+import tempfile
+import unittest
+import zipfile
+
+from archive_engine import ArchiveJob
+from cancellation import CancellableStream, CancellationToken, OperationCancelled
+
+
+class CancellableStreamReads(unittest.TestCase):
+    """Reads pass through in max_read pieces until the token is cancelled"""
+
+    def test_read_to_end(self):
+        data = bytes(range(256)) * 100
+        for size in (-1, None):
+            stream = CancellableStream(io.BytesIO(data), CancellationToken(), max_read=1000)
+            self.assertEqual(stream.read(size), data)
+        stream = CancellableStream(io.BytesIO(data), CancellationToken(), max_read=1000)
+        self.assertEqual(stream.read(5000), data[:1000])
+
+    def test_cancelled(self):
+        token = CancellationToken()
+        stream = CancellableStream(io.BytesIO(b'data'), token)
+        token.cancel()
+        with self.assertRaises(OperationCancelled):
+            stream.read()
+        with self.assertRaises(OperationCancelled):
+            stream.readinto(bytearray(4))
+
+
+class CancelledJobs(unittest.TestCase):
+    """A cancelled job stops at its next check and leaves nothing half done behind"""
+
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.temp.name, 'src')
+        os.makedirs(self.src)
+        for i in range(5):
+            with open(os.path.join(self.src, f'f{i}'), 'wb') as f:
+                f.write(os.urandom(3 * 1024 * 1024))
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def run_cancelled(self, *args, **kwargs):
+        """Run a job that cancels itself as soon as it reports its first file"""
+        job = ArchiveJob(*args, on_file=lambda text: job.cancel(), **kwargs)
+        with self.assertRaises(OperationCancelled):
+            job.run()
+
+    def make_zip(self):
+        archive = os.path.join(self.temp.name, 'a.zip')
+        ArchiveJob('create', None, archive, files_to_add=[self.src], profile='store').run()
+        return archive
+
+    def test_create_removes_the_archive(self):
+        for name in ('a.zip', 'a.tar.gz', 'a.tar.xz', 'a.7z'):
+            archive = os.path.join(self.temp.name, name)
+            self.run_cancelled('create', None, archive, files_to_add=[self.src], profile='fast')
+            self.assertFalse(os.path.exists(archive), name)
+
+    def test_create_removes_every_volume(self):
+        archive = os.path.join(self.temp.name, 'a.zip')
+        self.run_cancelled('create', None, archive, files_to_add=[self.src], profile='store',
+                           volume_size=1024 * 1024)
+        self.assertEqual(os.listdir(self.temp.name), ['src'])
+
+    def test_extract_removes_only_new_files(self):
+        archive = self.make_zip()
+        out = os.path.join(self.temp.name, 'out')
+        os.makedirs(os.path.join(out, 'src'))
+        kept = os.path.join(out, 'src', 'kept')
+        with open(kept, 'w') as f:
+            f.write('kept')
+        self.run_cancelled('extract', archive, out)
+        self.assertEqual(os.listdir(os.path.join(out, 'src')), ['kept'])
+
+    def test_update_leaves_the_archive_as_it_was(self):
+        archive = self.make_zip()
+        with open(archive, 'rb') as f:
+            before = f.read()
+        extra = os.path.join(self.temp.name, 'extra')
+        os.makedirs(extra)
+        for i in range(3):
+            with open(os.path.join(extra, f'g{i}'), 'wb') as f:
+                f.write(os.urandom(1024 * 1024))
+        for remove in ([], ['src/f0']):
+            self.run_cancelled('update', None, archive, files_to_add=[extra], files_to_remove=remove)
+            with open(archive, 'rb') as f:
+                self.assertEqual(f.read(), before)
+            with zipfile.ZipFile(archive) as zf:
+                self.assertIsNone(zf.testzip())
+        self.assertEqual(sorted(os.listdir(self.temp.name)), ['a.zip', 'extra', 'src'])
+
+
+if __name__ == '__main__':
+    unittest.main()
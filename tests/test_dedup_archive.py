@@ -0,0 +1,108 @@
+import io
+import os
+import random
+import tempfile
+import unittest
+
+import archive_engine
+from archive_engine import ArchiveJob, list_archive
+from dedup_archive import MAX_CHUNK_SIZE, MIN_CHUNK_SIZE, DedupArchiveReader, DedupArchiveWriter, iter_chunks
+
+
+class ContentDefinedChunks(unittest.TestCase):
+    """Chunks depend on content, not position"""
+
+    def setUp(self):
+        self.data = random.Random(24).randbytes(3 * 1024 * 1024)
+
+    def chunks(self, data):
+        return list(iter_chunks(io.BytesIO(data)))
+
+    def test_chunks_cover_the_data(self):
+        chunks = self.chunks(self.data)
+        self.assertEqual(b''.join(chunks), self.data)
+        self.assertTrue(all(MIN_CHUNK_SIZE <= len(chunk) <= MAX_CHUNK_SIZE for chunk in chunks[:-1]))
+        self.assertEqual(self.chunks(b''), [])
+        self.assertEqual(self.chunks(b'abc'), [b'abc'])
+
+    def test_insertion_only_changes_nearby_chunks(self):
+        before = self.chunks(self.data)
+        after = self.chunks(self.data[:1000000] + b'inserted' + self.data[1000000:])
+        self.assertGreater(len(set(before) & set(after)), len(before) - 3)
+
+    def test_repeated_byte_is_cut_at_the_maximum(self):
+        chunks = self.chunks(bytes(2 * MAX_CHUNK_SIZE + 5))
+        self.assertEqual([len(chunk) for chunk in chunks], [MAX_CHUNK_SIZE, MAX_CHUNK_SIZE, 5])
+
+
+class DedupArchiveRoundTrip(unittest.TestCase):
+    """Files sharing content are stored once and come back whole"""
+
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.temp.name, 'src')
+        os.makedirs(os.path.join(self.src, 'copy', 'empty'))
+        data = random.Random(25).randbytes(2 * 1024 * 1024)
+        self.contents = {
+            'a.bin': data,
+            'copy/a.bin': data,
+            'copy/shifted.bin': b'header' + data,
+            'text.txt': b'text\n' * 1000,
+            'zero': b'',
+        }
+        for name, content in self.contents.items():
+            with open(os.path.join(self.src, name), 'wb') as f:
+                f.write(content)
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def test_writer_and_reader(self):
+        out = io.BytesIO()
+        writer = DedupArchiveWriter(out, workers=1)
+        writer.add_directory(self.src, 'src')
+        for name in self.contents:
+            writer.add_file(os.path.join(self.src, name), 'src/' + name)
+        writer.close()
+        self.assertEqual(writer.total_bytes, sum(len(content) for content in self.contents.values()))
+        self.assertLess(writer.unique_bytes, len(self.contents['a.bin']) * 1.1)
+
+        reader = DedupArchiveReader(out)
+        self.assertEqual([member.name for member in reader.members],
+                         ['src'] + ['src/' + name for name in self.contents])
+        for member in reader.members[1:]:
+            self.assertEqual(b''.join(reader.read_chunks(member)), self.contents[member.name[4:]], member.name)
+        self.assertLess(sum(reader.packed_sizes()), len(self.contents['a.bin']) * 1.2)
+
+    def test_damage_is_detected(self):
+        out = io.BytesIO()
+        writer = DedupArchiveWriter(out, workers=1)
+        writer.add_file(os.path.join(self.src, 'text.txt'), 'text.txt')
+        writer.close()
+        with self.assertRaisesRegex(Exception, 'Not a LawranZip dedup archive'):
+            DedupArchiveReader(io.BytesIO(b'x' + out.getvalue()))
+        with self.assertRaisesRegex(Exception, 'Damaged'):
+            DedupArchiveReader(io.BytesIO(out.getvalue()[:-1]))
+
+    def test_archive_job(self):
+        archive = os.path.join(self.temp.name, 'a.ldz')
+        ArchiveJob('create', None, archive, files_to_add=[self.src], profile='fast').run()
+        self.assertLess(os.path.getsize(archive), len(self.contents['a.bin']) * 1.2)
+        self.assertEqual(archive_engine.test_archive(archive), [])
+        listing = list_archive(archive, use_cache=False)
+        self.assertIn('src/copy/empty', [name.rstrip('/') for name in listing.names])
+
+        out = os.path.join(self.temp.name, 'out')
+        ArchiveJob('extract', archive, out).run()
+        self.assertTrue(os.path.isdir(os.path.join(out, 'src', 'copy', 'empty')))
+        for name, content in self.contents.items():
+            with open(os.path.join(out, 'src', name), 'rb') as f:
+                self.assertEqual(f.read(), content, name)
+
+        one = os.path.join(self.temp.name, 'one')
+        ArchiveJob('extract', archive, one, files_to_extract=['src/copy/shifted.bin']).run()
+        self.assertEqual(os.listdir(os.path.join(one, 'src', 'copy')), ['shifted.bin'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import importlib.util
+import io
+import os
+import tarfile
+import tempfile
+import unittest
+import zipfile
+
+import pyzipper
+
+import archive_engine
+from archive_engine import ArchiveJob, list_archive
+from fast_codecs import load_zstd, open_tar_stream, register_zip_zstd
+from profiles import ZIP_ZSTANDARD
+
+
+def _has_zstd():
+    try:
+        load_zstd()
+    except Exception:
+        return False
+    return True
+
+
+HAS_ZSTD = _has_zstd()
+HAS_LZ4 = importlib.util.find_spec('lz4') is not None
+
+
+class FastCodecRoundTrip(unittest.TestCase):
+    """tar.zst, tar.lz4 and Zstandard ZIP members written by ArchiveJob read back"""
+
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.temp.name, 'src')
+        os.makedirs(os.path.join(self.src, 'd'))
+        self.contents = {'a.txt': b'some text\n' * 50000, 'd/b.bin': os.urandom(100 * 1024), 'd/empty': b''}
+        for name, data in self.contents.items():
+            with open(os.path.join(self.src, name), 'wb') as f:
+                f.write(data)
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def check_extract(self, archive, password=None):
+        self.assertEqual(archive_engine.test_archive(archive, password), [])
+        listing = list_archive(archive, password, use_cache=False)
+        self.assertEqual({name for i, name in enumerate(listing.names) if not listing.is_dir(i)},
+                         {'src/' + name for name in self.contents})
+        out = os.path.join(self.temp.name, 'out')
+        ArchiveJob('extract', archive, out, password=password).run()
+        for name, data in self.contents.items():
+            with open(os.path.join(out, 'src', name), 'rb') as f:
+                self.assertEqual(f.read(), data, name)
+
+    def create(self, name, **kwargs):
+        archive = os.path.join(self.temp.name, name)
+        ArchiveJob('create', None, archive, files_to_add=[self.src], **kwargs).run()
+        return archive
+
+    @unittest.skipUnless(HAS_ZSTD, "needs Python 3.14 or backports.zstd")
+    def test_tar_zst(self):
+        for profile in ('fast', 'max'):
+            archive = self.create('a.tar.zst', profile=profile)
+            with open(archive, 'rb') as f:
+                self.assertEqual(f.read(4), b'\x28\xb5\x2f\xfd')
+            self.check_extract(archive)
+
+    @unittest.skipUnless(HAS_ZSTD, "needs Python 3.14 or backports.zstd")
+    def test_tzst_stream(self):
+        out = io.BytesIO()
+        with open_tar_stream('a.tzst', out, 'w', 3) as stream, tarfile.open(fileobj=stream, mode='w') as tf:
+            tf.add(os.path.join(self.src, 'a.txt'), 'a.txt')
+        out.seek(0)
+        with open_tar_stream('a.tzst', out, 'r') as stream, tarfile.open(fileobj=stream, mode='r:') as tf:
+            self.assertEqual(tf.extractfile('a.txt').read(), self.contents['a.txt'])
+        self.assertIsNone(open_tar_stream('a.tar.gz', out, 'r'))
+
+    @unittest.skipUnless(HAS_LZ4, "needs the lz4 package")
+    def test_tar_lz4(self):
+        archive = self.create('a.tar.lz4', profile='fast')
+        with open(archive, 'rb') as f:
+            self.assertEqual(f.read(4), b'\x04\x22\x4d\x18')
+        self.check_extract(archive)
+
+    @unittest.skipUnless(HAS_ZSTD, "needs Python 3.14 or backports.zstd")
+    def test_zip_zstd(self):
+        archive = self.create('a.zip', profile='normal', zip_method='zstd')
+        with zipfile.ZipFile(archive) as zf:
+            # Random data is stored as it is.
+            self.assertEqual(zf.getinfo('src/a.txt').compress_type, ZIP_ZSTANDARD)
+            self.assertEqual(zf.getinfo('src/d/b.bin').compress_type, zipfile.ZIP_STORED)
+        self.check_extract(archive)
+
+    @unittest.skipUnless(HAS_ZSTD, "needs Python 3.14 or backports.zstd")
+    def test_encrypted_zip_zstd(self):
+        archive = self.create('a.zip', profile='normal', zip_method='zstd', password='pw')
+        register_zip_zstd()
+        with pyzipper.AESZipFile(archive) as zf:
+            zf.setpassword(b'pw')
+            self.assertEqual(zf.read('src/a.txt'), self.contents['a.txt'])
+        self.check_extract(archive, 'pw')
+
+    def test_unknown_zip_method(self):
+        with self.assertRaisesRegex(Exception, 'Unknown ZIP compression method'):
+            ArchiveJob('create', None, os.path.join(self.temp.name, 'a.zip'), zip_method='brotli')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+import zipfile
+from contextlib import closing
+
+import archive_engine
+from archive_engine import list_archive
+from archive_listing import ArchiveListing
+from listing_cache import ListingCache
+
+
+class ListingCacheRoundTrip(unittest.TestCase):
+    """Stored listings come back column for column until their archive changes"""
+
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.cache = ListingCache(os.path.join(self.temp.name, 'cache', 'listings.sqlite'))
+        self.archive = os.path.join(self.temp.name, 'a.zip')
+        with zipfile.ZipFile(self.archive, 'w') as zf:
+            zf.writestr('a.txt', 'a')
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def listing(self, count=3):
+        listing = ArchiveListing()
+        for i in range(count):
+            listing.append(f'dir/f{i}\udcff', i * 1000, i * 10, False, 1700000000.5 + i,
+                           encrypted=i == 1, offset=i * 512)
+        listing.append('dir/', 0, 0, True)
+        return listing
+
+    def assert_same(self, loaded, listing):
+        self.assertIsNotNone(loaded)
+        self.assertEqual(loaded.names, listing.names)
+        for column in ('size', 'compressed_size', 'mtime', 'flags', 'offset'):
+            self.assertEqual(getattr(loaded, column), getattr(listing, column), column)
+
+    def test_store_and_load(self):
+        listing = self.listing()
+        self.assertIsNone(self.cache.load(self.archive))
+        self.cache.store(self.archive, listing)
+        self.assert_same(self.cache.load(self.archive), listing)
+
+    def test_empty_listing(self):
+        self.cache.store(self.archive, ArchiveListing())
+        self.assertEqual(len(self.cache.load(self.archive)), 0)
+
+    def test_changed_archive_is_missed(self):
+        self.cache.store(self.archive, self.listing())
+        with zipfile.ZipFile(self.archive, 'a') as zf:
+            zf.writestr('b.txt', 'b')
+        self.assertIsNone(self.cache.load(self.archive))
+
+    def test_least_recently_used_are_evicted(self):
+        archives = []
+        for i in range(3):
+            path = os.path.join(self.temp.name, f'{i}.zip')
+            with open(path, 'wb') as f:
+                f.write(bytes(i + 1))
+            archives.append(path)
+        listing = self.listing(2000)
+        self.cache.store(archives[0], listing)
+        with closing(sqlite3.connect(self.cache.path)) as connection:
+            size = connection.execute("SELECT bytes FROM listings").fetchone()[0]
+        # Room for two listings.
+        self.cache.max_bytes = size * 2
+        for step in (lambda: self.cache.store(archives[1], listing), lambda: self.cache.load(archives[0]),
+                     lambda: self.cache.store(archives[2], listing)):
+            time.sleep(0.05)
+            step()
+        self.assertEqual([self.cache.load(path) is not None for path in archives], [True, False, True])
+
+    def test_unusable_database_is_ignored(self):
+        os.makedirs(os.path.dirname(self.cache.path))
+        with open(self.cache.path, 'wb') as f:
+            f.write(b'not a database' * 100)
+        self.cache.store(self.archive, self.listing())
+        self.assertIsNone(self.cache.load(self.archive))
+        self.cache.clear()
+        self.assertFalse(os.path.exists(self.cache.path))
+
+    def test_list_archive_uses_the_cache(self):
+        cache = archive_engine.LISTING_CACHE
+        archive_engine.LISTING_CACHE = self.cache
+        try:
+            listing = list_archive(self.archive)
+            self.assertEqual(listing.names, ['a.txt'])
+            self.assert_same(self.cache.load(self.archive), listing)
+            # A password-protected listing is never written out.
+            self.cache.clear()
+            list_archive(self.archive, password='pw')
+            self.assertIsNone(self.cache.load(self.archive))
+            self.assertEqual(list_archive(self.archive, use_cache=False).names, ['a.txt'])
+        finally:
+            archive_engine.LISTING_CACHE = cache
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import tempfile
+import unittest
+
+import py7zr
+
+from parallel_7z import ParallelSevenZipWriter
+from profiles import SEVEN_ZIP_PROFILES
+
+
+class ParallelSevenZipRoundTrip(unittest.TestCase):
+    """Archives split into several blocks must extract with py7zr, which LawranZip extracts with"""
+
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.temp.name, 'src')
+        os.makedirs(os.path.join(self.src, 'd', 'e'))
+        self.contents = {
+            'big': os.urandom(2 * 1024 * 1024),
+            's': b's\n',
+            'd/s2': b's2\n',
+            'd/e/empty': b'',
+            'd/e/text': b'some text\n' * 200000,
+        }
+        for name, data in self.contents.items():
+            with open(os.path.join(self.src, name), 'wb') as f:
+                f.write(data)
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def round_trip(self, entries, password=None):
+        archive = os.path.join(self.temp.name, 'out.7z')
+        writer = ParallelSevenZipWriter(archive, SEVEN_ZIP_PROFILES['fast'], password=password,
+                                        block_size=1024 * 1024, workers=1)
+        writer.write_files([(os.path.join(self.src, name), name) for name in entries])
+        out = os.path.join(self.temp.name, 'out')
+        with py7zr.SevenZipFile(archive, 'r', password=password) as zf:
+            self.assertIsNone(zf.testzip())
+        with py7zr.SevenZipFile(archive, 'r', password=password) as zf:
+            zf.extractall(out)
+        for name in entries:
+            path = os.path.join(out, name)
+            if name in self.contents:
+                with open(path, 'rb') as f:
+                    self.assertEqual(f.read(), self.contents[name], name)
+            else:
+                self.assertTrue(os.path.isdir(path), name)
+
+    def test_folder_after_file_in_later_block(self):
+        self.round_trip(['big', 's', 'd', 'd/s2'])
+
+    def test_folders_and_empty_files_across_blocks(self):
+        self.round_trip(['big', 's', 'd', 'd/e', 'd/e/empty', 'd/e/text', 'd/s2'])
+
+    def test_encrypted(self):
+        self.round_trip(['big', 's', 'd', 'd/e', 'd/e/empty', 'd/s2'], password='pw')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import gzip
+import io
+import lzma
+import os
+import random
+import tarfile
+import tempfile
+import unittest
+
+import archive_engine
+from archive_engine import ArchiveJob
+from parallel_tar import ParallelCompressedStream
+from seek_index import build_seek_index
+
+
+class ParallelCompressedStreamRoundTrip(unittest.TestCase):
+    """Blocks compressed apart must read back as one stream with lzma and gzip"""
+
+    def setUp(self):
+        rng = random.Random(3)
+        self.data = rng.randbytes(300 * 1024) + b'some text\n' * 100000 + rng.randbytes(1000)
+
+    def compress(self, fmt, data, workers=1, level=1):
+        out = io.BytesIO()
+        stream = ParallelCompressedStream(out, fmt, level, block_size=256 * 1024, workers=workers)
+        # Writes of every size, not lined up with the blocks.
+        for start in range(0, len(data), 100000):
+            self.assertEqual(stream.write(data[start:start + 100000]), len(data[start:start + 100000]))
+        self.assertEqual(stream.tell(), len(data))
+        stream.close()
+        return out.getvalue()
+
+    def test_xz(self):
+        self.assertEqual(lzma.decompress(self.compress('xz', self.data)), self.data)
+
+    def test_gzip(self):
+        self.assertEqual(gzip.decompress(self.compress('gz', self.data)), self.data)
+
+    def test_pool(self):
+        self.assertEqual(lzma.decompress(self.compress('xz', self.data, workers=2)), self.data)
+        self.assertEqual(gzip.decompress(self.compress('gz', self.data, workers=2)), self.data)
+
+    def test_empty(self):
+        self.assertEqual(lzma.decompress(self.compress('xz', b'')), b'')
+        self.assertEqual(gzip.decompress(self.compress('gz', b'')), b'')
+
+    def test_blocks_are_indexed(self):
+        with tempfile.TemporaryDirectory() as temp:
+            for fmt in ('xz', 'gz'):
+                path = os.path.join(temp, 'a.tar.' + fmt)
+                with open(path, 'wb') as f:
+                    f.write(self.compress(fmt, self.data))
+                seek_index = build_seek_index(path)
+                self.assertEqual(len(seek_index), -(-len(self.data) // (256 * 1024)), fmt)
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            ParallelCompressedStream(io.BytesIO(), 'bz2')
+
+
+class TarArchiveRoundTrip(unittest.TestCase):
+    """Tarballs created by ArchiveJob extract to the same tree"""
+
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.temp.name, 'src')
+        os.makedirs(os.path.join(self.src, 'd', 'empty'))
+        self.contents = {
+            'a.txt': b'hello\n' * 1000,
+            'd/b.bin': random.Random(4).randbytes(200 * 1024),
+            'd/c': b'',
+        }
+        for name, data in self.contents.items():
+            with open(os.path.join(self.src, name), 'wb') as f:
+                f.write(data)
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def round_trip(self, name, profile='fast'):
+        archive = os.path.join(self.temp.name, name)
+        progress = []
+        ArchiveJob('create', None, archive, files_to_add=[self.src], profile=profile,
+                   on_progress=progress.append).run()
+        self.assertEqual(progress[-1], 100)
+        self.assertEqual(archive_engine.test_archive(archive), [])
+        with tarfile.open(archive) as tf:
+            self.assertIn('src/d/empty', tf.getnames())
+        out = os.path.join(self.temp.name, 'out')
+        ArchiveJob('extract', archive, out).run()
+        self.assertTrue(os.path.isdir(os.path.join(out, 'src', 'd', 'empty')))
+        for member, data in self.contents.items():
+            with open(os.path.join(out, 'src', member), 'rb') as f:
+                self.assertEqual(f.read(), data, member)
+
+    def test_tar(self):
+        self.round_trip('a.tar')
+
+    def test_tar_gz(self):
+        self.round_trip('a.tar.gz')
+
+    def test_tgz(self):
+        self.round_trip('a.tgz', profile='max')
+
+    def test_tar_xz(self):
+        self.round_trip('a.tar.xz')
+
+
+if __name__ == '__main__':
+    unittest.main()
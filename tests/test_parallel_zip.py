@@ -0,0 +1,119 @@
+import os
+import random
+import tempfile
+import unittest
+import zipfile
+import zlib
+
+import pyzipper
+
+from parallel_zip import ParallelZipExtractor, ParallelZipWriter, crc32_combine
+
+
+class ParallelZipRoundTrip(unittest.TestCase):
+    """Members compressed chunk by chunk in a process pool must read back with zipfile"""
+
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.temp.name, 'src')
+        os.makedirs(os.path.join(self.src, 'd'))
+        rng = random.Random(1)
+        # Over INLINE_THRESHOLD in total, so the pool is used.
+        self.contents = {
+            'random': rng.randbytes(5 * 1024 * 1024 + 123),
+            'text': b'a line of text\n' * 400000,
+            'empty': b'',
+            'd/small': b'small\n',
+        }
+        for name, data in self.contents.items():
+            with open(os.path.join(self.src, name), 'wb') as f:
+                f.write(data)
+        self.entries = [(os.path.join(self.src, name), name) for name in self.contents]
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def check_members(self, zf):
+        self.assertIsNone(zf.testzip())
+        for name, data in self.contents.items():
+            self.assertEqual(zf.read(name), data, name)
+
+    def test_crc32_combine(self):
+        a, b = b'first part', b'and the second part'
+        self.assertEqual(crc32_combine(zlib.crc32(a), zlib.crc32(b), len(b)), zlib.crc32(a + b))
+        self.assertEqual(crc32_combine(zlib.crc32(a), 0, 0), zlib.crc32(a))
+
+    def test_deflate_chunks_in_pool(self):
+        archive = os.path.join(self.temp.name, 'out.zip')
+        written = []
+        with zipfile.ZipFile(archive, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+            ParallelZipWriter(zf, workers=2, chunk_size=1024 * 1024).write_files(
+                self.entries, on_member=written.append)
+        self.assertEqual(written, list(self.contents))
+        with zipfile.ZipFile(archive) as zf:
+            self.check_members(zf)
+        # The spool folder is gone.
+        self.assertEqual(sorted(os.listdir(self.temp.name)), ['out.zip', 'src'])
+
+    def test_other_methods_inline(self):
+        for compression in (zipfile.ZIP_STORED, zipfile.ZIP_BZIP2, zipfile.ZIP_LZMA):
+            archive = os.path.join(self.temp.name, f'out{compression}.zip')
+            with zipfile.ZipFile(archive, 'w', compression=compression) as zf:
+                ParallelZipWriter(zf, workers=1, chunk_size=1024 * 1024).write_files(self.entries)
+            with zipfile.ZipFile(archive) as zf:
+                self.check_members(zf)
+                self.assertEqual({info.compress_type for info in zf.infolist()}, {compression})
+
+    def test_encrypted(self):
+        archive = os.path.join(self.temp.name, 'out.zip')
+        with pyzipper.AESZipFile(archive, 'w', compression=zipfile.ZIP_DEFLATED,
+                                 encryption=pyzipper.WZ_AES) as zf:
+            zf.setpassword(b'pw')
+            ParallelZipWriter(zf, workers=2, chunk_size=1024 * 1024).write_files(self.entries)
+        with pyzipper.AESZipFile(archive) as zf:
+            with self.assertRaises(RuntimeError):
+                zf.read('d/small')
+            zf.setpassword(b'pw')
+            self.check_members(zf)
+
+    def test_append(self):
+        archive = os.path.join(self.temp.name, 'out.zip')
+        with zipfile.ZipFile(archive, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+            ParallelZipWriter(zf, workers=1).write_files(self.entries[:2])
+        with zipfile.ZipFile(archive, 'a', compression=zipfile.ZIP_DEFLATED) as zf:
+            ParallelZipWriter(zf, workers=1).write_files(self.entries[2:])
+        with zipfile.ZipFile(archive) as zf:
+            self.check_members(zf)
+
+    def extract(self, archive, zipfile_cls=zipfile.ZipFile, password=None):
+        out = os.path.join(self.temp.name, 'out')
+        total = []
+        with zipfile_cls(archive) as zf:
+            if password:
+                zf.setpassword(password)
+            ParallelZipExtractor(zf, workers=2, batch_size=1024 * 1024).extract(
+                zf.infolist(), out, on_bytes=total.append)
+        self.assertEqual(sum(total), sum(len(data) for data in self.contents.values()))
+        for name, data in self.contents.items():
+            with open(os.path.join(out, name), 'rb') as f:
+                self.assertEqual(f.read(), data, name)
+
+    def test_extract_in_pool(self):
+        archive = os.path.join(self.temp.name, 'stored.zip')
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.mkdir('d')
+            for path, name in self.entries:
+                zf.write(path, name)
+        self.extract(archive)
+
+    def test_extract_encrypted(self):
+        archive = os.path.join(self.temp.name, 'stored.zip')
+        with pyzipper.AESZipFile(archive, 'w', encryption=pyzipper.WZ_AES) as zf:
+            zf.setpassword(b'pw')
+            for path, name in self.entries:
+                zf.write(path, name)
+        self.extract(archive, pyzipper.AESZipFile, b'pw')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import io
+import unittest
+
+from cancellation import CancellationToken, OperationCancelled
+from progress_tracker import CountingStream, ProgressTracker
+
+
+class ProgressTrackerUpdates(unittest.TestCase):
+    """Percent and rate callbacks for byte counts, with and without a known total"""
+
+    def setUp(self):
+        self.updates = []
+
+    def on_update(self, percent, rate, eta):
+        self.updates.append((percent, rate, eta))
+
+    def test_percent_follows_bytes(self):
+        tracker = ProgressTracker(1000, self.on_update, interval=0)
+        tracker.advance(250)
+        self.assertEqual(tracker.percent(), 25)
+        tracker.advance(1000)
+        self.assertEqual(tracker.percent(), 100)
+        tracker.finish()
+        self.assertEqual(self.updates[-1][0], 100)
+        self.assertEqual(self.updates[-1][2], 0)
+
+    def test_empty_total_finishes_at_100(self):
+        tracker = ProgressTracker(0, self.on_update)
+        self.assertEqual(tracker.percent(), 0)
+        tracker.finish()
+        self.assertEqual(tracker.percent(), 100)
+        self.assertEqual(self.updates[-1][0], 100)
+
+    def test_updates_after_finish_are_ignored(self):
+        tracker = ProgressTracker(100, self.on_update, interval=0)
+        tracker.finish()
+        count = len(self.updates)
+        tracker.advance(50)
+        self.assertEqual(len(self.updates), count)
+        self.assertEqual(tracker.done, 100)
+
+    def test_updates_are_rate_limited(self):
+        tracker = ProgressTracker(10 ** 6, self.on_update, interval=60)
+        for _ in range(1000):
+            tracker.advance(1000)
+        self.assertEqual(self.updates, [])
+        tracker.finish()
+        self.assertEqual(len(self.updates), 1)
+
+    def test_cancelled_advance_raises(self):
+        token = CancellationToken()
+        tracker = ProgressTracker(100, self.on_update, cancel=token)
+        tracker.advance(10)
+        token.cancel()
+        with self.assertRaises(OperationCancelled):
+            tracker.advance(10)
+
+    def test_counting_stream(self):
+        tracker = ProgressTracker(10, self.on_update, interval=0)
+        stream = CountingStream(io.BytesIO(b'0123456789'), tracker)
+        self.assertEqual(stream.read(4), b'0123')
+        buffer = bytearray(6)
+        self.assertEqual(stream.readinto(buffer), 6)
+        self.assertEqual(tracker.done, 10)
+        self.assertEqual(tracker.percent(), 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
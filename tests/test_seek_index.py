@@ -0,0 +1,107 @@
+import io
+import gzip
+import lzma
+import os
+import random
+import tarfile
+import tempfile
+import unittest
+
+import archive_engine
+from archive_engine import ArchiveJob, list_archive
+from parallel_tar import ParallelCompressedStream
+from seek_index import SeekableTarStream, build_seek_index
+
+BLOCK_SIZE = 1024 * 1024
+
+
+class SeekIndexExtraction(unittest.TestCase):
+    """Selective extraction from multi-block tarballs starts decoding at the block holding each member"""
+
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.cache = archive_engine.LISTING_CACHE.path
+        archive_engine.LISTING_CACHE.path = os.path.join(self.temp.name, 'listings.sqlite')
+        rng = random.Random(16)
+        # f01 runs across the first block boundary and f20 starts later in
+        # the same block, so reaching it reads on from where f01 ended.
+        sizes = [1000 * 1024, 100 * 1024] + [20 * 1024] * 18 + [1500 * 1024]
+        self.contents = {f'f{i:02d}': rng.randbytes(size) for i, size in enumerate(sizes)}
+        self.src = os.path.join(self.temp.name, 'src')
+        os.makedirs(self.src)
+        for name, data in self.contents.items():
+            with open(os.path.join(self.src, name), 'wb') as f:
+                f.write(data)
+
+    def tearDown(self):
+        archive_engine.LISTING_CACHE.path = self.cache
+        self.temp.cleanup()
+
+    def make_archive(self, name, fmt):
+        archive = os.path.join(self.temp.name, name)
+        with open(archive, 'wb') as f:
+            stream = ParallelCompressedStream(f, fmt, 0 if fmt == 'xz' else 1, block_size=BLOCK_SIZE, workers=1)
+            with tarfile.open(fileobj=stream, mode='w') as tf:
+                for member in self.contents:
+                    tf.add(os.path.join(self.src, member), member)
+            stream.close()
+        return archive
+
+    def uncompressed(self, archive):
+        opener = lzma.open if archive.endswith('.xz') else gzip.open
+        with opener(archive) as f:
+            return f.read()
+
+    def check_reads(self, archive, piece):
+        seek_index = build_seek_index(archive)
+        self.assertIsNotNone(seek_index)
+        self.assertGreater(len(seek_index), 2)
+        expected = self.uncompressed(archive)
+        with open(archive, 'rb') as raw:
+            stream = SeekableTarStream(raw, seek_index)
+            data = io.BytesIO()
+            buffer = bytearray(piece)
+            while True:
+                count = stream.readinto(buffer)
+                self.assertEqual(stream.tell(), data.tell() + count)
+                if not count:
+                    break
+                data.write(buffer[:count])
+            self.assertEqual(data.getvalue(), expected)
+            stream.seek(BLOCK_SIZE - 5000)
+            buffer = bytearray(10000)
+            self.assertEqual(stream.readinto(buffer), 10000)
+            self.assertEqual(bytes(buffer), expected[BLOCK_SIZE - 5000:BLOCK_SIZE + 5000])
+            self.assertEqual(stream.tell(), BLOCK_SIZE + 5000)
+
+    def check_extract(self, archive):
+        list_archive(archive)
+        out = os.path.join(self.temp.name, 'out')
+        ArchiveJob('extract', archive, out, files_to_extract=['f01', 'f20']).run()
+        self.assertEqual(sorted(os.listdir(out)), ['f01', 'f20'])
+        for name in ('f01', 'f20'):
+            with open(os.path.join(out, name), 'rb') as f:
+                self.assertEqual(f.read(), self.contents[name], name)
+
+    def test_unaligned_reads_xz(self):
+        self.check_reads(self.make_archive('a.tar.xz', 'xz'), 10000)
+
+    def test_unaligned_reads_gz(self):
+        self.check_reads(self.make_archive('a.tar.gz', 'gz'), 10000)
+
+    def test_selective_extract_xz(self):
+        self.check_extract(self.make_archive('a.tar.xz', 'xz'))
+
+    def test_selective_extract_gz(self):
+        self.check_extract(self.make_archive('a.tar.gz', 'gz'))
+
+    def test_no_match_falls_back(self):
+        archive = self.make_archive('a.tar.gz', 'gz')
+        list_archive(archive)
+        out = os.path.join(self.temp.name, 'out')
+        ArchiveJob('extract', archive, out, files_to_extract=['missing']).run()
+        self.assertFalse(os.path.exists(out) and os.listdir(out))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import os
+import random
+import tempfile
+import unittest
+
+import archive_engine
+from archive_engine import ArchiveJob, list_archive
+from volumes import (archive_size, create_output, open_archive, parse_volume_size, split_set_base, volume_path,
+                     volume_paths)
+
+VOLUME_SIZE = 300 * 1024
+
+
+class SplitVolumes(unittest.TestCase):
+    """Archives written as several volumes list, test and extract from any of them"""
+
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.temp.name, 'src')
+        os.makedirs(os.path.join(self.src, 'd'))
+        rng = random.Random(21)
+        self.contents = {'a.bin': rng.randbytes(700 * 1024), 'd/b.bin': rng.randbytes(200 * 1024), 'd/c.txt': b'c\n'}
+        for name, data in self.contents.items():
+            with open(os.path.join(self.src, name), 'wb') as f:
+                f.write(data)
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def test_parse_volume_size(self):
+        self.assertEqual(parse_volume_size('1048576'), 1048576)
+        self.assertEqual(parse_volume_size('700M'), 700 * 1024 * 1024)
+        self.assertEqual(parse_volume_size(' 1.5 kb '), 1536)
+        self.assertEqual(parse_volume_size('4g'), 4 * 1024 ** 3)
+        for text in ('', '0', '-1', '12q', 'm'):
+            with self.assertRaises(ValueError):
+                parse_volume_size(text)
+
+    def test_stream_across_volumes(self):
+        base = os.path.join(self.temp.name, 'raw.bin')
+        data = self.contents['a.bin']
+        with create_output(base, VOLUME_SIZE) as f:
+            f.write(data[:1000])
+            f.write(data[1000:])
+            # Go back and patch a header, as zipfile does.
+            f.seek(VOLUME_SIZE - 2)
+            f.write(b'XYZW')
+        data = data[:VOLUME_SIZE - 2] + b'XYZW' + data[VOLUME_SIZE + 2:]
+        paths = volume_paths(base)
+        self.assertEqual([os.path.getsize(path) for path in paths],
+                         [VOLUME_SIZE, VOLUME_SIZE, len(data) - 2 * VOLUME_SIZE])
+        self.assertEqual(split_set_base(paths[1]), base)
+        self.assertIsNone(split_set_base(base))
+        self.assertEqual(archive_size(paths[2]), len(data))
+        with open_archive(paths[0]) as f:
+            self.assertEqual(f.read(), data)
+            f.seek(VOLUME_SIZE * 2 - 10)
+            self.assertEqual(f.read(20), data[VOLUME_SIZE * 2 - 10:VOLUME_SIZE * 2 + 10])
+
+    def test_rewriting_fewer_volumes_removes_the_rest(self):
+        base = os.path.join(self.temp.name, 'raw.bin')
+        with create_output(base, 1000) as f:
+            f.write(bytes(5000))
+        with create_output(base, 1000) as f:
+            f.write(bytes(1500))
+        self.assertEqual(volume_paths(base), [volume_path(base, 1), volume_path(base, 2)])
+
+    def round_trip(self, name):
+        archive = os.path.join(self.temp.name, name)
+        ArchiveJob('create', None, archive, files_to_add=[self.src], profile='store', volume_size=VOLUME_SIZE).run()
+        self.assertFalse(os.path.exists(archive))
+        paths = volume_paths(archive)
+        self.assertGreater(len(paths), 2)
+        self.assertTrue(all(os.path.getsize(path) == VOLUME_SIZE for path in paths[:-1]))
+
+        # Split sets are read from any volume and never cached.
+        cache = archive_engine.LISTING_CACHE.path
+        archive_engine.LISTING_CACHE.path = os.path.join(self.temp.name, 'listings.sqlite')
+        try:
+            listing = list_archive(paths[-1])
+        finally:
+            archive_engine.LISTING_CACHE.path = cache
+        self.assertFalse(os.path.exists(os.path.join(self.temp.name, 'listings.sqlite')))
+        files = {name: listing.size[i] for i, name in enumerate(listing.names) if not listing.is_dir(i)}
+        self.assertEqual(files, {'src/' + member: len(data) for member, data in self.contents.items()})
+        self.assertEqual(archive_engine.test_archive(paths[1]), [])
+
+        out = os.path.join(self.temp.name, 'out')
+        ArchiveJob('extract', paths[0], out).run()
+        for member, data in self.contents.items():
+            with open(os.path.join(out, 'src', member), 'rb') as f:
+                self.assertEqual(f.read(), data, member)
+
+        ArchiveJob('extract', paths[1], os.path.join(self.temp.name, 'one'), files_to_extract=['src/d/c.txt']).run()
+        self.assertEqual(os.listdir(os.path.join(self.temp.name, 'one', 'src', 'd')), ['c.txt'])
+
+    def test_zip(self):
+        self.round_trip('a.zip')
+
+    def test_tar_gz(self):
+        self.round_trip('a.tar.gz')
+
+    def test_7z(self):
+        self.round_trip('a.7z')
+
+    def test_split_archive_cannot_be_updated(self):
+        archive = os.path.join(self.temp.name, 'a.zip')
+        ArchiveJob('create', None, archive, files_to_add=[self.src], profile='store', volume_size=VOLUME_SIZE).run()
+        with self.assertRaises(Exception):
+            ArchiveJob('update', None, volume_path(archive, 1), files_to_remove=['src/d/c.txt']).run()
+
+
+if __name__ == '__main__':
+    unittest.main()
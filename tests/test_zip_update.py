@@ -0,0 +1,104 @@
+import os
+import struct
+import tempfile
+import unittest
+import zipfile
+
+import pyzipper
+
+from archive_engine import ArchiveJob
+
+
+class ZipUpdate(unittest.TestCase):
+    """Adding, replacing and removing members keeps the others byte for byte"""
+
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.temp.name, 'src')
+        os.makedirs(os.path.join(self.src, 'd'))
+        self.contents = {'a.txt': b'a\n' * 1000, 'd/b.txt': b'b\n' * 1000, 'd/c.txt': b'c\n' * 1000}
+        self.write_files(self.src, self.contents)
+        self.archive = os.path.join(self.temp.name, 'a.zip')
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def write_files(self, folder, contents):
+        for name, data in contents.items():
+            path = os.path.join(folder, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+
+    def create(self, password=None):
+        ArchiveJob('create', None, self.archive, password=password, files_to_add=[self.src],
+                   archive_root=self.src, profile='normal').run()
+
+    def members(self, password=None):
+        with pyzipper.AESZipFile(self.archive) as zf:
+            if password:
+                zf.setpassword(password.encode('utf-8'))
+            self.assertIsNone(zf.testzip())
+            return {info.filename: zf.read(info) for info in zf.infolist()}
+
+    def raw_member(self, name):
+        """Return the local header and data of a member as stored"""
+        with zipfile.ZipFile(self.archive) as zf:
+            info = zf.getinfo(name)
+            zf.fp.seek(info.header_offset)
+            header = zf.fp.read(30)
+            name_length, extra_length = struct.unpack('<HH', header[26:30])
+            return header + zf.fp.read(name_length + extra_length + info.compress_size)
+
+    def update(self, password=None, **kwargs):
+        ArchiveJob('update', None, self.archive, password=password, profile='normal', **kwargs).run()
+
+    def test_add(self):
+        self.create()
+        stored = self.raw_member('d/b.txt')
+        new = os.path.join(self.temp.name, 'new')
+        self.write_files(new, {'e.txt': b'e\n'})
+        self.update(files_to_add=[os.path.join(new, 'e.txt')])
+        self.assertEqual(self.members(), {**self.contents, 'e.txt': b'e\n'})
+        self.assertEqual(self.raw_member('d/b.txt'), stored)
+
+    def test_replace_and_remove(self):
+        self.create()
+        stored = self.raw_member('a.txt')
+        new = os.path.join(self.temp.name, 'new')
+        self.write_files(new, {'d/b.txt': b'new b\n'})
+        self.update(files_to_add=[os.path.join(new, 'd', 'b.txt')], archive_root=new, files_to_remove=['d/c.txt'])
+        self.assertEqual(self.members(), {'a.txt': self.contents['a.txt'], 'd/b.txt': b'new b\n'})
+        self.assertEqual(self.raw_member('a.txt'), stored)
+        self.assertEqual([name for name in os.listdir(self.temp.name) if name.startswith('.')], [])
+
+    def test_remove_folder(self):
+        self.create()
+        self.update(files_to_remove=['d'])
+        self.assertEqual(self.members(), {'a.txt': self.contents['a.txt']})
+
+    def test_encrypted(self):
+        self.create(password='pw')
+        new = os.path.join(self.temp.name, 'new')
+        self.write_files(new, {'e.txt': b'e\n'})
+        added = [os.path.join(new, 'e.txt')]
+        with self.assertRaisesRegex(Exception, 'Password required'):
+            self.update(files_to_add=added)
+        with self.assertRaisesRegex(Exception, 'Incorrect password'):
+            self.update(password='wrong', files_to_add=added)
+        self.update(password='pw', files_to_add=added, files_to_remove=['a.txt'])
+        members = self.members('pw')
+        self.assertEqual(members, {'d/b.txt': self.contents['d/b.txt'], 'd/c.txt': self.contents['d/c.txt'],
+                                   'e.txt': b'e\n'})
+        with zipfile.ZipFile(self.archive) as zf:
+            self.assertTrue(all(info.flag_bits & 0x1 for info in zf.infolist()))
+
+    def test_other_formats_are_refused(self):
+        archive = os.path.join(self.temp.name, 'a.tar')
+        ArchiveJob('create', None, archive, files_to_add=[self.src]).run()
+        with self.assertRaisesRegex(Exception, 'Unsupported'):
+            ArchiveJob('update', None, archive, files_to_remove=['src/a.txt']).run()
+
+
+if __name__ == '__main__':
+    unittest.main()
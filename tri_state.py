@@ -0,0 +1,109 @@
+from array import array
+
+from PySide6.QtCore import Qt
+
+from archive_index import ROOT
+
+UNCHECKED = Qt.CheckState.Unchecked.value
+PARTIALLY_CHECKED = Qt.CheckState.PartiallyChecked.value
+CHECKED = Qt.CheckState.Checked.value
+
+
+class TriStateSelection:
+    """Check states of the nodes of an ArchiveIndex, with per-folder counts.
+
+    Every folder knows how many of its children are checked and how many
+    are partly checked, so a change only touches the nodes whose state
+    really changes: the part of the subtree below that was not already in
+    the new state, and the folders above until one of them stays the same.
+    A checked folder always has every descendant checked, and an unchecked
+    one none, so both kinds of branch are skipped whole.
+    """
+
+    def __init__(self, archive_index):
+        self.archive_index = archive_index
+        self.state = bytearray()
+        self._checked_children = array('l')
+        self._partial_children = array('l')
+        self.nodes_added(0)
+
+    def __getitem__(self, node):
+        return self.state[node]
+
+    def nodes_added(self, first_new):
+        """Give nodes from first_new on a state; whatever turns up inside a checked folder is checked with it"""
+        parent_of = self.archive_index.parent
+        grow = len(parent_of) - len(self.state)
+        self.state.extend(bytes(grow))
+        self._checked_children.extend(bytes(grow * self._checked_children.itemsize))
+        self._partial_children.extend(bytes(grow * self._partial_children.itemsize))
+        state = self.state
+        for node in range(max(first_new, 1), len(parent_of)):
+            parent = parent_of[node]
+            if state[parent] == CHECKED:
+                state[node] = CHECKED
+                self._checked_children[parent] += 1
+
+    def set_checked(self, node, checked):
+        """Check or uncheck node with everything below it; return the folders whose children changed state"""
+        archive_index = self.archive_index
+        children_of = archive_index.children
+        state = self.state
+        checked_children = self._checked_children
+        partial_children = self._partial_children
+        new_state = CHECKED if checked else UNCHECKED
+        old_state = state[node]
+        if old_state == new_state:
+            return []
+
+        changed_folders = []
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            state[current] = new_state
+            children = children_of.get(current)
+            if children:
+                changed_folders.append(current)
+                checked_children[current] = len(children) if checked else 0
+                partial_children[current] = 0
+                stack.extend(child for child in children if state[child] != new_state)
+
+        parent = archive_index.parent[node]
+        while True:
+            changed_folders.append(parent)
+            if old_state == CHECKED:
+                checked_children[parent] -= 1
+            elif old_state == PARTIALLY_CHECKED:
+                partial_children[parent] -= 1
+            if new_state == CHECKED:
+                checked_children[parent] += 1
+            elif new_state == PARTIALLY_CHECKED:
+                partial_children[parent] += 1
+            if parent == ROOT:
+                break
+            old_state = state[parent]
+            if checked_children[parent] == len(children_of[parent]):
+                new_state = CHECKED
+            elif checked_children[parent] or partial_children[parent]:
+                new_state = PARTIALLY_CHECKED
+            else:
+                new_state = UNCHECKED
+            if new_state == old_state:
+                break
+            state[parent] = new_state
+            parent = archive_index.parent[parent]
+        return changed_folders
+
+    def checked_nodes(self):
+        """Return the topmost checked nodes, without visiting unchecked branches"""
+        children_of = self.archive_index.children
+        state = self.state
+        nodes = []
+        stack = [ROOT]
+        while stack:
+            for child in children_of[stack.pop()]:
+                if state[child] == CHECKED:
+                    nodes.append(child)
+                elif state[child] == PARTIALLY_CHECKED:
+                    stack.append(child)
+        return nodes
@@ -0,0 +1,212 @@
+import io
+import os
+import re
+from bisect import bisect_right
+from itertools import accumulate
+
+# Volumes of a split archive are name.ext.001, name.ext.002, ... as 7-Zip
+# names them; every volume but the last is exactly the volume size.
+VOLUME_DIGITS = 3
+# Reads and writes of a split set are gathered into pieces of this size.
+VOLUME_BUFFER_SIZE = 1024 * 1024
+# Choices offered when creating an archive, in bytes; None writes one file.
+VOLUME_SIZES = {
+    "No splitting": None,
+    "100 MB": 100 * 1000 * 1000,
+    "650 MB (CD)": 650 * 1024 * 1024,
+    "700 MB (CD)": 700 * 1024 * 1024,
+    "4092 MB (FAT32)": 4092 * 1024 * 1024,
+    "4480 MB (DVD)": 4480 * 1024 * 1024,
+}
+_VOLUME_NAME = re.compile(r'^(.+)\.(\d{%d,})$' % VOLUME_DIGITS)
+_SIZE_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+
+def volume_path(base, number):
+    """Return the path of volume number (counting from 1) of the split set base"""
+    return f"{base}.{number:0{VOLUME_DIGITS}d}"
+
+
+def split_set_base(path):
+    """Return name.ext when path is a volume name.ext.NNN of a split set whose first volume exists, else None"""
+    match = _VOLUME_NAME.match(path)
+    if match and os.path.isfile(volume_path(match.group(1), 1)):
+        return match.group(1)
+    return None
+
+
+def archive_name(path):
+    """Return the name whose extension tells the archive format, the same for every volume of a split set"""
+    return split_set_base(path) or path
+
+
+def volume_paths(base):
+    """Return the volumes of the split set base that exist, in order"""
+    paths = []
+    while os.path.isfile(volume_path(base, len(paths) + 1)):
+        paths.append(volume_path(base, len(paths) + 1))
+    return paths
+
+
+def output_path(path, volume_size=None):
+    """Return the file to open after creating the archive path: its first volume when split"""
+    return volume_path(path, 1) if volume_size else path
+
+
+def parse_volume_size(text):
+    """Return the bytes in a size such as '700M', '4g' or '1048576' (k, m and g are binary units)"""
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([kmg]?)b?\s*', text.lower())
+    if not match:
+        raise ValueError(f"invalid volume size: {text}")
+    size = int(float(match.group(1)) * _SIZE_UNITS[match.group(2)])
+    if size <= 0:
+        raise ValueError(f"invalid volume size: {text}")
+    return size
+
+
+def open_archive(path):
+    """Open an archive for reading, joining the volumes of a split set into one stream"""
+    base = split_set_base(path)
+    if base is None:
+        return open(path, 'rb')
+    return io.BufferedReader(VolumeReader(base), VOLUME_BUFFER_SIZE)
+
+
+def create_output(path, volume_size=None):
+    """Open the file to write the archive path to, rolling over to a new volume every volume_size bytes if given"""
+    if not volume_size:
+        return open(path, 'wb')
+    return io.BufferedWriter(VolumeWriter(path, volume_size), VOLUME_BUFFER_SIZE)
+
+
+def archive_size(path):
+    """Return the size of an archive in bytes, adding up all volumes of a split set"""
+    base = split_set_base(path)
+    if base is None:
+        return os.path.getsize(path)
+    return sum(os.path.getsize(volume) for volume in volume_paths(base))
+
+
+def remove_output(path, volume_size=None):
+    """Delete an archive that create_output was writing"""
+    for output in volume_paths(path) if volume_size else [path]:
+        if os.path.exists(output):
+            os.remove(output)
+
+
+class _VolumeSet(io.RawIOBase):
+    """Seekable stream over the volumes of a split set, keeping only the current volume open"""
+
+    def __init__(self, base):
+        super().__init__()
+        self.base = base
+        self.name = volume_path(base, 1)
+        self._position = 0
+        self._number = None
+        self._file = None
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._size()
+        if offset < 0:
+            raise ValueError(f"negative seek position {offset}")
+        self._position = offset
+        return offset
+
+    def _size(self):
+        raise NotImplementedError
+
+    def _volume(self, number, mode):
+        """Return volume number (counting from 0) opened in mode, closing the one open before"""
+        if number != self._number:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._file = open(volume_path(self.base, number + 1), mode)
+            self._number = number
+        return self._file
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        super().close()
+
+
+class VolumeReader(_VolumeSet):
+    """Read the volumes base.001, base.002, ... as one archive"""
+
+    def __init__(self, base):
+        super().__init__(base)
+        paths = volume_paths(base)
+        if not paths:
+            raise FileNotFoundError(f"No such file: {self.name}")
+        self._starts = list(accumulate((os.path.getsize(path) for path in paths), initial=0))
+
+    def readable(self):
+        return True
+
+    def _size(self):
+        return self._starts[-1]
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast('B')
+        filled = 0
+        while filled < len(view) and self._position < self._starts[-1]:
+            number = bisect_right(self._starts, self._position) - 1
+            f = self._volume(number, 'rb')
+            f.seek(self._position - self._starts[number])
+            wanted = min(len(view) - filled, self._starts[number + 1] - self._position)
+            count = f.readinto(view[filled:filled + wanted])
+            if not count:
+                raise EOFError(f"{volume_path(self.base, number + 1)} is shorter than when it was opened")
+            filled += count
+            self._position += count
+        return filled
+
+
+class VolumeWriter(_VolumeSet):
+    """Write an archive as the volumes base.001, base.002, ... of volume_size bytes each.
+
+    Data goes straight to the volume it falls in, so nothing is held in
+    memory beyond the caller's buffer. Seeking back, as zipfile and py7zr do
+    to fill in headers, reopens the earlier volume. Volumes left over from an
+    earlier split set of the same name are deleted first.
+    """
+
+    def __init__(self, base, volume_size):
+        super().__init__(base)
+        if volume_size <= 0:
+            raise ValueError(f"invalid volume size: {volume_size}")
+        self.volume_size = volume_size
+        self._end = 0
+        remove_output(base, volume_size)
+
+    def writable(self):
+        return True
+
+    def _size(self):
+        return self._end
+
+    def write(self, data):
+        view = memoryview(data).cast('B')
+        written = 0
+        while written < len(view):
+            number, offset = divmod(self._position, self.volume_size)
+            # Volumes past the end of what has been written are new files.
+            f = self._volume(number, 'r+b' if number * self.volume_size < self._end else 'wb')
+            f.seek(offset)
+            count = min(len(view) - written, self.volume_size - offset)
+            f.write(view[written:written + count])
+            written += count
+            self._position += count
+            self._end = max(self._end, self._position)
+        return written